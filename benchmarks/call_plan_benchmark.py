@@ -0,0 +1,99 @@
+"""
+Micro-benchmark comparing request translation through the parsed specs
+(what translate_request_body used to do on every request) with a
+precompiled call plan.
+
+    python benchmarks/call_plan_benchmark.py --depth 8 --number 20000
+"""
+import argparse
+import os
+import tempfile
+import timeit
+
+import thriftpy2
+
+from thrift_explorer.call_plan import compile_call_plan
+from thrift_explorer.thrift_parser import parse_service_specs
+
+
+def _nested_thrift(depth):
+    structs = [
+        "struct Level0 {\n    1: required string name;\n    2: optional i64 id;\n}"
+    ]
+    for level in range(1, depth + 1):
+        structs.append(
+            "struct Level{level} {{\n"
+            "    1: required string name;\n"
+            "    2: optional i64 id;\n"
+            "    3: optional Level{child} child;\n"
+            "}}".format(level=level, child=level - 1)
+        )
+    structs.append(
+        "service NestedService {{\n    void send(1: Level{} root);\n}}".format(depth)
+    )
+    return "\n\n".join(structs)
+
+
+def _nested_body(depth):
+    body = {"name": "level 0", "id": 0}
+    for level in range(1, depth + 1):
+        body = {"name": "level {}".format(level), "id": level, "child": body}
+    return {"root": body}
+
+
+def _interpreted_translate(endpoint, request_body, thriftpy2_service_class):
+    # The per request reflection path call plans replaced
+    processed_args = {}
+    for arg_spec in endpoint.args:
+        thrift_arg = getattr(
+            thriftpy2_service_class, "{}_args".format(endpoint.name)
+        ).thrift_spec[arg_spec.field_id]
+        try:
+            ttype_code, name, required = thrift_arg
+            type_info = None
+        except ValueError:
+            ttype_code, name, type_info, required = thrift_arg
+        try:
+            processed_args[arg_spec.name] = arg_spec.type_info.format_arg_for_thrift(
+                request_body[arg_spec.name], type_info
+            )
+        except KeyError:
+            continue
+    return processed_args
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as thrift_dir:
+        thrift_path = os.path.join(thrift_dir, "nested.thrift")
+        with open(thrift_path, "w") as outfile:
+            outfile.write(_nested_thrift(args.depth))
+        thrift_module = thriftpy2.load(thrift_path, module_name="nested_thrift")
+
+    service_class = thrift_module.NestedService
+    endpoint = parse_service_specs({"nested.thrift": thrift_module})["nested.thrift"][
+        "NestedService"
+    ].endpoints["send"]
+    plan = compile_call_plan(service_class, endpoint)
+    body = _nested_body(args.depth)
+    assert _interpreted_translate(endpoint, body, service_class) == (
+        plan.translate_request(body)
+    )
+
+    before = timeit.timeit(
+        lambda: _interpreted_translate(endpoint, body, service_class),
+        number=args.number,
+    )
+    after = timeit.timeit(lambda: plan.translate_request(body), number=args.number)
+    print("struct depth: {}".format(args.depth))
+    print("before: {:.2f} us/request".format(before / args.number * 1e6))
+    print("after:  {:.2f} us/request".format(after / args.number * 1e6))
+    print("speedup: {:.2f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Per-worker memory of gunicorn with and without gunicorn_preload.
+
+    python benchmarks/preload_memory.py --thrift-directory example-thrifts --workers 4
+
+Starts gunicorn twice, once plain and once with the preload config, waits
+for every worker to answer, makes some requests so the workers settle,
+then reads each worker's memory from /proc. USS (unique set size) is what
+the worker holds on its own and what killing it would free, the number
+preloading brings down. PSS splits each shared page evenly between the
+processes sharing it. Needs linux and gunicorn
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _children(pid):
+    with open("/proc/{0}/task/{0}/children".format(pid)) as children:
+        return [int(child) for child in children.read().split()]
+
+
+def _memory_kb(pid):
+    """
+    (uss, pss) of pid in KB
+    """
+    fields = {}
+    with open("/proc/{}/smaps_rollup".format(pid)) as rollup:
+        for line in rollup:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    return fields["Private_Clean"] + fields["Private_Dirty"], fields["Pss"]
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read()
+
+
+def _wait_for_workers(master, url, workers, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError("gunicorn exited with {}".format(master.returncode))
+        try:
+            _get(url)
+        except OSError:
+            time.sleep(0.2)
+            continue
+        if len(_children(master.pid)) == workers:
+            return
+        time.sleep(0.2)
+    raise RuntimeError("Workers did not come up in {}s".format(timeout))
+
+
+def _exercise(url, requests):
+    # Every path in the catalog, so each worker has looked at every thrift
+    catalog = json.loads(_get(url))["thrifts"]
+    paths = ["/"] + [
+        "/{}/{}/".format(service["thrift"], service["service"]) for service in catalog
+    ]
+    for request in range(requests):
+        _get(url + paths[request % len(paths)].lstrip("/"))
+
+
+def measure(thrift_directory, workers, preload, requests, timeout):
+    port = _free_port()
+    command = [sys.executable, "-m", "gunicorn", "-w", str(workers)]
+    if preload:
+        command += ["-c", "python:thrift_explorer.gunicorn_preload"]
+    command += ["-b", "127.0.0.1:{}".format(port), "thrift_explorer.wsgi"]
+    environment = dict(os.environ, THRIFT_DIRECTORY=thrift_directory)
+    started = time.monotonic()
+    master = subprocess.Popen(
+        command,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = "http://127.0.0.1:{}/".format(port)
+    try:
+        _wait_for_workers(master, url, workers, timeout)
+        boot = time.monotonic() - started
+        _exercise(url, requests)
+        return boot, [_memory_kb(worker) for worker in _children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--thrift-directory", default="example-thrifts")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    thrift_directory = os.path.abspath(args.thrift_directory)
+    for preload in (False, True):
+        boot, memory = measure(
+            thrift_directory, args.workers, preload, args.requests, args.timeout
+        )
+        uss = [worker_uss for worker_uss, _ in memory]
+        pss = [worker_pss for _, worker_pss in memory]
+        print("preload" if preload else "no preload")
+        print("  boot:        {:.2f}s".format(boot))
+        print("  USS/worker:  {}".format(", ".join(str(kb) for kb in uss)))
+        print("  mean USS:    {:.0f} KB".format(sum(uss) / len(uss)))
+        print("  total PSS:   {} KB".format(sum(pss)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""
+Benchmarks of the explorer's hot paths, checked against a saved baseline.
+
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --baseline baseline.json --output latest.json
+
+Covers loading the thrifts at startup, validating and translating a
+request, translating a response, and whole calls to the todo server in
+tests/todoserver made both straight through ThriftManager and through the
+flask app. The todo server is started on a free port for the run.
+
+Each benchmark runs in rounds long enough to time reliably (see
+timeit.Timer.autorange) and the median time per operation across rounds
+is what gets compared. With --baseline anything more than --threshold
+slower than the baseline is flagged and the exit status is 1. Results are
+only comparable on the same machine, python and thrifts, a warning is
+printed when the baseline was saved somewhere else. Run it on a quiet
+machine
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from collections import OrderedDict
+from multiprocessing import Process
+
+import thriftpy2
+from thriftpy2.rpc import make_client
+
+from thrift_explorer import thrift_parser
+from thrift_explorer.call_plan import compile_call_plan
+from thrift_explorer.communication_models import ThriftRequest
+from thrift_explorer.server import THRIFT_DIRECTORY_ENV, create_app, load_config
+from thrift_explorer.thrift_loader import load_thrifts
+from thrift_explorer.thrift_manager import ThriftManager
+from thrift_explorer.thrift_parser import parse_service_specs
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "tests"))
+
+from todoserver import service  # noqa: E402 needs tests on the path
+
+# What the baseline has to agree on for a comparison to mean anything
+ENVIRONMENT_KEYS = ("python", "implementation", "machine", "cpus", "thriftpy2")
+
+# name: function taking a _Context and returning the operation to time
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    def _register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return _register
+
+
+class _Context(object):
+    def __init__(self, thrift_directory, port):
+        self.thrift_directory = thrift_directory
+        self.port = port
+        self.manager = ThriftManager(thrift_directory)
+        self.thrifts = load_thrifts(thrift_directory).thrifts
+
+    def request(self, thrift, service_name, method, body):
+        return ThriftRequest(
+            thrift_file=thrift,
+            service_name=service_name,
+            endpoint_name=method,
+            host="127.0.0.1",
+            port=self.port,
+            protocol="TBinaryProtocol",
+            transport="TBufferedTransport",
+            request_body=body,
+        )
+
+
+def _case():
+    # The most nested argument in the example thrifts
+    return {
+        "caseToSave": {
+            "caseName": "The long halloween",
+            "CrimeType": 0,
+            "mainSuspect": {
+                "villainId": 1,
+                "name": "Holiday",
+                "description": "Kills on holidays",
+                "hideoutLocation": {"latitude": 40.7, "longitude": -74.0},
+            },
+            "notes": ["note {}".format(note) for note in range(10)],
+        }
+    }
+
+
+@benchmark("load_thrifts")
+def _load_thrifts(context):
+    return lambda: load_thrifts(context.thrift_directory)
+
+
+@benchmark("parse_service_specs")
+def _parse_service_specs(context):
+    def parse():
+        # Otherwise every round after the first just finds the specs parsed
+        # already, clearing it is cheap next to the parsing
+        thrift_parser._PARSED_CLASSES.clear()
+        return parse_service_specs(context.thrifts)
+
+    return parse
+
+
+@benchmark("thrift_manager_startup")
+def _thrift_manager_startup(context):
+    return lambda: ThriftManager(context.thrift_directory)
+
+
+@benchmark("validate_request")
+def _validate_request(context):
+    request = context.request("Batman.thrift", "BatPuter", "saveCase", _case())
+    assert context.manager.validate_request(request) == []
+    return lambda: context.manager.validate_request(request)
+
+
+@benchmark("translate_request_body")
+def _translate_request_body(context):
+    service_class = context.thrifts["Batman.thrift"].BatPuter
+    endpoint = context.manager.get_method("Batman.thrift", "BatPuter", "saveCase")
+    plan = compile_call_plan(service_class, endpoint)
+    body = _case()
+    return lambda: plan.translate_request(body)
+
+
+@benchmark("translate_response")
+def _translate_response(context):
+    batman = context.thrifts["Batman.thrift"]
+    endpoint = context.manager.get_method("Batman.thrift", "BatPuter", "getVillain")
+    translate_success = compile_call_plan(batman.BatPuter, endpoint).translate_success
+    villains = [
+        batman.Villain(
+            villainId=villain,
+            name="Villain {}".format(villain),
+            description="Up to no good",
+            hideoutLocation=batman.Core.Location(latitude=40.7, longitude=-74.0),
+        )
+        for villain in range(100)
+    ]
+    return lambda: [translate_success(villain) for villain in villains]
+
+
+@benchmark("call")
+def _call(context):
+    request = context.request("todo.thrift", "TodoService", "getTask", {"taskId": "1"})
+    assert context.manager.make_request(request).status == "Success"
+    return lambda: context.manager.make_request(request)
+
+
+@benchmark("http_call")
+def _http_call(context):
+    config = load_config({THRIFT_DIRECTORY_ENV: context.thrift_directory})
+    client = create_app(config).test_client()
+    body = json.dumps({"host": "127.0.0.1", "port": context.port, "request_body": {}})
+    path = "/todo/TodoService/listTasks/"
+    assert client.post(path, data=body).status_code == 200
+    return lambda: client.post(path, data=body)
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _serve_todo(port, directory):
+    # The todo server keeps its tasks in the working directory
+    os.chdir(directory)
+    service.run_server(port)
+
+
+def _start_todo_server(directory, timeout=10):
+    port = _free_port()
+    server = Process(target=_serve_todo, args=(port, directory), daemon=True)
+    server.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                server.terminate()
+                raise RuntimeError("The todo server did not start")
+            time.sleep(0.05)
+    client = make_client(service.todo_thrift.TodoService, "127.0.0.1", port)
+    for task in range(10):
+        client.createTask("task {}".format(task), "12-12-2012")
+    client.close()
+    return server, port
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPOSITORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "thriftpy2": thriftpy2.__version__,
+        "commit": commit,
+    }
+
+
+def measure(operation, rounds):
+    """
+    Times operation and returns a dict of microseconds per call (the
+    median and fastest round) and how it was timed
+    """
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    per_call = [
+        seconds / number * 1e6 for seconds in timer.repeat(repeat=rounds, number=number)
+    ]
+    return {
+        "median_us": statistics.median(per_call),
+        "min_us": min(per_call),
+        "number": number,
+        "rounds": rounds,
+    }
+
+
+def run(thrift_directory, rounds, only=None, progress=None):
+    """
+    Runs the benchmarks whose name contains only (all of them by default)
+    and returns the results as saved to JSON
+    """
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory() as todo_directory:
+        server, port = _start_todo_server(todo_directory)
+        try:
+            context = _Context(thrift_directory, port)
+            for name, setup in BENCHMARKS.items():
+                if only and only not in name:
+                    continue
+                results[name] = measure(setup(context), rounds)
+                if progress:
+                    progress(name, results[name])
+        finally:
+            server.terminate()
+            server.join()
+    return {
+        "environment": _environment(),
+        "thrift_directory": thrift_directory,
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns (lines describing each benchmark against the baseline, names
+    of the ones more than threshold slower)
+    """
+    lines = []
+    regressions = []
+    for key in ENVIRONMENT_KEYS:
+        if results["environment"].get(key) != baseline["environment"].get(key):
+            lines.append(
+                "warning: baseline {} was {}, now {}".format(
+                    key,
+                    baseline["environment"].get(key),
+                    results["environment"].get(key),
+                )
+            )
+    if results["thrift_directory"] != baseline["thrift_directory"]:
+        lines.append("warning: baseline used other thrifts")
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            lines.append(
+                "{:<28}{:>12.2f} us  (not in baseline)".format(
+                    name, result["median_us"]
+                )
+            )
+            continue
+        change = result["median_us"] / before["median_us"] - 1
+        if change > threshold:
+            regressions.append(name)
+            verdict = "REGRESSION"
+        elif change < -threshold:
+            verdict = "faster"
+        else:
+            verdict = ""
+        lines.append(
+            "{:<28}{:>12.2f} us {:>12.2f} us {:>+8.1%}  {}".format(
+                name, before["median_us"], result["median_us"], change, verdict
+            ).rstrip()
+        )
+    return lines, regressions
+
+
+def _print_result(name, result):
+    print(
+        "{:<28}{:>12.2f} us  (min {:.2f} us, {} x {} calls)".format(
+            name,
+            result["median_us"],
+            result["min_us"],
+            result["rounds"],
+            result["number"],
+        ),
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--thrift-directory", default=os.path.join(REPOSITORY, "example-thrifts")
+    )
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument(
+        "--only", help="only run benchmarks with this in their name", default=None
+    )
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--baseline", help="results saved by an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="how much slower than the baseline counts as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+    results = run(
+        os.path.abspath(args.thrift_directory),
+        args.rounds,
+        only=args.only,
+        progress=_print_result,
+    )
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+    if baseline is None:
+        return 0
+    lines, regressions = compare(results, baseline, args.threshold)
+    print("{:<28}{:>15} {:>15} {:>8}".format("", "baseline", "now", "change"))
+    for line in lines:
+        print(line)
+    if regressions:
+        print("Regressed: {}".format(", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+Synthetic thrift trees for trying thrift explorer at scale.
+
+    python benchmarks/synthetic_idl.py generate /tmp/big --thrifts 100 \
+        --services 10 --methods 10 --width 200 --depth 20 --enum-size 2000 \
+        --include-depth 10
+    python benchmarks/synthetic_idl.py measure /tmp/big
+    python benchmarks/synthetic_idl.py serve /tmp/big --port 9090
+
+The example thrifts are tiny. generate writes a tree of any size into a
+directory:
+    includes/colors.thrift: an enum of enum_size values
+    includes/level_<n>.thrift: include_depth files, each including the one
+        before it and nesting its struct
+    service_<n>.thrift: thrifts files of services services with methods
+        methods each. Every method takes a struct of width fields (every
+        kind of type, the enum included) and one nested depth structs deep
+        that bottoms out in the include chain, and returns the wide one
+    scenario.json: a scenario (see thrift_explorer.scenario) with a call
+        to the first method of each service, with request bodies that
+        validate, for thrift-explorer run-scenario against serve
+
+serve answers every method of every service on one port, echoing the wide
+argument back. measure loads the tree with ThriftManager, reports how long
+that took and the memory it holds on to, then makes the scenario's calls
+against serve (started on a free port) and reports the median time of
+each phase of a call (see CallTimings). Memory is read from /proc so
+measure needs linux
+"""
+import argparse
+import gc
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+from multiprocessing import Process
+
+import attr
+from thriftpy2.rpc import make_server
+
+from thrift_explorer.communication_models import CallTimings, ThriftRequest
+from thrift_explorer.thrift_loader import load_thrifts
+from thrift_explorer.thrift_manager import ThriftManager
+
+# Field types of the wide struct in turn, with a value of each. No sets,
+# a JSON request has no way to send one
+_FIELD_TYPES = (
+    ("i32", 7),
+    ("i64", 2**40),
+    ("string", "value"),
+    ("double", 1.5),
+    ("bool", True),
+    ("list<string>", ["first", "second"]),
+    ("map<string, i64>", {"key": 1}),
+    ("colors.Color", 0),
+)
+
+
+@attr.s(frozen=True)
+class Shape(object):
+    """
+    How big a tree generate writes
+        thrifts: int thrift files with services
+        services: int services in each of them
+        methods: int methods in each service
+        width: int fields in the wide struct
+        depth: int structs nested in the nested argument
+        enum_size: int values in the enum
+        include_depth: int files in the include chain
+    """
+
+    thrifts = attr.ib(default=10)
+    services = attr.ib(default=5)
+    methods = attr.ib(default=10)
+    width = attr.ib(default=50)
+    depth = attr.ib(default=5)
+    enum_size = attr.ib(default=100)
+    include_depth = attr.ib(default=5)
+
+
+def method_name(thrift, service, method):
+    # Unique across the tree so serve can answer everything on one port
+    return "method_{}_{}_{}".format(thrift, service, method)
+
+
+def _colors_thrift(shape):
+    values = ",\n".join(
+        "    VALUE_{}".format(value) for value in range(shape.enum_size)
+    )
+    return "enum Color {{\n{}\n}}\n".format(values)
+
+
+def _level_thrift(level):
+    if level == 0:
+        return (
+            "struct Leaf0 {\n"
+            "    1: required string name;\n"
+            "    2: optional i64 id;\n"
+            "}\n"
+        )
+    return (
+        'include "level_{below}.thrift"\n\n'
+        "struct Leaf{level} {{\n"
+        "    1: required string name;\n"
+        "    2: optional level_{below}.Leaf{below} inner;\n"
+        "}}\n"
+    ).format(level=level, below=level - 1)
+
+
+def _service_thrift(shape, thrift):
+    lines = ['include "includes/colors.thrift"']
+    if shape.include_depth:
+        lines.append(
+            'include "includes/level_{}.thrift"'.format(shape.include_depth - 1)
+        )
+    lines.append("")
+    lines.append("struct Wide {")
+    for field in range(shape.width):
+        lines.append(
+            "    {}: optional {} field_{};".format(
+                field + 1, _FIELD_TYPES[field % len(_FIELD_TYPES)][0], field + 1
+            )
+        )
+    lines.append("}")
+    for level in range(shape.depth + 1):
+        lines.append("")
+        lines.append("struct Nest{} {{".format(level))
+        lines.append("    1: required string name;")
+        if level:
+            lines.append("    2: optional Nest{} child;".format(level - 1))
+        elif shape.include_depth:
+            lines.append(
+                "    2: optional level_{0}.Leaf{0} leaf;".format(
+                    shape.include_depth - 1
+                )
+            )
+        lines.append("}")
+    for service in range(shape.services):
+        lines.append("")
+        lines.append("service Service{} {{".format(service))
+        for method in range(shape.methods):
+            lines.append(
+                "    Wide {}(1: Wide wide, 2: Nest{} nest);".format(
+                    method_name(thrift, service, method), shape.depth
+                )
+            )
+        lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _wide_body(shape):
+    return {
+        "field_{}".format(field + 1): _FIELD_TYPES[field % len(_FIELD_TYPES)][1]
+        for field in range(shape.width)
+    }
+
+
+def _nest_body(shape):
+    body = {"name": "nest 0"}
+    if shape.include_depth:
+        leaf = {"name": "leaf 0", "id": 0}
+        for level in range(1, shape.include_depth):
+            leaf = {"name": "leaf {}".format(level), "inner": leaf}
+        body["leaf"] = leaf
+    for level in range(1, shape.depth + 1):
+        body = {"name": "nest {}".format(level), "child": body}
+    return body
+
+
+def request_body(shape):
+    """
+    A body that validates against any method in a tree of shape
+    """
+    return {"wide": _wide_body(shape), "nest": _nest_body(shape)}
+
+
+def scenario(shape, host="127.0.0.1", port=9090):
+    """
+    A scenario calling the first method of every service in a tree of shape
+    """
+    body = request_body(shape)
+    return {
+        "concurrency": 8,
+        "variables": {"host": host, "port": port},
+        "defaults": {"host": "${host}", "port": "${port}"},
+        "stages": [{"duration": 10, "target_rps": 100}],
+        "calls": [
+            {
+                "thrift": "service_{}".format(thrift),
+                "service": "Service{}".format(service),
+                "method": method_name(thrift, service, 0),
+                "weight": 1,
+                "request_body": body,
+            }
+            for thrift in range(shape.thrifts)
+            for service in range(shape.services)
+            if shape.methods
+        ],
+    }
+
+
+def generate(directory, shape, port=9090):
+    """
+    Writes a tree of shape to directory, see above
+    """
+    includes = os.path.join(directory, "includes")
+    os.makedirs(includes, exist_ok=True)
+    with open(os.path.join(includes, "colors.thrift"), "w") as outfile:
+        outfile.write(_colors_thrift(shape))
+    for level in range(shape.include_depth):
+        path = os.path.join(includes, "level_{}.thrift".format(level))
+        with open(path, "w") as outfile:
+            outfile.write(_level_thrift(level))
+    for thrift in range(shape.thrifts):
+        path = os.path.join(directory, "service_{}.thrift".format(thrift))
+        with open(path, "w") as outfile:
+            outfile.write(_service_thrift(shape, thrift))
+    with open(os.path.join(directory, "shape.json"), "w") as outfile:
+        json.dump(attr.asdict(shape), outfile, indent=2)
+    with open(os.path.join(directory, "scenario.json"), "w") as outfile:
+        json.dump(scenario(shape, port=port), outfile, indent=2)
+
+
+def read_shape(directory):
+    with open(os.path.join(directory, "shape.json")) as infile:
+        return Shape(**json.load(infile))
+
+
+class _AllServices(object):
+    """
+    Stands in for a thriftpy2 service with the methods of every service
+    in thrifts, which is all thriftpy2's TProcessor looks at
+    """
+
+    def __init__(self, thrifts):
+        self.thrift_services = []
+        for module in thrifts.values():
+            for service in module.__thrift_meta__["services"]:
+                for method in service.thrift_services:
+                    self.thrift_services.append(method)
+                    for suffix in ("_args", "_result"):
+                        setattr(
+                            self, method + suffix, getattr(service, method + suffix)
+                        )
+
+
+class _Echo(object):
+    def __getattr__(self, method):
+        return lambda wide, nest: wide
+
+
+def serve(directory, port):
+    thrifts = load_thrifts(directory).thrifts
+    make_server(_AllServices(thrifts), _Echo(), "127.0.0.1", port).serve()
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _start_server(directory, timeout):
+    port = _free_port()
+    server = Process(target=serve, args=(directory, port), daemon=True)
+    server.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, port
+        except OSError:
+            if time.monotonic() > deadline or not server.is_alive():
+                server.terminate()
+                raise RuntimeError("The stub server did not start")
+            time.sleep(0.1)
+
+
+def _resident_kb():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def measure_startup(directory, lazy=False):
+    """
+    Returns (ThriftManager, seconds it took to load directory, KB of
+    memory it holds on to)
+    """
+    gc.collect()
+    before = _resident_kb()
+    started = time.perf_counter()
+    manager = ThriftManager(directory, lazy=lazy)
+    seconds = time.perf_counter() - started
+    gc.collect()
+    return manager, seconds, _resident_kb() - before
+
+
+def measure_calls(manager, calls, port, number):
+    """
+    Makes each of calls (scenario calls) number times against serve on
+    port. Returns the median nanoseconds of each CallTimings phase, None
+    for ones never timed
+    """
+    phases = {field.name: [] for field in attr.fields(CallTimings)}
+    for call in calls:
+        thrift_request = ThriftRequest(
+            thrift_file=call["thrift"] + ".thrift",
+            service_name=call["service"],
+            endpoint_name=call["method"],
+            host="127.0.0.1",
+            port=port,
+            protocol="TBinaryProtocol",
+            transport="TBufferedTransport",
+            request_body=call["request_body"],
+        )
+        for _ in range(number):
+            started = time.perf_counter_ns()
+            errors = manager.validate_request(thrift_request)
+            validation_ns = time.perf_counter_ns() - started
+            if errors:
+                raise RuntimeError("Invalid request: {}".format(errors))
+            thrift_response = manager.make_request(thrift_request)
+            if thrift_response.status != "Success":
+                raise RuntimeError("Call failed: {}".format(thrift_response.data))
+            timings = attr.evolve(thrift_response.timings, validation_ns=validation_ns)
+            for name, nanoseconds in attr.asdict(timings).items():
+                if nanoseconds is not None:
+                    phases[name].append(nanoseconds)
+    return {
+        name: statistics.median(values) if values else None
+        for name, values in phases.items()
+    }
+
+
+def _generate(args):
+    shape = Shape(
+        thrifts=args.thrifts,
+        services=args.services,
+        methods=args.methods,
+        width=args.width,
+        depth=args.depth,
+        enum_size=args.enum_size,
+        include_depth=args.include_depth,
+    )
+    generate(args.directory, shape, port=args.port)
+    print(
+        "Wrote {} services with {} methods to {}".format(
+            shape.thrifts * shape.services,
+            shape.thrifts * shape.services * shape.methods,
+            args.directory,
+        )
+    )
+
+
+def _serve(args):
+    print("Serving {} on {}".format(args.directory, args.port))
+    serve(args.directory, args.port)
+
+
+def _measure(args):
+    print(json.dumps(attr.asdict(read_shape(args.directory))))
+    with open(os.path.join(args.directory, "scenario.json")) as infile:
+        calls = json.load(infile)["calls"][: args.calls]
+    # Started first so it loads on its own and is forked before this
+    # process has loaded anything
+    server = port = None
+    if calls:
+        server, port = _start_server(args.directory, args.timeout)
+    try:
+        manager, seconds, memory = measure_startup(args.directory, lazy=args.lazy)
+        print("startup:    {:.3f}s".format(seconds))
+        print("memory:     {} KB".format(memory))
+        if not calls:
+            return
+        medians = measure_calls(manager, calls, port, args.number)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    print("per call (median of {} calls):".format(len(calls) * args.number))
+    for name, nanoseconds in medians.items():
+        if nanoseconds is not None:
+            print("  {:<26}{:>10.1f} us".format(name, nanoseconds / 1000))
+    overhead = sum(
+        nanoseconds
+        for name, nanoseconds in medians.items()
+        if nanoseconds is not None and name != "server_wait_ns"
+    )
+    print("  {:<26}{:>10.1f} us".format("explorer overhead", overhead / 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="write a tree")
+    generate_parser.add_argument("directory")
+    defaults = Shape()
+    for field in attr.fields(Shape):
+        generate_parser.add_argument(
+            "--" + field.name.replace("_", "-"),
+            type=int,
+            default=getattr(defaults, field.name),
+        )
+    generate_parser.add_argument(
+        "--port", type=int, default=9090, help="port the scenario calls"
+    )
+    generate_parser.set_defaults(function=_generate)
+
+    serve_parser = subparsers.add_parser("serve", help="run the stub server")
+    serve_parser.add_argument("directory")
+    serve_parser.add_argument("--port", type=int, default=9090)
+    serve_parser.set_defaults(function=_serve)
+
+    measure_parser = subparsers.add_parser(
+        "measure", help="time loading a tree and calling it"
+    )
+    measure_parser.add_argument("directory")
+    measure_parser.add_argument("--lazy", action="store_true")
+    measure_parser.add_argument(
+        "--calls", type=int, default=20, help="how many scenario calls to make"
+    )
+    measure_parser.add_argument(
+        "--number", type=int, default=50, help="times to make each call"
+    )
+    measure_parser.add_argument(
+        "--timeout", type=float, default=600, help="seconds to wait for the server"
+    )
+    measure_parser.set_defaults(function=_measure)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
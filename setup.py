@@ -21,7 +21,7 @@ VERSION = 0.8
 REQUIRED = ["thriftpy", "attrs", "flask"]
 
 # What packages are optional?
-EXTRAS = {}
+EXTRAS = {"asgi": ["uvicorn"], "yaml": ["PyYAML"]}
 
 # The rest you shouldn't have to touch too much :)
 # ------------------------------------------------
@@ -96,9 +96,7 @@ setup(
     python_requires=REQUIRES_PYTHON,
     url=URL,
     packages=find_packages(exclude=("tests",)),
-    # entry_points={
-    #     'console_scripts': ['mycli=mymodule:cli'],
-    # },
+    entry_points={"console_scripts": ["thrift-explorer=thrift_explorer.cli:main"]},
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -0,0 +1,36 @@
+enum Color {
+    RED,
+    GREEN,
+    BLUE
+}
+
+struct Leaf {
+    1: required string name;
+    2: optional Color color;
+    3: optional list<i64> values;
+}
+
+struct Branch {
+    1: required list<Leaf> leaves;
+    2: optional map<string, Leaf> leavesByName;
+}
+
+struct Trunk {
+    1: required list<Branch> branches;
+    2: optional set<Color> colors;
+}
+
+struct Tree {
+    1: required Trunk trunk;
+    2: optional string species;
+}
+
+exception TreeNotFound {
+    1: optional string species;
+}
+
+service ForestService {
+    Tree plantTree(1: Tree tree, 2: list<Leaf> extraLeaves) throws (1: TreeNotFound notFound);
+    list<Tree> listTrees(1: i32 limit);
+    map<string, list<Leaf>> leavesBySpecies();
+}
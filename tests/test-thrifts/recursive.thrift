@@ -0,0 +1,19 @@
+struct Node {
+    1: required string value;
+    2: optional Node following;
+    3: optional list<Node> children;
+}
+
+struct Ping {
+    1: optional Pong pong;
+}
+
+struct Pong {
+    1: optional Ping ping;
+    2: optional i32 hits;
+}
+
+service TreeService {
+    Node echoTree(1: Node root);
+    Ping rally(1: Ping ping);
+}
@@ -0,0 +1,206 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from thrift_explorer.asgi_server import create_asgi_app
+from thrift_explorer.server import THRIFT_DIRECTORY_ENV
+from todoserver import service
+
+
+@pytest.fixture
+def asgi_app(example_thrift_directory, monkeypatch):
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, example_thrift_directory)
+    return create_asgi_app()
+
+
+@pytest.fixture(autouse=True)
+def clear_todo_db():
+    service.clear_db()
+
+
+def call(app, method, path, body=b"", headers=()):
+    """
+    Makes one request to app, returns (status, headers, body)
+    """
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string.encode("latin-1"),
+        "headers": list(headers),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, *response_bodies = sent
+    return (
+        start["status"],
+        dict(start["headers"]),
+        b"".join(response_body["body"] for response_body in response_bodies),
+    )
+
+
+def test_list_services(asgi_app):
+    status, headers, body = call(asgi_app, "GET", "/")
+    assert 200 == status
+    assert b"application/json; charset=utf-8" == headers[b"content-type"]
+    assert [
+        ("Batman.thrift", "BatPuter"),
+        ("todo.thrift", "TodoService"),
+    ] == [
+        (service["thrift"], service["service"])
+        for service in json.loads(body)["thrifts"]
+    ]
+
+
+def test_get_thrift_definition(asgi_app, batman_thrift_text):
+    status, _, body = call(asgi_app, "GET", "/Batman/")
+    assert 200 == status
+    assert batman_thrift_text.encode("utf-8") == body
+
+
+def test_get_thrift_definition_bundle(asgi_app):
+    status, headers, body = call(
+        asgi_app, "GET", "/todo/?bundle=1", headers=[(b"accept-encoding", b"gzip")]
+    )
+    assert 200 == status
+    assert b"gzip" == headers[b"content-encoding"]
+    assert ["todo.thrift", "basethrifts/Exceptions.thrift"] == list(
+        json.loads(gzip.decompress(body))["files"]
+    )
+
+
+def test_not_found(asgi_app):
+    assert (404, b"Service 'NotAService' not found") == (
+        call(asgi_app, "GET", "/Batman/NotAService/")[::2]
+    )
+    assert 404 == call(asgi_app, "GET", "/a/b/c/d/")[0]
+    assert 405 == call(asgi_app, "DELETE", "/Batman/")[0]
+
+
+def test_list_services_not_modified(asgi_app):
+    _, headers, _ = call(asgi_app, "GET", "/")
+    status, _, body = call(
+        asgi_app, "GET", "/", headers=[(b"if-none-match", headers[b"etag"])]
+    )
+    assert 304 == status
+    assert b"" == body
+
+
+def test_service_method_get(asgi_app):
+    status, _, body = call(asgi_app, "GET", "/Batman/BatPuter/getVillain/")
+    assert 200 == status
+    assert "getVillain" == json.loads(body)["endpoint_name"]
+
+
+def test_service_method_post(todo_server, todo_client, asgi_app):
+    todo_client.createTask("task 1", "12-12-2012")
+    status, _, body = call(
+        asgi_app,
+        "POST",
+        "/todo/TodoService/numTasks/",
+        json.dumps({"host": "127.0.0.1", "port": 6000}).encode("utf-8"),
+    )
+    assert 200 == status
+    response = json.loads(body)
+    assert ("Success", 1) == (response["status"], response["data"])
+
+
+def test_service_method_post_not_json(asgi_app):
+    status, _, body = call(asgi_app, "POST", "/todo/TodoService/numTasks/", b"{")
+    assert 400 == status
+    assert ["INVALID_REQUEST"] == [
+        error["code"] for error in json.loads(body)["errors"]
+    ]
+
+
+def test_batch_requests(todo_server, asgi_app):
+    item = {"thrift": "todo", "service": "TodoService", "port": 6000}
+    status, _, body = call(
+        asgi_app,
+        "POST",
+        "/_batch/",
+        json.dumps(
+            [dict(item, method="ping", host="127.0.0.1"), dict(item, method="ping")]
+        ).encode("utf-8"),
+    )
+    assert 200 == status
+    first, second = json.loads(body)["results"]
+    assert "Success" == first["status"]
+    assert ["INVALID_REQUEST"] == [error["code"] for error in second["errors"]]
+
+
+def test_stream_batch_requests(todo_server, asgi_app):
+    item = {"thrift": "todo", "service": "TodoService", "port": 6000}
+    status, headers, body = call(
+        asgi_app,
+        "POST",
+        "/_batch/",
+        json.dumps(
+            [dict(item, method="ping", host="127.0.0.1"), dict(item, method="ping")]
+        ).encode("utf-8"),
+        headers=[(b"accept", b"application/x-ndjson")],
+    )
+    assert 200 == status
+    assert b"content-length" not in headers
+    invalid, success, summary = [json.loads(line) for line in body.splitlines()]
+    assert 1 == invalid["position"]
+    assert (0, "Success") == (success["position"], success["result"]["status"])
+    assert 2 == summary["summary"]["results"]
+
+
+def test_admin_reload(asgi_app):
+    status, _, body = call(asgi_app, "POST", "/_admin/reload/")
+    assert 200 == status
+    assert [] == json.loads(body)["reloaded"]
+
+
+def test_lifespan(asgi_app):
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi_app({"type": "lifespan"}, receive, send))
+    assert ["lifespan.startup.complete", "lifespan.shutdown.complete"] == sent
+
+
+def test_load_test_method(todo_server, asgi_app):
+    status, _, body = call(
+        asgi_app,
+        "POST",
+        "/todo/TodoService/ping/_load_test/",
+        json.dumps({"host": "127.0.0.1", "port": 6000, "total_requests": 5}).encode(
+            "utf-8"
+        ),
+    )
+    assert 200 == status
+    assert {"Success": 5} == json.loads(body)["statuses"]
+
+
+def test_stream_load_test(todo_server, asgi_app):
+    status, _, body = call(
+        asgi_app,
+        "POST",
+        "/todo/TodoService/ping/_load_test/",
+        json.dumps({"host": "127.0.0.1", "port": 6000, "total_requests": 5}).encode(
+            "utf-8"
+        ),
+        headers=[(b"accept", b"application/x-ndjson")],
+    )
+    assert 200 == status
+    summary = json.loads(body.splitlines()[-1])["summary"]
+    assert {"Success": 5} == summary["statuses"]
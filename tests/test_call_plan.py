@@ -0,0 +1,158 @@
+from testing_utils import load_thrift_from_testdir
+from thrift_explorer.call_plan import compile_call_plan, compile_call_plans
+from thrift_explorer.thrift_manager import translate_thrift_response
+from thrift_explorer.thrift_parser import parse_service_specs
+
+
+def _plan_for(thrift_file, service_name, endpoint_name):
+    thrift_module = load_thrift_from_testdir(thrift_file)
+    service_specs = parse_service_specs({thrift_file: thrift_module})
+    endpoint = service_specs[thrift_file][service_name].endpoints[endpoint_name]
+    return thrift_module, compile_call_plan(
+        getattr(thrift_module, service_name), endpoint
+    )
+
+
+def test_plan_translates_nested_structs():
+    nested_thrift, plan = _plan_for("nested.thrift", "ForestService", "plantTree")
+    leaf = {"name": "oak leaf", "color": "GREEN", "values": [1, 2]}
+    assert {
+        "tree": nested_thrift.Tree(
+            trunk=nested_thrift.Trunk(
+                branches=[
+                    nested_thrift.Branch(
+                        leaves=[
+                            nested_thrift.Leaf(
+                                name="oak leaf",
+                                color=nested_thrift.Color.GREEN,
+                                values=[1, 2],
+                            )
+                        ],
+                        leavesByName={
+                            "oak": nested_thrift.Leaf(
+                                name="oak leaf",
+                                color=nested_thrift.Color.GREEN,
+                                values=[1, 2],
+                            )
+                        },
+                    )
+                ],
+                colors={nested_thrift.Color.RED, nested_thrift.Color.BLUE},
+            ),
+            species="oak",
+        ),
+        "extraLeaves": [nested_thrift.Leaf(name="stray")],
+    } == plan.translate_request(
+        {
+            "tree": {
+                "trunk": {
+                    "branches": [{"leaves": [leaf], "leavesByName": {"oak": leaf}}],
+                    "colors": ["RED", 2],
+                },
+                "species": "oak",
+            },
+            "extraLeaves": [{"name": "stray"}],
+        }
+    )
+
+
+def test_plan_skips_missing_args():
+    _, plan = _plan_for("nested.thrift", "ForestService", "listTrees")
+    assert {} == plan.translate_request({})
+    assert {"limit": 4} == plan.translate_request({"limit": 4})
+
+
+def test_plan_exceptions():
+    nested_thrift, plan = _plan_for("nested.thrift", "ForestService", "plantTree")
+    assert (nested_thrift.TreeNotFound,) == plan.exceptions
+    _, plan = _plan_for("nested.thrift", "ForestService", "leavesBySpecies")
+    assert () == plan.exceptions
+
+
+def test_compile_call_plans(example_thrift_manager):
+    plans = compile_call_plans(
+        example_thrift_manager._thrifts, example_thrift_manager.service_specs
+    )
+    assert ("todo.thrift", "TodoService", "getTask") in plans
+    assert ("Batman.thrift", "BatPuter", "saveCase") in plans
+    assert plans[("todo.thrift", "TodoService", "getTask")].endpoint.name == "getTask"
+
+
+def test_plan_translates_nested_response():
+    nested_thrift, plan = _plan_for("nested.thrift", "ForestService", "listTrees")
+    leaf = nested_thrift.Leaf(name="oak leaf", color=nested_thrift.Color.RED)
+    trees = [
+        nested_thrift.Tree(
+            trunk=nested_thrift.Trunk(
+                branches=[
+                    nested_thrift.Branch(leaves=[leaf], leavesByName={"oak": leaf})
+                ],
+                colors={nested_thrift.Color.RED},
+            ),
+            species="oak",
+        ),
+        nested_thrift.Tree(trunk=nested_thrift.Trunk(branches=[])),
+    ]
+    translated = plan.translate_success(trees)
+    assert translate_thrift_response(trees) == translated
+    assert {
+        "__thrift_struct_class__": "Leaf",
+        "name": "oak leaf",
+        "color": 0,
+        "values": None,
+    } == translated[0]["trunk"]["branches"][0]["leavesByName"]["oak"]
+    assert [] == plan.translate_success([])
+
+
+def test_plan_translates_map_of_lists():
+    nested_thrift, plan = _plan_for("nested.thrift", "ForestService", "leavesBySpecies")
+    response = {"oak": [nested_thrift.Leaf(name="a", values=[1, 2])], "elm": []}
+    assert translate_thrift_response(response) == plan.translate_success(response)
+
+
+def test_plan_translates_declared_exceptions():
+    nested_thrift, plan = _plan_for("nested.thrift", "ForestService", "plantTree")
+    exception = nested_thrift.TreeNotFound(species="oak")
+    assert {
+        "__thrift_struct_class__": "TreeNotFound",
+        "species": "oak",
+    } == plan.exception_translators[nested_thrift.TreeNotFound](exception)
+
+
+def test_plan_translates_basic_response():
+    _, plan = _plan_for("simpleType.thrift", "TestService", "returnInt")
+    assert 4 == plan.translate_success(4)
+    _, plan = _plan_for("simpleType.thrift", "TestService", "voidMethod")
+    assert plan.translate_success(None) is None
+
+
+def test_plan_translates_recursive_structs():
+    recursive_thrift, plan = _plan_for("recursive.thrift", "TreeService", "echoTree")
+    Node = recursive_thrift.Node
+    tree = Node(
+        value="root",
+        children=[Node(value="a", following=Node(value="b")), Node(value="c")],
+    )
+    assert {"root": tree} == plan.translate_request(
+        {
+            "root": {
+                "value": "root",
+                "children": [
+                    {"value": "a", "following": {"value": "b"}},
+                    {"value": "c"},
+                ],
+            }
+        }
+    )
+    assert translate_thrift_response(tree) == plan.translate_success(tree)
+
+
+def test_plan_translates_mutually_recursive_structs():
+    recursive_thrift, plan = _plan_for("recursive.thrift", "TreeService", "rally")
+    ping = recursive_thrift.Ping(
+        pong=recursive_thrift.Pong(ping=recursive_thrift.Ping(), hits=2)
+    )
+    assert {"ping": ping} == plan.translate_request(
+        {"ping": {"pong": {"ping": {}, "hits": 2}}}
+    )
+    assert translate_thrift_response(ping) == plan.translate_success(ping)
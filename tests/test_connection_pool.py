@@ -0,0 +1,119 @@
+import pytest
+from thriftpy2.transport import TTransportException
+
+from thrift_explorer import thrift_manager
+from thrift_explorer.communication_models import Protocol, Transport
+from thrift_explorer.connection_pool import ConnectionPool, PoolKey
+
+pytestmark = pytest.mark.uses_server
+
+
+def _checkout(pool, todo_thrift, port=6000, protocol=Protocol.BINARY):
+    key = PoolKey(
+        host="127.0.0.1",
+        port=port,
+        protocol=protocol,
+        transport=Transport.BUFFERED,
+        service=todo_thrift.TodoService,
+    )
+    connection, pool_hit = pool.checkout(
+        key,
+        thrift_manager._find_protocol_factory(protocol),
+        thrift_manager._find_transport_factory(Transport.BUFFERED),
+    )
+    return key, connection, pool_hit
+
+
+def test_connection_is_reused(todo_server, todo_thrift):
+    pool = ConnectionPool()
+    key, connection, pool_hit = _checkout(pool, todo_thrift)
+    assert not pool_hit
+    connection.client.ping()
+    pool.checkin(key, connection)
+
+    _, reused_connection, pool_hit = _checkout(pool, todo_thrift)
+    assert pool_hit
+    assert reused_connection is connection
+    reused_connection.client.ping()
+    assert {"hits": 1, "misses": 1, "idle": 0, "in_use": 1} == pool.stats()
+    pool.close()
+
+
+def test_broken_connection_is_discarded(todo_server, todo_thrift):
+    pool = ConnectionPool()
+    key, connection, _ = _checkout(pool, todo_thrift)
+    connection.broken = True
+    pool.checkin(key, connection)
+    assert 0 == pool.stats()["idle"]
+    assert not connection.socket.is_open()
+
+
+def test_closed_connection_fails_health_check(todo_server, todo_thrift):
+    pool = ConnectionPool()
+    key, connection, _ = _checkout(pool, todo_thrift)
+    connection.client.ping()
+    pool.checkin(key, connection)
+    # Simulate the server hanging up on an idle connection
+    connection.socket.sock.close()
+    connection.socket.sock = None
+
+    _, new_connection, pool_hit = _checkout(pool, todo_thrift)
+    assert not pool_hit
+    assert new_connection is not connection
+    new_connection.client.ping()
+    pool.close()
+
+
+def test_idle_connections_are_evicted(todo_server, todo_thrift):
+    pool = ConnectionPool(idle_timeout=0)
+    key, connection, _ = _checkout(pool, todo_thrift)
+    pool.checkin(key, connection)
+    connection.last_used -= 1
+
+    _, new_connection, pool_hit = _checkout(pool, todo_thrift)
+    assert not pool_hit
+    assert not connection.socket.is_open()
+    new_connection.close()
+
+
+def test_idle_connections_under_other_keys_are_evicted(todo_server, todo_thrift):
+    pool = ConnectionPool(idle_timeout=0)
+    key, connection, _ = _checkout(pool, todo_thrift)
+    pool.checkin(key, connection)
+    connection.last_used -= 1
+
+    # Nothing asks for key again, a checkin under another key sweeps it
+    other_key, other, _ = _checkout(pool, todo_thrift, protocol=Protocol.COMPACT)
+    pool.checkin(other_key, other)
+    assert not connection.socket.is_open()
+    assert 1 == pool.stats()["idle"]
+    pool.close()
+
+
+def test_retired_services_are_not_pooled(todo_server, todo_thrift):
+    pool = ConnectionPool()
+    key, connection, _ = _checkout(pool, todo_thrift)
+    _, in_use, _ = _checkout(pool, todo_thrift)
+    pool.checkin(key, connection)
+    pool.retire_services([todo_thrift.TodoService])
+    assert not connection.socket.is_open()
+    # A call still running on the old service gives its connection back later
+    pool.checkin(key, in_use)
+    assert not in_use.socket.is_open()
+    assert 0 == pool.stats()["idle"]
+
+
+def test_max_size_limits_idle_connections(todo_server, todo_thrift):
+    pool = ConnectionPool(max_size=1)
+    key, first, _ = _checkout(pool, todo_thrift)
+    _, second, _ = _checkout(pool, todo_thrift)
+    pool.checkin(key, first)
+    pool.checkin(key, second)
+    assert 1 == pool.stats()["idle"]
+    assert not second.socket.is_open()
+    pool.close()
+
+
+def test_failed_connection_raises(todo_server, todo_thrift):
+    with pytest.raises(TTransportException):
+        _checkout(ConnectionPool(), todo_thrift, port=9999)
@@ -0,0 +1,55 @@
+import gzip
+import json
+import os
+
+from thrift_explorer.definition_cache import DefinitionCache
+
+
+def _write(path, text, mtime):
+    path.write_text(text)
+    os.utime(str(path), (mtime, mtime))
+
+
+def test_definition_is_read_once(tmp_path):
+    thrift_path = tmp_path / "ping.thrift"
+    _write(thrift_path, "service Pinger {}\n", 1000000000)
+    cache = DefinitionCache()
+    definition = cache.definition(str(thrift_path))
+    assert b"service Pinger {}\n" == definition.body
+    assert definition.body == gzip.decompress(definition.gzipped)
+    assert definition is cache.definition(str(thrift_path))
+    _write(thrift_path, "service Ponger {}\n", 1000000001)
+    changed = cache.definition(str(thrift_path))
+    assert b"service Ponger {}\n" == changed.body
+    assert definition.etag != changed.etag
+    assert 1000000001 == changed.last_modified
+
+
+def test_bundle(tmp_path):
+    (tmp_path / "base").mkdir()
+    _write(tmp_path / "base" / "Core.thrift", "struct Core {}\n", 1000000002)
+    _write(tmp_path / "main.thrift", 'include "base/Core.thrift"\n', 1000000000)
+    cache = DefinitionCache()
+    bundle = cache.bundle(
+        str(tmp_path / "main.thrift"), [str(tmp_path / "base" / "Core.thrift")]
+    )
+    assert {
+        "thrift": "main.thrift",
+        "files": {
+            "main.thrift": 'include "base/Core.thrift"\n',
+            "base/Core.thrift": "struct Core {}\n",
+        },
+    } == json.loads(bundle.body)
+    assert 1000000002 == bundle.last_modified
+    assert bundle is cache.bundle(
+        str(tmp_path / "main.thrift"), [str(tmp_path / "base" / "Core.thrift")]
+    )
+    _write(tmp_path / "base" / "Core.thrift", "struct Core2 {}\n", 1000000003)
+    assert (
+        "struct Core2 {}\n"
+        == json.loads(
+            cache.bundle(
+                str(tmp_path / "main.thrift"), [str(tmp_path / "base" / "Core.thrift")]
+            ).body
+        )["files"]["base/Core.thrift"]
+    )
@@ -0,0 +1,62 @@
+import math
+import random
+
+import pytest
+
+from thrift_explorer.histogram import LatencyHistogram, LatencySummary
+
+
+def _histogram(latencies, **kwargs):
+    histogram = LatencyHistogram(**kwargs)
+    for latency in latencies:
+        histogram.record(latency)
+    return histogram
+
+
+def test_empty():
+    histogram = LatencyHistogram()
+    assert histogram.summary() is None
+    assert histogram.value_at_percentile(50) is None
+    assert histogram.mean() is None
+
+
+def test_small_values_are_exact():
+    histogram = _histogram([n / 1000000 for n in range(1, 101)])
+    assert (
+        LatencySummary(p50=0.00005, p90=0.00009, p99=0.000099, max=0.0001)
+        == histogram.summary()
+    )
+
+
+@pytest.mark.parametrize("significant_digits", [1, 2, 3])
+def test_percentiles_within_precision(significant_digits):
+    latencies = [random.uniform(0.0001, 30) for _ in range(5000)]
+    histogram = _histogram(latencies, significant_digits=significant_digits)
+    ordered = sorted(latencies)
+    for percent in (1, 25, 50, 90, 99, 99.9):
+        expected = ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+        assert histogram.value_at_percentile(percent) == pytest.approx(
+            expected, rel=10**-significant_digits, abs=1e-6
+        )
+    assert histogram.max / 1000000 == pytest.approx(ordered[-1], abs=1e-6)
+
+
+def test_merge_is_exact():
+    latencies = [random.expovariate(100) for _ in range(2000)]
+    whole = _histogram(latencies)
+    merged = _histogram(latencies[:700])
+    merged.merge(_histogram(latencies[700:1500]))
+    merged.merge(_histogram(latencies[1500:]))
+    assert whole.count == merged.count
+    assert whole.summary() == merged.summary()
+    assert [whole.value_at_percentile(p) for p in range(1, 101)] == [
+        merged.value_at_percentile(p) for p in range(1, 101)
+    ]
+    assert whole.mean() == pytest.approx(merged.mean())
+
+
+def test_merge_needs_the_same_precision():
+    with pytest.raises(ValueError):
+        LatencyHistogram(significant_digits=2).merge(
+            LatencyHistogram(significant_digits=3)
+        )
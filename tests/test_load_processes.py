@@ -0,0 +1,188 @@
+import datetime
+import json
+import random
+
+import pytest
+
+from thrift_explorer.cli import main
+from thrift_explorer.communication_models import ThriftRequest, ThriftResponse
+from thrift_explorer.load_processes import (
+    LoadWorkerError,
+    _LoadTestJob,
+    _ScenarioJob,
+    _split,
+    load_test_in_processes,
+)
+from thrift_explorer.load_test import LoadTestSettings, ResponseRecorder
+from thrift_explorer.scenario import Scenario, Stage
+
+
+def _ping(port=6000):
+    return ThriftRequest(
+        thrift_file="todo.thrift",
+        service_name="TodoService",
+        endpoint_name="ping",
+        host="127.0.0.1",
+        port=port,
+        protocol="TBinaryProtocol",
+        transport="TBufferedTransport",
+        request_body={},
+    )
+
+
+def _response(status, call):
+    return ThriftResponse(
+        status=status,
+        request=None,
+        data=None,
+        time_to_make_request=datetime.timedelta(seconds=call),
+        time_to_connect=datetime.timedelta(microseconds=10),
+    )
+
+
+def test_split():
+    assert [4, 3, 3] == _split(10, 3)
+    assert [1, 1, 0] == _split(2, 3)
+
+
+def test_shard_load_test():
+    job = _LoadTestJob(
+        thrift_request=_ping(),
+        settings=LoadTestSettings(concurrency=5, total_requests=9, target_rps=100),
+    )
+    shards = job.shard(3)
+    assert [2, 2, 1] == [shard.settings.concurrency for shard in shards]
+    assert [3, 3, 3] == [shard.settings.total_requests for shard in shards]
+    assert {100 / 3} == {shard.settings.target_rps for shard in shards}
+    # Each worker starts one slot of the whole timetable after the last
+    assert [0, 0.01, 0.02] == [shard.phase for shard in shards]
+
+
+def test_shard_caps_processes():
+    no_rate = _LoadTestJob(
+        thrift_request=_ping(), settings=LoadTestSettings(concurrency=2, duration=1)
+    )
+    assert 2 == len(no_rate.shard(4))
+    few_requests = _LoadTestJob(
+        thrift_request=_ping(),
+        settings=LoadTestSettings(concurrency=8, total_requests=3, target_rps=10),
+    )
+    assert [1, 1, 1] == [
+        shard.settings.total_requests for shard in few_requests.shard(4)
+    ]
+
+
+def test_shard_concurrency_adds_up():
+    job = _LoadTestJob(
+        thrift_request=_ping(),
+        settings=LoadTestSettings(concurrency=2, duration=1, target_rps=100),
+    )
+    shards = job.shard(4)
+    assert [1, 1] == [shard.settings.concurrency for shard in shards]
+    assert {50} == {shard.settings.target_rps for shard in shards}
+    scenario = Scenario(
+        calls=[],
+        stages=[Stage(duration=1, target_rps=30, start_rps=30)],
+        concurrency=3,
+        variables={},
+    )
+    shards = _ScenarioJob(scenario=scenario).shard(8)
+    assert [1, 1, 1] == [shard.scenario.concurrency for shard in shards]
+    assert [Stage(duration=1, target_rps=10, start_rps=10)] == (
+        shards[0].scenario.stages
+    )
+
+
+def test_shard_scenario():
+    scenario = Scenario(
+        calls=[],
+        stages=[Stage(duration=2, target_rps=40, start_rps=0)],
+        concurrency=3,
+        variables={},
+        seed=7,
+    )
+    shards = _ScenarioJob(scenario=scenario).shard(2)
+    assert [Stage(duration=2, target_rps=20, start_rps=0)] == shards[0].scenario.stages
+    assert [2, 1] == [shard.scenario.concurrency for shard in shards]
+    assert ["7-0", "7-1"] == [shard.scenario.seed for shard in shards]
+    assert [0, 1 / 40] == [shard.phase for shard in shards]
+
+
+def test_merged_snapshots_match_one_recorder():
+    latencies = [random.expovariate(100) for _ in range(500)]
+    whole = ResponseRecorder()
+    merged = ResponseRecorder()
+    workers = [ResponseRecorder(), ResponseRecorder()]
+    for n, latency in enumerate(latencies):
+        response = _response("Success" if n % 7 else "NotFound", latency / 2)
+        whole.record(response, latency)
+        workers[n % 2].record(response, latency)
+        if n % 100 == 0:
+            merged.merge(workers[n % 2].take_snapshot())
+    for worker in workers:
+        merged.merge(worker.take_snapshot())
+    assert whole.report(1.0) == merged.report(1.0)
+
+
+def test_snapshots_reset_the_recorder():
+    recorder = ResponseRecorder()
+    recorder.record(_response("Success", 0.001), 0.002)
+    assert 1 == recorder.take_snapshot().latency.count
+    assert 0 == recorder.take_snapshot().latency.count
+
+
+@pytest.mark.uses_server
+def test_load_test_in_processes(todo_server, example_thrift_directory):
+    progress = []
+    report = load_test_in_processes(
+        example_thrift_directory,
+        _ping(),
+        LoadTestSettings(concurrency=2, total_requests=40, target_rps=200),
+        2,
+        on_progress=progress.append,
+        interval=0.05,
+    )
+    assert {"Success": 40} == report.statuses
+    assert 40 == report.requests
+    assert report.latency_seconds is not None
+    assert progress
+    assert [report.requests for report in progress] == sorted(
+        report.requests for report in progress
+    )
+
+
+def test_worker_failures_are_raised(tmp_path):
+    with pytest.raises(LoadWorkerError):
+        load_test_in_processes(
+            str(tmp_path / "missing"),
+            _ping(),
+            LoadTestSettings(concurrency=2, total_requests=2),
+            2,
+            interval=0.05,
+        )
+
+
+@pytest.mark.uses_server
+def test_cli_processes(todo_server, example_thrift_directory, capsys):
+    assert 0 == main(
+        [
+            "load-test",
+            "todo",
+            "TodoService",
+            "ping",
+            "--thrift-directory",
+            example_thrift_directory,
+            "--host",
+            "127.0.0.1",
+            "--port",
+            "6000",
+            "--total-requests",
+            "20",
+            "--target-rps",
+            "400",
+            "--processes",
+            "2",
+        ]
+    )
+    report = json.loads(capsys.readouterr().out)
+    assert {"Success": 20} == report["statuses"]
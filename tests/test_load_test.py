@@ -0,0 +1,226 @@
+import datetime
+import json
+import threading
+import time
+
+import pytest
+
+from thrift_explorer.cli import main
+from thrift_explorer.communication_models import ThriftResponse
+from thrift_explorer.histogram import LatencySummary
+from thrift_explorer.load_test import (
+    LoadTestLimits,
+    LoadTestSettings,
+    build_report,
+    parse_load_test_settings,
+    run_load_test,
+)
+
+
+class FakeManager(object):
+    def __init__(self, statuses=("Success",), stall_on=None):
+        self.statuses = statuses
+        self.stall_on = stall_on
+        self.calls = 0
+        self.pools = set()
+        self._lock = threading.Lock()
+
+    def make_request(self, thrift_request, connection_pool=None):
+        with self._lock:
+            status = self.statuses[self.calls % len(self.statuses)]
+            self.calls += 1
+            self.pools.add(id(connection_pool))
+            call = self.calls
+        if call == self.stall_on:
+            time.sleep(0.2)
+            return _response(status, 0.001, 0.2)
+        return _response(status, 0.001, 0.002)
+
+
+def _response(status, connect, call):
+    return ThriftResponse(
+        status=status,
+        request=None,
+        data=None,
+        time_to_make_request=datetime.timedelta(seconds=call),
+        time_to_connect=datetime.timedelta(seconds=connect),
+    )
+
+
+@pytest.mark.parametrize(
+    "request_json, message",
+    [
+        ({}, "One of 'total_requests' or 'duration' is required"),
+        ({"total_requests": 0}, "'total_requests' must be more than 0"),
+        ({"duration": "soon"}, "'duration' must be a number"),
+        ({"duration": 1, "concurrency": -2}, "'concurrency' must be more than 0"),
+        (
+            {"duration": 1, "open_loop": True},
+            "'target_rps' is required for an open loop test",
+        ),
+        ({"duration": 1, "open_loop": "yes"}, "'open_loop' must be true or false"),
+    ],
+)
+def test_parse_invalid_settings(request_json, message):
+    with pytest.raises(ValueError) as error:
+        parse_load_test_settings(request_json)
+    assert message == str(error.value)
+
+
+@pytest.mark.parametrize(
+    "request_json, message",
+    [
+        ({"duration": 1, "concurrency": 5}, "'concurrency' can be at most 4"),
+        ({"total_requests": 101}, "'total_requests' can be at most 100"),
+        ({"duration": 10.5}, "'duration' can be at most 10"),
+    ],
+)
+def test_parse_settings_over_limits(request_json, message):
+    limits = LoadTestLimits(max_concurrency=4, max_total_requests=100, max_duration=10)
+    with pytest.raises(ValueError) as error:
+        parse_load_test_settings(request_json, limits)
+    assert message == str(error.value)
+
+
+def test_parse_settings_at_limits():
+    limits = LoadTestLimits(max_concurrency=4, max_total_requests=100, max_duration=10)
+    assert LoadTestSettings(
+        concurrency=4, total_requests=100, duration=10.0
+    ) == parse_load_test_settings(
+        {"concurrency": 4, "total_requests": 100, "duration": 10}, limits
+    )
+
+
+def test_parse_settings():
+    assert LoadTestSettings(
+        concurrency=1, total_requests=None, duration=2.5, target_rps=10.0
+    ) == parse_load_test_settings({"duration": "2.5", "target_rps": 10, "port": 1})
+
+
+def test_build_report():
+    report = build_report(
+        [
+            _response("Success", 0.1, 0.2),
+            _response("Success", 0.3, 0.4),
+            _response("NotFound", 0.5, 0.6),
+            ThriftResponse("ConnectionError", None, "nope", None, None),
+        ],
+        2.0,
+    )
+    assert 4 == report.requests
+    assert 2.0 == report.throughput
+    assert {"Success": 2, "NotFound": 1, "ConnectionError": 1} == report.statuses
+    assert 2 == report.errors
+    assert (
+        LatencySummary(p50=pytest.approx(0.3, rel=0.01), p90=0.5, p99=0.5, max=0.5)
+        == report.connect_seconds
+    )
+    assert 0.6 == report.call_seconds.max
+    assert report.latency_seconds is None
+
+
+def test_run_total_requests():
+    manager = FakeManager(statuses=("Success", "NotFound"))
+    report = run_load_test(
+        manager, None, LoadTestSettings(concurrency=4, total_requests=10)
+    )
+    assert 10 == manager.calls == report.requests
+    assert {"Success": 5, "NotFound": 5} == report.statuses
+    # The test has a pool of its own
+    assert 1 == len(manager.pools)
+    assert {id(None)} != manager.pools
+
+
+def test_run_target_rps_spaces_requests():
+    started = time.monotonic()
+    report = run_load_test(
+        FakeManager(),
+        None,
+        LoadTestSettings(concurrency=2, total_requests=5, target_rps=50),
+    )
+    # The fifth request starts 4/50ths of a second in
+    assert time.monotonic() - started >= 0.08
+    assert 5 == report.requests
+
+
+def test_run_duration():
+    report = run_load_test(
+        FakeManager(), None, LoadTestSettings(duration=0.1, target_rps=100)
+    )
+    assert 10 == report.requests
+
+
+@pytest.mark.parametrize("open_loop", [False, True])
+def test_stall_is_measured_from_the_timetable(open_loop):
+    # 10 requests due every 20ms, the second takes 200ms
+    report = run_load_test(
+        FakeManager(stall_on=2),
+        None,
+        LoadTestSettings(total_requests=10, target_rps=50, open_loop=open_loop),
+    )
+    assert 10 == report.requests
+    assert report.call_seconds.max == pytest.approx(0.2)
+    # Everything due during the stall waited on it. Latency from the due
+    # time sees that whether the requests were sent on time or not
+    assert report.latency_seconds.p50 > 0.05
+    assert report.latency_seconds.max >= 0.2
+
+
+def test_open_loop_keeps_to_the_timetable():
+    manager = FakeManager(stall_on=2)
+    started = time.monotonic()
+    run_load_test(
+        manager,
+        None,
+        LoadTestSettings(
+            concurrency=4, total_requests=10, target_rps=50, open_loop=True
+        ),
+    )
+    # The stall holds up one worker, the others keep the requests going
+    assert time.monotonic() - started < 0.35
+    assert 10 == manager.calls
+
+
+@pytest.mark.uses_server
+def test_cli(todo_server, example_thrift_directory, capsys):
+    assert 0 == main(
+        [
+            "load-test",
+            "todo",
+            "TodoService",
+            "ping",
+            "--thrift-directory",
+            example_thrift_directory,
+            "--host",
+            "127.0.0.1",
+            "--port",
+            "6000",
+            "--total-requests",
+            "20",
+            "--target-rps",
+            "1000",
+            "--open-loop",
+        ]
+    )
+    report = json.loads(capsys.readouterr().out)
+    assert {"Success": 20} == report["statuses"]
+    assert {"p50", "p90", "p99", "max"} == set(report["latency_seconds"])
+
+
+def test_cli_invalid_settings(example_thrift_directory, capsys):
+    assert 2 == main(
+        [
+            "load-test",
+            "todo",
+            "TodoService",
+            "ping",
+            "--thrift-directory",
+            example_thrift_directory,
+            "--port",
+            "6000",
+            "--duration",
+            "1",
+            "--open-loop",
+        ]
+    )
+    assert "'target_rps' is required for an open loop test\n" == capsys.readouterr().err
@@ -0,0 +1,133 @@
+import datetime
+import json
+import os
+
+from thrift_explorer.communication_models import (
+    CallTimings,
+    Error,
+    ErrorCode,
+    ThriftRequest,
+    ThriftResponse,
+)
+from thrift_explorer.connection_pool import ConnectionPool
+from thrift_explorer.metrics import Metrics, clear_directory, pool_sampler
+
+# No process has this pid, linux pids stop at 2 ** 22
+DEAD_PID = 2**22 + 1
+
+
+def _response(status="Success", call=0.003):
+    return ThriftResponse(
+        status=status,
+        request=ThriftRequest(
+            thrift_file="todo.thrift",
+            service_name="TodoService",
+            endpoint_name="getTask",
+            host="localhost",
+            port=6000,
+            protocol="TBinaryProtocol",
+            transport="TBufferedTransport",
+            request_body={"taskId": "1"},
+        ),
+        data=None,
+        time_to_make_request=datetime.timedelta(seconds=call),
+        time_to_connect=datetime.timedelta(microseconds=10),
+        timings=CallTimings(connect_ns=10_000, server_wait_ns=int(call * 1e9)),
+    )
+
+
+def _lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.record_call(_response(), 100)
+    metrics.record_call(_response("NotFound", call=30), 2000)
+    metrics.record_invalid(
+        [Error(code=ErrorCode.REQUIRED_FIELD_MISSING, message="nope")]
+    )
+    text = metrics.render()
+    labels = 'thrift="todo.thrift",service="TodoService",method="getTask"'
+    assert [
+        'thrift_explorer_calls_total{{{},status="NotFound"}} 1'.format(labels),
+        'thrift_explorer_calls_total{{{},status="Success"}} 1'.format(labels),
+    ] == _lines(text, "thrift_explorer_calls_total{")
+    buckets = _lines(text, "thrift_explorer_call_duration_seconds_bucket")
+    assert (
+        'thrift_explorer_call_duration_seconds_bucket{{{},le="0.0025"}} 0'.format(
+            labels
+        )
+        in buckets
+    )
+    assert (
+        'thrift_explorer_call_duration_seconds_bucket{{{},le="0.005"}} 1'.format(labels)
+        in buckets
+    )
+    assert (
+        'thrift_explorer_call_duration_seconds_bucket{{{},le="+Inf"}} 2'.format(labels)
+        == buckets[-1]
+    )
+    assert [
+        "thrift_explorer_call_duration_seconds_count{{{}}} 2".format(labels)
+    ] == _lines(text, "thrift_explorer_call_duration_seconds_count")
+    assert [
+        'thrift_explorer_validation_failures_total{thrift="",service="",method="",'
+        'code="REQUIRED_FIELD_MISSING"} 1'
+    ] == _lines(text, "thrift_explorer_validation_failures_total{")
+    phase_count = "thrift_explorer_call_phase_duration_seconds_count"
+    assert [
+        '{}{{{},phase="{}"}} 2'.format(phase_count, labels, phase)
+        for phase in ("connect", "server_wait")
+    ] == _lines(text, phase_count)
+    assert "# TYPE thrift_explorer_request_size_bytes histogram" in text
+
+
+def test_processes_add_up(tmp_path):
+    directory = str(tmp_path)
+    first, second = Metrics(directory), Metrics(directory)
+    first.add_sampler(pool_sampler("sync", ConnectionPool()))
+    first.record_call(_response(), 100)
+    second.record_call(_response(), 100)
+    second.flush()
+    # A process that has exited keeps its counts but not its gauges
+    with open(os.path.join(directory, "{}-old.json".format(DEAD_PID)), "w") as dead:
+        json.dump(
+            {
+                "pid": DEAD_PID,
+                "counters": [
+                    [
+                        "thrift_explorer_pool_hits_total",
+                        [["pool", "sync"]],
+                        5,
+                    ]
+                ],
+                "histograms": [],
+                "gauges": [
+                    [
+                        "thrift_explorer_pool_idle_connections",
+                        [["pool", "sync"]],
+                        3,
+                    ]
+                ],
+            },
+            dead,
+        )
+    text = first.render()
+    assert 1 == len(_lines(text, "thrift_explorer_calls_total{"))
+    assert _lines(text, "thrift_explorer_calls_total{")[0].endswith(" 2")
+    assert ['thrift_explorer_pool_hits_total{pool="sync"} 5'] == _lines(
+        text, "thrift_explorer_pool_hits_total{"
+    )
+    assert ['thrift_explorer_pool_idle_connections{pool="sync"} 0'] == _lines(
+        text, "thrift_explorer_pool_idle_connections{"
+    )
+    clear_directory(directory)
+    assert [] == os.listdir(directory)
+
+
+def test_forked_process_starts_afresh(monkeypatch):
+    metrics = Metrics()
+    metrics.record_call(_response(), 100)
+    monkeypatch.setattr(os, "getpid", lambda: DEAD_PID)
+    assert [] == _lines(metrics.render(), "thrift_explorer_calls_total{")
@@ -1,6 +1,10 @@
+import pytest
+
 from testing_utils import load_thrift_from_testdir
 from thrift_explorer.thrift_manager import parse_service_specs, translate_request_body
 
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
 
 def _parse_services_for_thrift(thrift_file):
     thrift_module = load_thrift_from_testdir(thrift_file)
@@ -87,3 +91,10 @@ def test_struct():
         },
         getattr(struct_thrift, "StructService"),
     )
+
+
+def test_translate_request_body_is_deprecated():
+    thrift_module, service_specs = _parse_services_for_thrift("simpleType.thrift")
+    test_service = service_specs["TestService"]
+    with pytest.deprecated_call():
+        translate_request_body(test_service.endpoints["voidMethod"], {}, thrift_module)
@@ -0,0 +1,277 @@
+import datetime
+import json
+import os
+import threading
+
+import pytest
+
+from thrift_explorer.communication_models import Error, ErrorCode, ThriftResponse
+from thrift_explorer.scenario import (
+    ScenarioError,
+    Stage,
+    _due_times,
+    load_scenario,
+    parse_scenario,
+    render,
+    run_scenario,
+    scenario_from_postman,
+)
+from thrift_explorer.thrift_manager import ThriftManager
+
+
+class FakeManager(object):
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def validate_request(self, thrift_request):
+        return self.errors
+
+    def make_request(self, thrift_request, connection_pool=None):
+        with self._lock:
+            self.requests.append(thrift_request)
+        return ThriftResponse(
+            status="Success",
+            request=thrift_request,
+            data=None,
+            time_to_make_request=datetime.timedelta(microseconds=200),
+            time_to_connect=datetime.timedelta(microseconds=10),
+        )
+
+
+def _scenario_json(**overrides):
+    scenario_json = {
+        "seed": 7,
+        "variables": {"task_id": ["a", "b"], "port": 6000},
+        "defaults": {"host": "127.0.0.1", "port": "${port}"},
+        "stages": [{"duration": 0.2, "target_rps": 100}],
+        "calls": [
+            {
+                "thrift": "todo",
+                "service": "TodoService",
+                "method": "getTask",
+                "weight": 3,
+                "request_body": {"taskId": "${task_id}"},
+            },
+            {
+                "name": "count",
+                "thrift": "todo.thrift",
+                "service": "TodoService",
+                "method": "numTasks",
+            },
+        ],
+    }
+    scenario_json.update(overrides)
+    return scenario_json
+
+
+def _parse(scenario_json):
+    return parse_scenario(scenario_json, "TBinaryProtocol", "TBufferedTransport")
+
+
+def test_render():
+    variables = {"port": 6000, "name": "bob"}
+    assert {"port": 6000, "greeting": ["hi bob on 6000"], "n": 1} == render(
+        {"port": "${port}", "greeting": ["hi ${name} on ${port}"], "n": 1},
+        variables,
+    )
+
+
+def test_parse_scenario():
+    scenario = _parse(_scenario_json())
+    assert ["todo.thrift/TodoService/getTask", "count"] == [
+        call.name for call in scenario.calls
+    ]
+    assert [3, 1] == [call.weight for call in scenario.calls]
+    assert {
+        "host": "127.0.0.1",
+        "port": "${port}",
+        "protocol": "TBinaryProtocol",
+        "transport": "TBufferedTransport",
+        "request_body": {},
+    } == scenario.calls[1].template
+    assert [Stage(duration=0.2, target_rps=100, start_rps=100)] == scenario.stages
+    assert 1 == scenario.concurrency
+
+
+@pytest.mark.parametrize(
+    "overrides, message",
+    [
+        ({"calls": []}, "A scenario needs at least one call"),
+        ({"stages": []}, "A scenario needs at least one stage"),
+        ({"stages": [{"target_rps": 1}]}, "stage 0 needs a 'duration'"),
+        (
+            {"stages": [{"duration": 1, "target_rps": "lots"}]},
+            "'target_rps' in stage 0 must be a number",
+        ),
+        ({"calls": [{"thrift": "todo"}]}, "call 0 needs a 'service'"),
+        (
+            {"variables": {}},
+            "Call 'todo.thrift/TodoService/getTask' uses unknown variables "
+            "port, task_id",
+        ),
+        (
+            {
+                "calls": [
+                    {"thrift": "a", "service": "b", "method": "c"},
+                    {"thrift": "a.thrift", "service": "b", "method": "c"},
+                ]
+            },
+            "More than one call is named 'a.thrift/b/c'",
+        ),
+    ],
+)
+def test_parse_invalid_scenario(overrides, message):
+    with pytest.raises(ScenarioError) as error:
+        _parse(_scenario_json(**overrides))
+    assert message == str(error.value)
+
+
+def test_due_times_ramp():
+    steady = list(_due_times([Stage(duration=1, target_rps=10, start_rps=10)], 5))
+    assert [5 + n / 10 for n in range(10)] == pytest.approx(steady)
+    ramp = list(_due_times([Stage(duration=1, target_rps=100, start_rps=0)], 0))
+    # The average rate is 50 a second and requests bunch up towards the end
+    assert 50 == len(ramp)
+    assert ramp[1] - ramp[0] > ramp[-1] - ramp[-2]
+    paused = list(
+        _due_times(
+            [
+                Stage(duration=1, target_rps=0, start_rps=0),
+                Stage(duration=1, target_rps=2, start_rps=2),
+            ],
+            0,
+        )
+    )
+    assert [1, 1.5] == paused
+
+
+def test_due_times_ramp_down():
+    ramp = list(_due_times([Stage(duration=1, target_rps=1, start_rps=10)], 0))
+    # 5.5 requests on average, the half one is sent
+    assert 6 == len(ramp)
+    assert ramp == sorted(ramp)
+    assert ramp[1] - ramp[0] < ramp[-1] - ramp[-2]
+    assert all(0 <= due < 1 for due in ramp)
+
+
+def test_due_times_ramp_to_zero():
+    ramp = list(_due_times([Stage(duration=1, target_rps=0, start_rps=3)], 0))
+    assert 2 == len(ramp)
+    assert all(0 <= due < 1 for due in ramp)
+    ramp = list(_due_times([Stage(duration=2, target_rps=0, start_rps=100)], 0))
+    assert 100 == len(ramp)
+    assert ramp == sorted(ramp)
+
+
+def test_run_scenario():
+    manager = FakeManager()
+    report = run_scenario(manager, _parse(_scenario_json()))
+    assert 20 == report.total.requests == len(manager.requests)
+    assert 20 == sum(call.requests for call in report.calls.values())
+    assert (
+        report.calls["count"].requests
+        < report.calls["todo.thrift/TodoService/getTask"].requests
+    )
+    assert {6000} == {request.port for request in manager.requests}
+    assert {"a", "b"} == {
+        request.request_body["taskId"]
+        for request in manager.requests
+        if request.endpoint_name == "getTask"
+    }
+    assert report.total.latency_seconds.max >= report.total.call_seconds.max
+
+
+def test_seeded_runs_make_the_same_calls():
+    def _calls():
+        manager = FakeManager()
+        run_scenario(manager, _parse(_scenario_json()))
+        return sorted(
+            (request.endpoint_name, json.dumps(request.request_body))
+            for request in manager.requests
+        )
+
+    assert _calls() == _calls()
+
+
+def test_invalid_calls_are_refused_up_front():
+    manager = FakeManager(
+        errors=[Error(code=ErrorCode.INVALID_REQUEST, message="nope")]
+    )
+    with pytest.raises(ScenarioError) as error:
+        run_scenario(manager, _parse(_scenario_json()))
+    assert "Call 'todo.thrift/TodoService/getTask' is not valid: nope" == str(
+        error.value
+    )
+    assert [] == manager.requests
+
+
+class OddRefusingManager(FakeManager):
+    def validate_request(self, thrift_request):
+        if thrift_request.request_body["taskId"] % 2:
+            return [Error(code=ErrorCode.INVALID_REQUEST, message="odd")]
+        return []
+
+
+def test_later_invalid_renders_are_not_sent():
+    # Only the first render (sequence 0) is checked up front
+    manager = OddRefusingManager()
+    scenario_json = _scenario_json()
+    scenario_json["calls"] = [
+        {
+            "thrift": "todo",
+            "service": "TodoService",
+            "method": "getTask",
+            "request_body": {"taskId": "${sequence}"},
+        }
+    ]
+    report = run_scenario(manager, _parse(scenario_json))
+    assert {"Success": 10, "InvalidRequest": 10} == report.total.statuses
+    assert list(range(0, 20, 2)) == sorted(
+        request.request_body["taskId"] for request in manager.requests
+    )
+
+
+def test_load_yaml_scenario(tmp_path):
+    path = os.path.join(str(tmp_path), "scenario.yaml")
+    with open(path, "w") as scenario_file:
+        scenario_file.write(
+            "stages:\n"
+            "  - {duration: 5, start_rps: 1, target_rps: 10}\n"
+            "calls:\n"
+            "  - {thrift: todo, service: TodoService, method: ping, port: 6000}\n"
+        )
+    scenario = load_scenario(path)
+    assert [Stage(duration=5, target_rps=10, start_rps=1)] == scenario.stages
+    assert "ping" == scenario.calls[0].endpoint_name
+
+
+def test_scenario_from_postman():
+    collection_path = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        "..",
+        "ThriftExplorer.postman_collection.json",
+    )
+    with open(collection_path) as collection:
+        scenario_json = scenario_from_postman(json.load(collection))
+    assert [
+        ("Creating a Task in the TodoService", "createTask"),
+        ("List Tasks", "listTasks"),
+    ] == [(call["name"], call["method"]) for call in scenario_json["calls"]]
+    create_task = scenario_json["calls"][0]
+    assert {"description": "task 1", "dueDate": "12-12-2012"} == create_task[
+        "request_body"
+    ]
+    assert ("localhost", 6000) == (create_task["host"], create_task["port"])
+
+
+@pytest.mark.uses_server
+def test_run_scenario_against_server(todo_server, example_thrift_directory):
+    scenario = _parse(
+        _scenario_json(stages=[{"duration": 0.2, "start_rps": 20, "target_rps": 80}])
+    )
+    report = run_scenario(ThriftManager(example_thrift_directory), scenario)
+    assert 10 == report.total.requests
+    assert {"Success": report.calls["count"].requests} == report.calls["count"].statuses
+    assert {"NotFound"} == set(report.calls["todo.thrift/TodoService/getTask"].statuses)
@@ -1,5 +1,8 @@
 import datetime
+import gzip
 import json
+import logging
+import time
 
 import pytest
 
@@ -7,6 +10,8 @@ from thrift_explorer import server
 from thrift_explorer.server import (
     DEFAULT_PROTOCOL_ENV,
     DEFAULT_TRANSPORT_ENV,
+    LAZY_LOAD_ENV,
+    RELOAD_INTERVAL_ENV,
     THRIFT_DIRECTORY_ENV,
 )
 from todoserver import service
@@ -103,6 +108,34 @@ def test_get_thrift_definition(flask_client, batman_thrift_text):
     assert response.data == batman_thrift_text.encode("utf-8")
 
 
+def test_get_thrift_definition_gzipped(flask_client, batman_thrift_text):
+    response = flask_client.get("/Batman/", headers={"Accept-Encoding": "gzip"})
+    assert response.status == "200 OK"
+    assert "gzip" == response.headers["Content-Encoding"]
+    assert batman_thrift_text.encode("utf-8") == gzip.decompress(response.data)
+    assert response.headers["ETag"].endswith('-gzip"')
+
+
+def test_get_thrift_definition_not_modified(flask_client):
+    response = flask_client.get("/Batman/")
+    for headers in (
+        {"If-None-Match": response.headers["ETag"]},
+        {"If-Modified-Since": response.headers["Last-Modified"]},
+    ):
+        not_modified = flask_client.get("/Batman/", headers=headers)
+        assert not_modified.status == "304 NOT MODIFIED"
+        assert b"" == not_modified.data
+
+
+def test_get_thrift_definition_bundle(flask_client, batman_thrift_text):
+    response = flask_client.get("/Batman/?bundle=true")
+    assert response.status == "200 OK"
+    bundle = json.loads(response.data)
+    assert "Batman.thrift" == bundle["thrift"]
+    assert ["Batman.thrift", "basethrifts/Core.thrift"] == list(bundle["files"])
+    assert batman_thrift_text == bundle["files"]["Batman.thrift"]
+
+
 def test_service_method_get(flask_client):
     response = flask_client.get("/Batman/BatPuter/getVillain/")
     assert response.status == "200 OK"
@@ -148,6 +181,7 @@ def test_service_method_post(todo_server, todo_client, flask_client):
             "request_body": {},
         },
         "data": 1,
+        "pool_hit": True,
     }
 
     actual = json.loads(response.data)
@@ -156,6 +190,10 @@ def test_service_method_post(todo_server, todo_client, flask_client):
     datetime.datetime.strptime(actual["time_to_connect"], "%H:%M:%S.%f")
     del actual["time_to_make_request"]
     del actual["time_to_connect"]
+    # Every phase of a successful call is timed, validation included
+    timings = actual.pop("timings")
+    assert len(timings) == 7
+    assert all(isinstance(nanoseconds, int) for nanoseconds in timings.values())
     assert response.status == "200 OK"
     assert actual == expected
 
@@ -192,6 +230,7 @@ def test_service_method_post_with_object_arg(todo_server, todo_client, flask_cli
             "request_body": {},
         },
         "data": 1,
+        "pool_hit": True,
     }
 
     actual = json.loads(response.data)
@@ -200,6 +239,7 @@ def test_service_method_post_with_object_arg(todo_server, todo_client, flask_cli
     datetime.datetime.strptime(actual["time_to_connect"], "%H:%M:%S.%f")
     del actual["time_to_make_request"]
     del actual["time_to_connect"]
+    del actual["timings"]
     assert response.status == "200 OK"
     assert actual == expected
 
@@ -265,3 +305,353 @@ def test_invalid_protocol(todo_server, todo_client, flask_client):
             {"code": "INVALID_REQUEST", "message": "'batman!' is not a valid Transport"}
         ]
     }
+
+
+def test_lazy_list_services(example_thrift_directory, monkeypatch):
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, example_thrift_directory)
+    monkeypatch.setenv(LAZY_LOAD_ENV, "true")
+    flask_client = server.create_app().test_client()
+    response = flask_client.get("/")
+    assert response.status == "200 OK"
+    assert [
+        ("Batman.thrift", "BatPuter"),
+        ("todo.thrift", "TodoService"),
+    ] == [
+        (service["thrift"], service["service"])
+        for service in json.loads(response.data)["thrifts"]
+    ]
+    assert flask_client.get("/todo/TodoService/getTask/").status == "200 OK"
+
+
+def test_admin_reload(example_thrift_directory, monkeypatch):
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, example_thrift_directory)
+    response = server.create_app().test_client().post("/_admin/reload/")
+    assert response.status == "200 OK"
+    report = json.loads(response.data)
+    assert [] == report["reloaded"]
+    assert report["seconds"] >= 0
+
+
+def test_load_times_are_logged(example_thrift_directory, caplog):
+    # Start from what Flask leaves the logger at
+    logging.getLogger(server.__name__).setLevel(logging.NOTSET)
+    server.create_app(
+        server.load_config({THRIFT_DIRECTORY_ENV: example_thrift_directory})
+    )
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Loaded todo.thrift in ") for message in messages)
+    assert any(
+        message.startswith("Sharing includes between thrifts saved ")
+        for message in messages
+    )
+
+
+def test_automatic_reloads_are_logged(tmp_path, caplog):
+    logging.getLogger(server.__name__).setLevel(logging.NOTSET)
+    (tmp_path / "ping.thrift").write_text("service Pinger {\n    void ping();\n}\n")
+    server.create_app(
+        server.load_config(
+            {THRIFT_DIRECTORY_ENV: str(tmp_path), RELOAD_INTERVAL_ENV: "0.1"}
+        )
+    )
+    (tmp_path / "pong.thrift").write_text("service Ponger {\n    void pong();\n}\n")
+    deadline = time.monotonic() + 10
+    while not any(
+        record.getMessage().startswith("Reloaded ['pong.thrift']")
+        for record in caplog.records
+    ):
+        assert time.monotonic() < deadline, "no reload was logged"
+        time.sleep(0.05)
+
+
+def test_catalog_etags(flask_client):
+    for path in ("/", "/todo/TodoService/"):
+        response = flask_client.get(path)
+        etag = response.headers["ETag"]
+        assert etag == flask_client.get(path).headers["ETag"]
+        not_modified = flask_client.get(path, headers={"If-None-Match": etag})
+        assert not_modified.status == "304 NOT MODIFIED"
+        assert b"" == not_modified.data
+        changed = flask_client.get(path, headers={"If-None-Match": '"other"'})
+        assert response.data == changed.data
+
+
+def test_catalog_etag_changes_on_reload(tmp_path, monkeypatch):
+    thrift_path = tmp_path / "ping.thrift"
+    thrift_path.write_text("service Pinger {\n    void ping();\n}\n")
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, str(tmp_path))
+    client = server.create_app().test_client()
+    etag = client.get("/").headers["ETag"]
+    (tmp_path / "pong.thrift").write_text("service Ponger {\n    void pong();\n}\n")
+    client.post("/_admin/reload/")
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status == "200 OK"
+    assert ["ping.thrift", "pong.thrift"] == [
+        thrift["thrift"] for thrift in json.loads(response.data)["thrifts"]
+    ]
+
+
+def test_recursive_arg_spec_in_errors(tmp_path, monkeypatch):
+    (tmp_path / "list.thrift").write_text(
+        "struct Link {\n    1: required i32 value;\n    2: optional Link rest;\n}\n"
+        "service Lists {\n    void push(1: Link link);\n}\n"
+    )
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, str(tmp_path))
+    response = (
+        server.create_app()
+        .test_client()
+        .post(
+            "/list/Lists/push/",
+            data=json.dumps(
+                {"host": "127.0.0.1", "port": 6000, "request_body": {"link": {}}}
+            ),
+        )
+    )
+    assert response.status == "400 BAD REQUEST"
+    link = json.loads(response.data)["errors"][0]["arg_spec"]["type_info"]
+    assert "Link" == link["name"]
+    assert {"name": "Link", "ttype": "struct"} == link["fields"][1]["type_info"]
+
+
+def test_watcher_waits_for_fork(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_threads_after_fork", True)
+    app = server.create_app(
+        server.load_config(
+            {THRIFT_DIRECTORY_ENV: str(tmp_path), RELOAD_INTERVAL_ENV: "60"}
+        )
+    )
+    watchers = server.start_background_threads(app)
+    assert ["thrift-reload"] == [watcher.name for watcher in watchers]
+    assert watchers[0].is_alive()
+    assert [] == server.start_background_threads(app)
+
+
+def test_batch_requests(todo_server, todo_client, flask_client):
+    todo_client.createTask("task 1", "12-12-2012")
+    response = flask_client.post(
+        "/_batch/",
+        data=json.dumps(
+            [
+                {
+                    "thrift": "todo",
+                    "service": "TodoService",
+                    "method": "numTasks",
+                    "host": "127.0.0.1",
+                    "port": 6000,
+                },
+                {
+                    "thrift": "todo.thrift",
+                    "service": "TodoService",
+                    "method": "completeTask",
+                    "host": "127.0.0.1",
+                    "port": 6000,
+                    "request_body": {},
+                },
+                {"thrift": "todo.thrift", "service": "TodoService", "port": 6000},
+                {
+                    "thrift": "todo.thrift",
+                    "service": "TodoService",
+                    "method": "ping",
+                    "host": "127.0.0.1",
+                    "port": 6000,
+                },
+            ]
+        ),
+    )
+    assert response.status == "200 OK"
+    results = json.loads(response.data)["results"]
+    assert 4 == len(results)
+    assert ("Success", 1) == (results[0]["status"], results[0]["data"])
+    assert {
+        "errors": [
+            {
+                "arg_spec": {
+                    "field_id": 1,
+                    "name": "taskId",
+                    "type_info": {"ttype": "string"},
+                    "required": True,
+                },
+                "code": "REQUIRED_FIELD_MISSING",
+                "message": "Required Field 'taskId' not found",
+            }
+        ]
+    } == results[1]
+    assert ["INVALID_REQUEST"] == [error["code"] for error in results[2]["errors"]]
+    assert "ping" == results[3]["request"]["endpoint_name"]
+    assert "Success" == results[3]["status"]
+
+
+def test_stream_batch_requests(todo_server, flask_client):
+    item = {"thrift": "todo", "service": "TodoService", "port": 6000}
+    response = flask_client.post(
+        "/_batch/",
+        data=json.dumps(
+            [dict(item, method="ping", host="127.0.0.1"), dict(item, method="ping")] * 3
+        ),
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status == "200 OK"
+    assert response.is_streamed
+    assert "application/x-ndjson; charset=utf-8" == response.content_type
+    *lines, summary = [json.loads(line) for line in response.data.splitlines()]
+    assert [0, 1, 2, 3, 4, 5] == sorted(line["position"] for line in lines)
+    for line in lines:
+        if line["position"] % 2:
+            assert "errors" in line["result"]
+        else:
+            assert "Success" == line["result"]["status"]
+    assert {"results": 6, "invalid": 3, "statuses": {"Success": 3}} == {
+        key: value for key, value in summary["summary"].items() if key != "seconds"
+    }
+
+
+def test_metrics(todo_server, example_thrift_directory, monkeypatch):
+    monkeypatch.setenv(THRIFT_DIRECTORY_ENV, example_thrift_directory)
+    flask_client = server.create_app().test_client()
+    item = {"thrift": "todo", "service": "TodoService", "host": "127.0.0.1"}
+    flask_client.post(
+        "/_batch/",
+        data=json.dumps(
+            [
+                dict(item, method="ping", port=6000),
+                dict(item, method="ping"),
+                dict(item, thrift="made-up", method="ping", port=6000),
+            ]
+        ),
+    )
+    response = flask_client.get("/metrics")
+    assert response.status == "200 OK"
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    lines = response.data.decode("utf-8").splitlines()
+    assert (
+        'thrift_explorer_calls_total{thrift="todo.thrift",service="TodoService",'
+        'method="ping",status="Success"} 1'
+    ) in lines
+    assert (
+        'thrift_explorer_validation_failures_total{thrift="todo.thrift",'
+        'service="TodoService",method="ping",code="INVALID_REQUEST"} 1'
+    ) in lines
+    assert (
+        'thrift_explorer_validation_failures_total{thrift="",service="",method="",'
+        'code="THRIFT_NOT_LOADED"} 1'
+    ) in lines
+    assert 'thrift_explorer_pool_in_use_connections{pool="sync"} 0' in lines
+
+
+def test_batch_items_with_bad_fields(todo_server, flask_client):
+    item = {
+        "thrift": "todo",
+        "service": "TodoService",
+        "host": "127.0.0.1",
+        "port": 6000,
+    }
+    response = flask_client.post(
+        "/_batch/",
+        data=json.dumps(
+            [
+                dict(item, method="completeTask", request_body=[1]),
+                dict(item, method="completeTask"),
+                dict(item, thrift=5, method="ping"),
+                dict(item, method=["ping"]),
+                dict(item, method="ping"),
+            ]
+        ),
+    )
+    assert response.status == "200 OK"
+    results = json.loads(response.data)["results"]
+    assert [
+        {"code": "INVALID_REQUEST", "message": "'request_body' must be an object"}
+    ] == results[0]["errors"]
+    assert ["REQUIRED_FIELD_MISSING"] == [
+        error["code"] for error in results[1]["errors"]
+    ]
+    assert [
+        {"code": "INVALID_REQUEST", "message": "'thrift' must be a string"}
+    ] == results[2]["errors"]
+    assert [
+        {"code": "INVALID_REQUEST", "message": "'method' must be a string"}
+    ] == results[3]["errors"]
+    assert "Success" == results[4]["status"]
+
+
+def test_batch_requests_must_be_a_list(flask_client):
+    response = flask_client.post("/_batch/", data=json.dumps({"thrift": "todo"}))
+    assert response.status == "400 BAD REQUEST"
+    assert json.loads(response.data) == {
+        "errors": [
+            {"code": "INVALID_REQUEST", "message": "Expected a list of requests"}
+        ]
+    }
+
+
+def test_load_test_method(todo_server, flask_client):
+    response = flask_client.post(
+        "/todo/TodoService/getTask/_load_test/",
+        data=json.dumps(
+            {
+                "host": "127.0.0.1",
+                "port": 6000,
+                "request_body": {"taskId": "nope"},
+                "concurrency": 2,
+                "total_requests": 20,
+            }
+        ),
+    )
+    assert response.status == "200 OK"
+    report = json.loads(response.data)
+    assert 20 == report["requests"]
+    assert {"NotFound": 20} == report["statuses"]
+    assert 20 == report["errors"]
+    assert report["throughput"] > 0
+    assert report["call_seconds"]["p50"] <= report["call_seconds"]["max"]
+    assert {"p50", "p90", "p99", "max"} == set(report["connect_seconds"])
+
+
+def test_stream_load_test(todo_server, flask_client):
+    response = flask_client.post(
+        "/todo/TodoService/ping/_load_test/",
+        data=json.dumps(
+            {"host": "127.0.0.1", "port": 6000, "duration": 1.5, "target_rps": 40}
+        ),
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status == "200 OK"
+    *progress, summary = [json.loads(line) for line in response.data.splitlines()]
+    assert progress
+    assert {"progress"} == {key for line in progress for key in line}
+    assert 60 == summary["summary"]["requests"]
+    assert {"Success": 60} == summary["summary"]["statuses"]
+
+
+def test_load_test_concurrency_limited(flask_client):
+    response = flask_client.post(
+        "/todo/TodoService/ping/_load_test/",
+        data=json.dumps(
+            {"host": "127.0.0.1", "port": 6000, "duration": 1, "concurrency": 100000}
+        ),
+    )
+    assert response.status == "400 BAD REQUEST"
+    assert json.loads(response.data) == {
+        "errors": [
+            {
+                "code": "INVALID_REQUEST",
+                "message": "'concurrency' can be at most 64",
+            }
+        ]
+    }
+
+
+def test_load_test_needs_a_limit(flask_client):
+    response = flask_client.post(
+        "/todo/TodoService/ping/_load_test/",
+        data=json.dumps({"host": "127.0.0.1", "port": 6000}),
+    )
+    assert response.status == "400 BAD REQUEST"
+    assert json.loads(response.data) == {
+        "errors": [
+            {
+                "code": "INVALID_REQUEST",
+                "message": "One of 'total_requests' or 'duration' is required",
+            }
+        ]
+    }
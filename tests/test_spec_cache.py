@@ -0,0 +1,67 @@
+import shutil
+
+import pytest
+
+from thrift_explorer import cli
+from thrift_explorer.spec_cache import SpecCache
+from thrift_explorer.thrift_loader import load_thrifts
+
+
+@pytest.fixture
+def thrift_directory(example_thrift_directory, tmp_path):
+    directory = tmp_path / "thrifts"
+    shutil.copytree(example_thrift_directory, str(directory))
+    return directory
+
+
+def test_unchanged_thrifts_load_from_cache(thrift_directory, tmp_path):
+    cache = SpecCache(str(tmp_path / "cache"))
+    first = load_thrifts(str(thrift_directory), cache=cache)
+    assert 0 == first.cache_hits
+    second = load_thrifts(str(thrift_directory), cache=cache)
+    assert 4 == second.cache_hits
+    assert first.service_specs == second.service_specs
+    assert set(first.thrifts) == set(second.thrifts)
+    assert "getTask" in second.thrifts["todo.thrift"].TodoService.thrift_services
+
+
+def test_changed_thrift_is_parsed_again(thrift_directory, tmp_path):
+    cache = SpecCache(str(tmp_path / "cache"))
+    load_thrifts(str(thrift_directory), cache=cache)
+    todo = thrift_directory / "todo.thrift"
+    todo.write_text(todo.read_text().replace("void ping();", "void ping2();"))
+    reloaded = load_thrifts(str(thrift_directory), cache=cache)
+    assert 3 == reloaded.cache_hits
+    assert "ping2" in reloaded.service_specs["todo.thrift"]["TodoService"].endpoints
+
+
+def test_changed_include_invalidates_entry(thrift_directory, tmp_path):
+    cache = SpecCache(str(tmp_path / "cache"))
+    load_thrifts(str(thrift_directory), cache=cache)
+    todo_path = str(thrift_directory / "todo.thrift")
+    assert cache.get(todo_path) is not None
+    exceptions = thrift_directory / "basethrifts" / "Exceptions.thrift"
+    exceptions.write_text("exception NotFound {\n    1: optional string why;\n}")
+    assert cache.get(todo_path) is None
+
+
+def test_build_cache_cli(thrift_directory, tmp_path, capsys):
+    cache_directory = str(tmp_path / "cache")
+    assert 0 == cli.main(
+        [
+            "build-cache",
+            "--thrift-directory",
+            str(thrift_directory),
+            "--cache-directory",
+            cache_directory,
+            "--workers",
+            "1",
+        ]
+    )
+    assert "Cached 4 thrift files" in capsys.readouterr().out
+    assert (
+        4
+        == load_thrifts(
+            str(thrift_directory), cache=SpecCache(cache_directory)
+        ).cache_hits
+    )
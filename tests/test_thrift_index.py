@@ -0,0 +1,45 @@
+from thrift_explorer.thrift_index import index_thrifts
+from thrift_explorer.thrift_loader import find_thrift_paths
+
+
+def test_index_matches_loaded_specs(example_thrift_manager, example_thrift_directory):
+    index = index_thrifts(find_thrift_paths(example_thrift_directory))
+    assert set(example_thrift_manager.service_specs) == set(index)
+    for thrift_file, services in example_thrift_manager.service_specs.items():
+        for service_name, service in services.items():
+            assert list(service.endpoints) == index[thrift_file][service_name]
+
+
+def test_index_follows_extends_and_skips_comments(tmp_path):
+    (tmp_path / "base.thrift").write_text("""
+service Base {
+    void ping()
+}
+""")
+    (tmp_path / "child.thrift").write_text("""
+include "base.thrift"
+
+exception Oops {
+    1: string why
+}
+
+/* service Commented { void nope() } */
+service Child extends base.Base {
+    // void alsoNope()
+    list<map<string, i32>> counts(1: i32 limit, 2: string name = "a(b") throws (
+        1: Oops oops
+    ),
+    oneway void fire(1: i32 times);
+}
+
+service GrandChild extends Child {
+    string hello();
+}
+""")
+    assert {
+        "base.thrift": {"Base": ["ping"]},
+        "child.thrift": {
+            "Child": ["counts", "fire", "ping"],
+            "GrandChild": ["hello", "counts", "fire", "ping"],
+        },
+    } == index_thrifts([str(tmp_path / "base.thrift"), str(tmp_path / "child.thrift")])
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from thrift_explorer.communication_models import ThriftRequest
+from thrift_explorer.thrift_loader import (
+    find_thrift_paths,
+    load_thrift_paths,
+    load_thrifts,
+)
+from thrift_explorer.thrift_manager import ThriftManager
+
+
+def test_find_thrift_paths(example_thrift_directory):
+    assert {
+        "Batman.thrift",
+        "todo.thrift",
+        "Core.thrift",
+        "Exceptions.thrift",
+    } == {
+        os.path.basename(path) for path in find_thrift_paths(example_thrift_directory)
+    }
+
+
+def test_parallel_load_matches_serial(example_thrift_directory):
+    serial = load_thrifts(example_thrift_directory)
+    parallel = load_thrifts(example_thrift_directory, workers=2)
+    assert serial.service_specs == parallel.service_specs
+    assert serial.thrift_paths == parallel.thrift_paths
+    assert set(serial.thrifts) == set(parallel.thrifts)
+    assert set(serial.timings) == set(parallel.timings)
+    assert all(seconds > 0 for seconds in parallel.timings.values())
+
+
+@pytest.mark.uses_server
+def test_parallel_loaded_manager_makes_calls(todo_server, example_thrift_directory):
+    manager = ThriftManager(example_thrift_directory, load_workers=2)
+    request = ThriftRequest(
+        thrift_file="todo.thrift",
+        service_name="TodoService",
+        endpoint_name="getTask",
+        host="127.0.0.1",
+        port=6000,
+        protocol="TBinaryProtocol",
+        transport="TBufferedTransport",
+        request_body={"taskId": "whatever"},
+    )
+    assert [] == manager.validate_request(request)
+    response = manager.make_request(request)
+    assert response.status == "NotFound"
+    assert response.data == {"__thrift_struct_class__": "NotFound"}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_includes_are_parsed_once(example_thrift_directory, workers):
+    loaded = load_thrifts(example_thrift_directory, workers=workers)
+    # Core and Exceptions are included by Batman and todo as well as
+    # being loaded themselves
+    assert 4 == loaded.parses
+    assert 2 == loaded.parses_avoided
+    assert loaded.thrifts["Batman.thrift"].Core is loaded.thrifts["Core.thrift"]
+    assert (
+        loaded.thrifts["todo.thrift"].Exceptions is loaded.thrifts["Exceptions.thrift"]
+    )
+
+
+def test_includes_are_shared_with_given_modules(example_thrift_directory):
+    first = load_thrifts(example_thrift_directory)
+    core_path = first.thrift_paths["Core.thrift"]
+    batman = load_thrift_paths(
+        [first.thrift_paths["Batman.thrift"]],
+        modules={os.path.normpath(core_path): first.thrifts["Core.thrift"]},
+    )
+    assert 1 == batman.parses
+    assert batman.thrifts["Batman.thrift"].Core is first.thrifts["Core.thrift"]
@@ -1,7 +1,9 @@
+import threading
+
 import pytest
 
 from testing_utils import load_thrift_from_testdir
-from thrift_explorer import thrift_manager
+from thrift_explorer import thrift_manager, thrift_state
 from thrift_explorer.communication_models import (
     Error,
     ErrorCode,
@@ -197,3 +199,43 @@ def test_thrift_definition(example_thrift_manager, batman_thrift_text):
     assert batman_thrift_text == example_thrift_manager.thrift_definition(
         "Batman.thrift"
     )
+
+
+def test_lazy_manager_lists_without_loading(example_thrift_directory):
+    manager = thrift_manager.ThriftManager(example_thrift_directory, lazy=True)
+    assert {} == manager.load_timings
+    assert sorted(manager.list_thrift_services()) == ["Batman.thrift", "todo.thrift"]
+    assert "getTask" in manager.list_methods("todo.thrift", "TodoService")
+    assert {} == manager.load_timings
+
+
+def test_lazy_manager_loads_on_first_use(example_thrift_directory):
+    manager = thrift_manager.ThriftManager(example_thrift_directory, lazy=True)
+    assert manager.get_method("todo.thrift", "TodoService", "getTask").name == "getTask"
+    assert ["todo.thrift"] == list(manager.load_timings)
+    assert [] == manager.validate_request(
+        _build_request(endpoint_name="getTask", request_body={"taskId": "1"})
+    )
+    assert manager.get_thrift("notathrift.thrift") is None
+    assert ["todo.thrift"] == list(manager.load_timings)
+
+
+def test_lazy_manager_loads_once(example_thrift_directory, monkeypatch):
+    manager = thrift_manager.ThriftManager(example_thrift_directory, lazy=True)
+    loads = []
+    real_load_thrift = thrift_state.load_thrift
+
+    def _counting_load_thrift(thrift_path, **kwargs):
+        loads.append(thrift_path)
+        return real_load_thrift(thrift_path, **kwargs)
+
+    monkeypatch.setattr(thrift_state, "load_thrift", _counting_load_thrift)
+    threads = [
+        threading.Thread(target=manager.get_thrift, args=("Batman.thrift",))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 1 == len(loads)
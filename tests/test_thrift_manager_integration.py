@@ -1,8 +1,14 @@
+import asyncio
 import datetime
+import socket
+import threading
+import time
 
 import pytest
+from thriftpy2.rpc import make_server
 
 from thrift_explorer.communication_models import ThriftRequest
+from thrift_explorer.connection_pool import ConnectionPool
 from todoserver import service
 
 pytestmark = pytest.mark.uses_server
@@ -160,6 +166,43 @@ def test_handle_unimplemented_method(todo_server, example_thrift_manager):
     assert response.time_to_make_request > datetime.timedelta()
 
 
+def test_connections_are_pooled(todo_server, example_thrift_manager):
+    request = _build_request("ping", {})
+    example_thrift_manager.make_request(request)
+    response = example_thrift_manager.make_request(request)
+    assert response.status == "Success"
+    assert response.pool_hit
+
+
+@pytest.fixture
+def garbled_server_port():
+    # Answers every call with a message of an unknown protocol version
+    # and more bytes after it
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def _serve():
+        with listener:
+            connection, _ = listener.accept()
+            with connection:
+                while connection.recv(4096):
+                    connection.sendall(b"\x80\x02\x00\x01" + b"\x00" * 16)
+
+    threading.Thread(target=_serve, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def test_protocol_error_discards_connection(
+    garbled_server_port, example_thrift_manager
+):
+    pool = ConnectionPool()
+    request = _build_request("ping", {}, port=garbled_server_port)
+    response = example_thrift_manager.make_request(request, connection_pool=pool)
+    assert "ServerError" == response.status
+    assert {"hits": 0, "misses": 1, "idle": 0, "in_use": 0} == pool.stats()
+
+
 def test_invalid_port(todo_server, example_thrift_manager):
     request = _build_request("ping", {}, port=9999)
     assert [] == example_thrift_manager.validate_request(request)
@@ -170,5 +213,159 @@ def test_invalid_port(todo_server, example_thrift_manager):
     )
     assert response.request == request
     assert response.status == "ConnectionError"
+    assert not response.pool_hit
     assert response.time_to_connect is None
     assert response.time_to_make_request is None
+
+
+def test_make_requests_keeps_order(todo_server, todo_client, example_thrift_manager):
+    task = todo_client.createTask("task 1", "12-12-2012")
+    requests = [
+        _build_request("getTask", {"taskId": task.taskId}),
+        _build_request("numTasks", {}),
+        _build_request("getTask", {"taskId": "nope"}),
+    ] * 5
+    responses = example_thrift_manager.make_requests(requests)
+    assert requests == [response.request for response in responses]
+    assert ["Success", "Success", "NotFound"] * 5 == [
+        response.status for response in responses
+    ]
+
+
+def test_make_request_async(todo_server, todo_client, example_thrift_manager):
+    task = todo_client.createTask("task 1", "12-12-2012")
+
+    async def _make_calls():
+        return [
+            await example_thrift_manager.make_request_async(
+                _build_request("getTask", {"taskId": task.taskId})
+            ),
+            await example_thrift_manager.make_request_async(
+                _build_request("getTask", {"taskId": "nope"})
+            ),
+        ]
+
+    found, not_found = asyncio.run(_make_calls())
+    assert "Success" == found.status
+    assert "task 1" == found.data["description"]
+    assert "NotFound" == not_found.status
+    assert {"__thrift_struct_class__": "NotFound"} == not_found.data
+    assert not_found.pool_hit
+    assert not_found.time_to_make_request > datetime.timedelta()
+
+
+def test_make_request_async_cannot_connect(example_thrift_manager):
+    response = asyncio.run(
+        example_thrift_manager.make_request_async(_build_request("ping", {}, port=9999))
+    )
+    assert "ConnectionError" == response.status
+    assert response.data.startswith("Failed to make client connection")
+
+
+def test_make_requests_async_keeps_order(
+    todo_server, todo_client, example_thrift_manager
+):
+    task = todo_client.createTask("task 1", "12-12-2012")
+    requests = [
+        _build_request("getTask", {"taskId": task.taskId}),
+        _build_request("numTasks", {}),
+        _build_request("getTask", {"taskId": "nope"}),
+    ] * 5
+    responses = asyncio.run(example_thrift_manager.make_requests_async(requests))
+    assert requests == [response.request for response in responses]
+    assert ["Success", "Success", "NotFound"] * 5 == [
+        response.status for response in responses
+    ]
+
+
+def test_iter_requests(todo_server, example_thrift_manager):
+    requests = [
+        _build_request("numTasks", {}),
+        _build_request("getTask", {"taskId": "nope"}),
+    ] * 10
+    responses = dict(example_thrift_manager.iter_requests(iter(requests)))
+    assert list(range(20)) == sorted(responses)
+    assert requests == [responses[position].request for position in range(20)]
+    assert ["Success", "NotFound"] * 10 == [
+        responses[position].status for position in range(20)
+    ]
+
+
+def test_iter_requests_async(todo_server, example_thrift_manager):
+    requests = [
+        _build_request("numTasks", {}),
+        _build_request("getTask", {"taskId": "nope"}),
+    ] * 10
+
+    async def _collect():
+        return {
+            position: response
+            async for position, response in example_thrift_manager.iter_requests_async(
+                requests
+            )
+        }
+
+    responses = asyncio.run(_collect())
+    assert requests == [responses[position].request for position in range(20)]
+
+
+class _SlowDispatcher(object):
+    def ping(self):
+        time.sleep(0.2)
+
+
+@pytest.fixture(scope="module")
+def slow_server(todo_thrift):
+    server = make_server(todo_thrift.TodoService, _SlowDispatcher(), "127.0.0.1", 6001)
+    threading.Thread(target=server.serve, daemon=True).start()
+    yield
+    server.close()
+
+
+def _assert_waited_on_server(response):
+    timings = response.timings
+    assert response.status == "Success"
+    assert timings.validation_ns is None
+    assert timings.server_wait_ns >= 200_000_000
+    for phase in (
+        timings.request_translation_ns,
+        timings.connect_ns,
+        timings.send_ns,
+        timings.receive_ns,
+        timings.response_translation_ns,
+    ):
+        assert 0 <= phase < 100_000_000
+    assert response.time_to_make_request == datetime.timedelta(
+        microseconds=(
+            timings.send_ns
+            + timings.server_wait_ns
+            + timings.receive_ns
+            + timings.response_translation_ns
+        )
+        / 1000
+    )
+
+
+def test_call_timings(slow_server, example_thrift_manager):
+    _assert_waited_on_server(
+        example_thrift_manager.make_request(_build_request("ping", {}, port=6001))
+    )
+
+
+def test_call_timings_async(slow_server, example_thrift_manager):
+    _assert_waited_on_server(
+        asyncio.run(
+            example_thrift_manager.make_request_async(
+                _build_request("ping", {}, port=6001)
+            )
+        )
+    )
+
+
+def test_call_timings_cannot_connect(example_thrift_manager):
+    response = example_thrift_manager.make_request(
+        _build_request("ping", {}, port=9999)
+    )
+    assert response.status == "ConnectionError"
+    assert response.timings.connect_ns > 0
+    assert response.timings.send_ns is None
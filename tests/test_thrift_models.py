@@ -243,3 +243,19 @@ def test_multiple_errors(superhero_struct):
         "Required field 'name' missing",
         "Error with field 'villains': '['Index 1: Expected str but got int']'",
     ]
+
+
+def _linked_struct(value_type):
+    link = TStruct(name="Link", fields=[])
+    link.fields.extend(
+        [
+            ThriftSpec(field_id=1, name="value", type_info=value_type, required=True),
+            ThriftSpec(field_id=2, name="rest", type_info=link, required=False),
+        ]
+    )
+    return link
+
+
+def test_recursive_struct_equality():
+    assert _linked_struct(TI32()) == _linked_struct(TI32())
+    assert _linked_struct(TI32()) != _linked_struct(TString())
@@ -251,3 +251,38 @@ def test_exception():
     assert expected == thrift_parser._parse_thrift_endpoint(
         exceptional_thrift.__thrift_meta__["services"][0], "ping"
     )
+
+
+def test_structs_parsed_once():
+    struct_thrift = load_thrift_from_testdir("structThrift.thrift")
+    specs = thrift_parser.parse_service_specs({"structThrift.thrift": struct_thrift})
+    endpoints = specs["structThrift.thrift"]["StructService"].endpoints
+    returned = endpoints["getMyStruct"].results[0].type_info
+    sent = endpoints["sendMyStruct"].args[0].type_info
+    assert returned is sent
+    # Basic types are shared too
+    assert returned.fields[0].type_info is (
+        returned.fields[1].type_info.fields[1].type_info.value_type
+    )
+
+
+def test_specs_have_no_instance_dict():
+    struct_thrift = load_thrift_from_testdir("structThrift.thrift")
+    endpoint = thrift_parser._parse_thrift_endpoint(
+        struct_thrift.__thrift_meta__["services"][0], "getMyStruct"
+    )
+    for spec in (endpoint, endpoint.results[0], endpoint.results[0].type_info):
+        assert not hasattr(spec, "__dict__")
+
+
+def test_recursive_structs():
+    recursive_thrift = load_thrift_from_testdir("recursive.thrift")
+    service = recursive_thrift.__thrift_meta__["services"][0]
+    node = thrift_parser._parse_thrift_endpoint(service, "echoTree").args[0].type_info
+    assert "Node" == node.name
+    assert node is node.fields[1].type_info
+    assert node is node.fields[2].type_info.value_type
+    ping = thrift_parser._parse_thrift_endpoint(service, "rally").args[0].type_info
+    pong = ping.fields[0].type_info
+    assert ("Ping", "Pong") == (ping.name, pong.name)
+    assert ping is pong.fields[0].type_info
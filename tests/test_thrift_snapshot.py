@@ -0,0 +1,106 @@
+import os
+import pickle
+
+import pytest
+import thriftpy2
+
+from thrift_explorer.thrift_parser import parse_service_specs
+from thrift_explorer.thrift_snapshot import (
+    ClassRef,
+    UnsupportedSnapshot,
+    rebuild_module,
+    snapshot_module,
+)
+
+
+def _test_thrift_path(thrift_file):
+    return os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "test-thrifts", thrift_file
+    )
+
+
+def _round_trip(thrift_path):
+    module = thriftpy2.load(thrift_path)
+    snapshots = pickle.loads(pickle.dumps(snapshot_module(module)))
+    return module, rebuild_module(snapshots, thrift_path)
+
+
+@pytest.mark.parametrize(
+    "thrift_file",
+    [
+        "simpleType.thrift",
+        "structThrift.thrift",
+        "enum.thrift",
+        "exceptional.thrift",
+        "turducken.thrift",
+        "nested.thrift",
+        "recursive.thrift",
+    ],
+)
+def test_rebuilt_module_parses_the_same(thrift_file):
+    module, rebuilt = _round_trip(_test_thrift_path(thrift_file))
+    assert parse_service_specs({thrift_file: module}) == parse_service_specs(
+        {thrift_file: rebuilt}
+    )
+
+
+def test_snapshot_includes(example_thrift_directory):
+    batman_path = os.path.join(example_thrift_directory, "Batman.thrift")
+    snapshots = snapshot_module(thriftpy2.load(batman_path))
+    assert {
+        os.path.normpath(batman_path),
+        os.path.normpath(
+            os.path.join(example_thrift_directory, "basethrifts/Core.thrift")
+        ),
+    } == set(snapshots)
+
+
+def test_rebuilt_includes_are_shared(example_thrift_directory):
+    todo_path = os.path.join(example_thrift_directory, "todo.thrift")
+    exceptions_path = os.path.join(
+        example_thrift_directory, "basethrifts", "Exceptions.thrift"
+    )
+    modules = {}
+    todo = rebuild_module(
+        snapshot_module(thriftpy2.load(todo_path)), todo_path, modules
+    )
+    assert todo.Exceptions is modules[os.path.normpath(exceptions_path)]
+    assert todo.TodoService.getTask_result.thrift_spec[1][2] is todo.Exceptions.NotFound
+    assert issubclass(todo.Exceptions.NotFound, thriftpy2.thrift.TException)
+
+
+def test_rebuilt_struct_instances():
+    module, rebuilt = _round_trip(_test_thrift_path("structThrift.thrift"))
+    struct = rebuilt.MyStruct(4, rebuilt.MyOtherStruct(id="a", ints=[1]))
+    assert 4 == struct.myIntStruct
+    assert [1] == struct.myOtherStruct.ints
+    assert "MyStruct" == struct.__class__.__name__
+
+
+def test_enum_values():
+    module, rebuilt = _round_trip(_test_thrift_path("enum.thrift"))
+    assert module.Superhero._NAMES_TO_VALUES == rebuilt.Superhero._NAMES_TO_VALUES
+    assert module.Superhero._VALUES_TO_NAMES == rebuilt.Superhero._VALUES_TO_NAMES
+    assert 10 == rebuilt.Superhero.SPIDERMAN
+
+
+def test_class_refs_are_plain_data():
+    snapshots = snapshot_module(
+        thriftpy2.load(_test_thrift_path("structThrift.thrift"))
+    )
+    (snapshot,) = snapshots.values()
+    _, _, (thrift_spec, _) = snapshot["structs"][1]
+    assert (
+        ClassRef(
+            thrift_file=os.path.normpath(_test_thrift_path("structThrift.thrift")),
+            name="MyOtherStruct",
+        )
+        == dict(thrift_spec)[2][2]
+    )
+
+
+def test_unsupported_default():
+    module = thriftpy2.load(_test_thrift_path("structThrift.thrift"))
+    module.MyStruct.default_spec = [("myIntStruct", object())]
+    with pytest.raises(UnsupportedSnapshot):
+        snapshot_module(module)
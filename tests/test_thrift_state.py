@@ -0,0 +1,111 @@
+import shutil
+
+import pytest
+
+from thrift_explorer.thrift_manager import ThriftManager
+from thrift_explorer.thrift_state import ReloadError
+
+
+@pytest.fixture
+def thrift_directory(example_thrift_directory, tmp_path):
+    directory = tmp_path / "thrifts"
+    shutil.copytree(example_thrift_directory, str(directory))
+    return directory
+
+
+def _edit(path, old, new):
+    path.write_text(path.read_text().replace(old, new))
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_reload_without_changes(thrift_directory, lazy):
+    manager = ThriftManager(str(thrift_directory), lazy=lazy)
+    state = manager._state
+    report = manager.reload()
+    assert ([], [], [], []) == (
+        report.added,
+        report.changed,
+        report.removed,
+        report.reloaded,
+    )
+    assert state is manager._state
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_reload_changed_thrift(thrift_directory, lazy):
+    manager = ThriftManager(str(thrift_directory), lazy=lazy)
+    old_specs = manager.service_specs
+    manager.get_thrift("todo.thrift")
+    batman = manager.get_thrift("Batman.thrift")
+    _edit(thrift_directory / "todo.thrift", "void ping();", "void ping2();")
+    report = manager.reload()
+    assert ["todo.thrift"] == report.changed
+    assert ["todo.thrift"] == report.reloaded
+    assert "ping2" in manager.list_methods("todo.thrift", "TodoService")
+    assert manager.get_method("todo.thrift", "TodoService", "ping2")
+    assert not manager.get_method("todo.thrift", "TodoService", "ping")
+    # Untouched thrifts are carried over as is
+    assert batman is manager.get_thrift("Batman.thrift")
+    # and anyone holding the old state still sees the old thrift
+    assert "ping" in old_specs["todo.thrift"]["TodoService"].endpoints
+
+
+class RecordingPool(object):
+    def __init__(self):
+        self.retired = []
+
+    def retire_services(self, services):
+        self.retired.extend(services)
+
+
+def test_reload_retires_replaced_services(thrift_directory):
+    pool = RecordingPool()
+    async_pool = RecordingPool()
+    manager = ThriftManager(
+        str(thrift_directory), connection_pool=pool, async_connection_pool=async_pool
+    )
+    old_service = manager._state.thrifts["todo.thrift"].TodoService
+    manager.reload()
+    assert [] == pool.retired
+    _edit(thrift_directory / "todo.thrift", "void ping();", "void ping2();")
+    manager.reload()
+    assert [old_service] == pool.retired == async_pool.retired
+
+
+def test_reload_reloads_includers(thrift_directory):
+    manager = ThriftManager(str(thrift_directory))
+    _edit(
+        thrift_directory / "basethrifts" / "Exceptions.thrift",
+        "}",
+        "    2: optional string why\n}",
+    )
+    report = manager.reload()
+    assert ["Exceptions.thrift"] == report.changed
+    assert ["Exceptions.thrift", "todo.thrift"] == report.reloaded
+    not_found = manager._thrifts["todo.thrift"].Exceptions.NotFound
+    assert "why" in [spec[1] for spec in not_found.thrift_spec.values()]
+
+
+def test_reload_added_and_removed(thrift_directory, test_thrift_directory):
+    manager = ThriftManager(str(thrift_directory))
+    (thrift_directory / "Batman.thrift").unlink()
+    shutil.copy(
+        "{}/simpleType.thrift".format(test_thrift_directory), str(thrift_directory)
+    )
+    report = manager.reload()
+    assert ["simpleType.thrift"] == report.added
+    assert ["Batman.thrift"] == report.removed
+    assert manager.get_thrift("Batman.thrift") is None
+    assert "TestService" in manager.list_thrift_services()["simpleType.thrift"]
+
+
+def test_failed_reload_keeps_serving(thrift_directory):
+    manager = ThriftManager(str(thrift_directory))
+    state = manager._state
+    _edit(thrift_directory / "todo.thrift", "void ping();", "void ping(;")
+    with pytest.raises(ReloadError):
+        manager.reload()
+    assert state is manager._state
+    assert manager.get_method("todo.thrift", "TodoService", "ping")
+    _edit(thrift_directory / "todo.thrift", "void ping(;", "void ping();")
+    assert ["todo.thrift"] == manager.reload().reloaded
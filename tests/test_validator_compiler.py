@@ -0,0 +1,189 @@
+import pytest
+
+from testing_utils import load_thrift_from_testdir
+from thrift_explorer.communication_models import ErrorCode, FieldError
+from thrift_explorer.thrift_models import (
+    TI16,
+    TI32,
+    TI64,
+    ServiceEndpoint,
+    TBinary,
+    TBool,
+    TByte,
+    TDouble,
+    TEnum,
+    ThriftSpec,
+    TList,
+    TMap,
+    TSet,
+    TString,
+    TStruct,
+)
+from thrift_explorer.thrift_parser import parse_service_specs
+from thrift_explorer.validator_compiler import (
+    MAX_NESTING_DEPTH,
+    compile_check,
+    compile_request_validator,
+)
+
+_ANIMALS = TEnum(
+    name="Animals",
+    names_to_values={"bird": 0, "dog": 2},
+    values_to_names={0: "bird", 2: "dog"},
+)
+
+_HERO = TStruct(
+    name="super_hero",
+    fields=[
+        ThriftSpec(field_id=1, name="name", type_info=TString(), required=True),
+        ThriftSpec(
+            field_id=2,
+            name="villains",
+            type_info=TList(value_type=TString()),
+            required=False,
+        ),
+    ],
+)
+
+
+@pytest.mark.parametrize(
+    "spec_type, raw_arg",
+    [
+        (TString(), "Batman"),
+        (TString(), 4),
+        (TBool(), True),
+        (TBool(), 1),
+        (TBinary(), b"bat"),
+        (TBinary(), "bat"),
+        (TByte(), 127),
+        (TByte(), 128),
+        (TI16(), -32769),
+        (TI32(), 4),
+        (TI64(), "4"),
+        (TDouble(), 4),
+        (TDouble(), 4.5),
+        (TDouble(), "4.5"),
+        (_ANIMALS, "dog"),
+        (_ANIMALS, 2),
+        (_ANIMALS, "bird"),
+        (_ANIMALS, "cat"),
+        (TList(value_type=TI32()), [1, 2, 3]),
+        (TList(value_type=TI32()), [1, "2", 3]),
+        (TList(value_type=TI32()), {1, 2}),
+        (TSet(value_type=TString()), {"a", "b"}),
+        (TSet(value_type=TString()), {"a", 1}),
+        (TMap(key_type=TString(), value_type=TI16()), {"a": 1}),
+        (TMap(key_type=TString(), value_type=TI16()), {1: 1}),
+        (TMap(key_type=TString(), value_type=TI16()), {"a": 99999}),
+        (TMap(key_type=TString(), value_type=TI16()), []),
+        (_HERO, {"name": "Batman", "villains": ["Joker"]}),
+        (_HERO, {"name": "Batman"}),
+        (_HERO, {"villains": ["Joker"]}),
+        (_HERO, {"name": "Batman", "villains": ["Joker", 4]}),
+        (_HERO, "Batman"),
+    ],
+)
+def test_check_matches_validate_arg(spec_type, raw_arg):
+    assert compile_check(spec_type)(raw_arg) == (not spec_type.validate_arg(raw_arg))
+
+
+def _hero_endpoint():
+    return ServiceEndpoint(
+        name="saveHero",
+        args=[
+            ThriftSpec(field_id=1, name="hero", type_info=_HERO, required=True),
+            ThriftSpec(field_id=2, name="rank", type_info=TI32(), required=False),
+        ],
+        results=[],
+    )
+
+
+def test_valid_request_body():
+    assert [] == compile_request_validator(_hero_endpoint())(
+        {"hero": {"name": "Batman"}, "rank": 1}
+    )
+
+
+def test_invalid_request_body_keeps_messages():
+    endpoint = _hero_endpoint()
+    assert [
+        FieldError(
+            arg_spec=endpoint.args[0],
+            code=ErrorCode.REQUIRED_FIELD_MISSING,
+            message="Required Field 'hero' not found",
+        ),
+        FieldError(
+            arg_spec=endpoint.args[1],
+            code=ErrorCode.FIELD_VALIDATION_ERROR,
+            message="Expected int but got str",
+        ),
+    ] == compile_request_validator(endpoint)({"rank": "1"})
+
+
+def test_invalid_nested_struct_keeps_messages():
+    endpoint = _hero_endpoint()
+    assert [
+        FieldError(
+            arg_spec=endpoint.args[0],
+            code=ErrorCode.FIELD_VALIDATION_ERROR,
+            message=[
+                "Error with field 'villains': '['Index 1: Expected str but got int']'"
+            ],
+        )
+    ] == compile_request_validator(endpoint)(
+        {"hero": {"name": "Batman", "villains": ["Joker", 4]}}
+    )
+
+
+def test_nested_thrift_request_body():
+    nested_thrift = load_thrift_from_testdir("nested.thrift")
+    endpoint = parse_service_specs({"nested.thrift": nested_thrift})["nested.thrift"][
+        "ForestService"
+    ].endpoints["plantTree"]
+    validate = compile_request_validator(endpoint)
+    leaf = {"name": "oak leaf", "color": "GREEN", "values": [1, 2]}
+    body = {"tree": {"trunk": {"branches": [{"leaves": [leaf]}]}}}
+    assert [] == validate(body)
+    leaf["values"].append("three")
+    assert 1 == len(validate(body))
+
+
+def _tree_endpoint():
+    recursive_thrift = load_thrift_from_testdir("recursive.thrift")
+    return parse_service_specs({"recursive.thrift": recursive_thrift})[
+        "recursive.thrift"
+    ]["TreeService"].endpoints["echoTree"]
+
+
+def _linked_nodes(length):
+    node = {"value": "0"}
+    for position in range(1, length):
+        node = {"value": str(position), "following": node}
+    return node
+
+
+def test_recursive_request_body():
+    endpoint = _tree_endpoint()
+    validate = compile_request_validator(endpoint)
+    tree = {"value": "root", "children": [{"value": "a"}, {"value": "b"}]}
+    tree["children"][0]["following"] = {"value": "c", "children": []}
+    assert [] == validate({"root": tree})
+    tree["children"][0]["following"]["children"].append({"value": 4})
+    assert 1 == len(validate({"root": tree}))
+    node = endpoint.args[0].type_info
+    assert not compile_check(node)({"value": "a", "following": {"children": []}})
+
+
+def test_recursive_request_body_depth_limited():
+    endpoint = _tree_endpoint()
+    validate = compile_request_validator(endpoint)
+    assert [] == validate({"root": _linked_nodes(MAX_NESTING_DEPTH)})
+    assert [
+        FieldError(
+            arg_spec=endpoint.args[0],
+            code=ErrorCode.FIELD_VALIDATION_ERROR,
+            message="Nested more than {} deep".format(MAX_NESTING_DEPTH),
+        )
+    ] == validate({"root": _linked_nodes(MAX_NESTING_DEPTH + 1)})
+    # Far deeper than the checks could recurse
+    assert 1 == len(validate({"root": _linked_nodes(10000)}))
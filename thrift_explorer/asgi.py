@@ -0,0 +1,3 @@
+from thrift_explorer import asgi_server
+
+application = asgi_server.create_asgi_app()
@@ -0,0 +1,271 @@
+"""
+The app from server.py as an ASGI application.
+
+It serves the same routes from the same views (see views) and takes the
+same environment variables. The difference is requests out to thrift
+services are made with ThriftManager.make_request_async, so a slow
+upstream holds up a coroutine rather than a worker thread.
+
+There is no framework underneath, run it with any ASGI server
+    uvicorn thrift_explorer.asgi:application
+"""
+import asyncio
+import json
+import logging
+from functools import partial
+from urllib.parse import parse_qs
+
+from thrift_explorer.load_test import run_load_test, stream_load_test
+from thrift_explorer.server import build_views, load_config
+from thrift_explorer.views import (
+    NDJSON_CONTENT_TYPE,
+    TEXT_CONTENT_TYPE,
+    BatchStream,
+    invalid_request_response,
+    parse_flag,
+    wants_ndjson,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _text_response(message, status):
+    return message, status, TEXT_CONTENT_TYPE
+
+
+async def _read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(body)
+
+
+def _header(scope, header):
+    # ASGI servers hand over header names in lower case
+    for name, value in scope.get("headers", []):
+        if name == header:
+            return value.decode("latin-1")
+    return None
+
+
+async def _in_executor(lines):
+    """
+    Iterates over lines, a blocking iterator, on a thread
+    """
+    loop = asyncio.get_running_loop()
+    finished = object()
+    while True:
+        line = await loop.run_in_executor(None, next, lines, finished)
+        if line is finished:
+            return
+        yield line
+
+
+async def _send_response(send, response):
+    body, status, headers = response
+    raw_headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers.items()
+    ]
+    if not isinstance(body, (str, bytes)):
+        await _send_stream(send, body, status, raw_headers)
+        return
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send(
+        {"type": "http.response.start", "status": status, "headers": raw_headers}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_stream(send, lines, status, raw_headers):
+    """
+    Sends lines, an async iterator of strings, as they come. Without a
+    content-length the server sends the response chunked
+    """
+    await send(
+        {"type": "http.response.start", "status": status, "headers": raw_headers}
+    )
+    async for line in lines:
+        await send(
+            {
+                "type": "http.response.body",
+                "body": line.encode("utf-8"),
+                "more_body": True,
+            }
+        )
+    await send({"type": "http.response.body", "body": b""})
+
+
+class ThriftExplorerApp(object):
+    """
+    ASGI application serving views, a ThriftExplorerViews
+
+    Thrift lookups and validation are quick so they run on the event loop,
+    a reload parses thrifts so it runs on a thread
+    """
+
+    def __init__(self, views):
+        self.views = views
+        self.thrift_manager = views.thrift_manager
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            response = await self._dispatch(scope, receive)
+            await _send_response(send, response)
+        else:
+            raise ValueError("Unsupported scope type {}".format(scope["type"]))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.thrift_manager.async_connection_pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _find_route(self, parts):
+        """
+        Returns a dict of http method to the coroutine function handling
+        it, or None if nothing is routed to parts
+        """
+        if not parts:
+            return {"GET": self._list_services}
+        if parts == ["metrics"]:
+            return {"GET": self._metrics}
+        if parts == ["_admin", "reload"]:
+            return {"POST": self._reload_thrifts}
+        if parts == ["_batch"]:
+            return {"POST": self._batch_requests}
+        if len(parts) == 1:
+            return {"GET": self._get_thrift_definition}
+        if len(parts) == 2:
+            return {"GET": self._get_service_info}
+        if len(parts) == 3:
+            return {"GET": self._get_method_template, "POST": self._call_method}
+        if len(parts) == 4 and parts[3] == "_load_test":
+            return {"POST": self._load_test_method}
+        return None
+
+    async def _dispatch(self, scope, receive):
+        # Paths end in a slash like the flask routes, but do not insist on it
+        parts = [part for part in scope["path"].split("/") if part]
+        route = self._find_route(parts)
+        if route is None:
+            return _text_response("Not Found", 404)
+        handler = route.get(scope["method"])
+        if handler is None:
+            return _text_response("Method Not Allowed", 405)
+        return await handler(scope, receive, *parts)
+
+    async def _read_json(self, receive):
+        """
+        Returns (json, None) or (None, response) when the body is not json
+        """
+        body = await _read_body(receive)
+        try:
+            return json.loads(body), None
+        except ValueError:
+            return None, invalid_request_response("Request body is not valid JSON")
+
+    async def _list_services(self, scope, receive):
+        return self.views.list_services(_header(scope, b"if-none-match"))
+
+    async def _metrics(self, scope, receive, *_):
+        # Reads the other processes' files when they share a directory
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.views.metrics_text
+        )
+
+    async def _reload_thrifts(self, scope, receive, *_):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.views.reload_thrifts
+        )
+
+    async def _batch_requests(self, scope, receive, *_):
+        request_json, error = await self._read_json(receive)
+        if error:
+            return error
+        batch, error = self.views.prepare_batch(request_json)
+        if error:
+            return error
+        if wants_ndjson(_header(scope, b"accept")):
+            return self._stream_batch(batch), 200, NDJSON_CONTENT_TYPE
+        return self.views.finish_batch(
+            batch, await self.thrift_manager.make_requests_async(batch.thrift_requests)
+        )
+
+    async def _stream_batch(self, batch):
+        # views.stream_batch for coroutines
+        stream = BatchStream(batch, self.views.metrics)
+        for line in stream.invalid_lines():
+            yield line
+        async for index, thrift_response in self.thrift_manager.iter_requests_async(
+            batch.thrift_requests
+        ):
+            yield stream.result_line(index, thrift_response)
+        yield stream.summary_line()
+
+    async def _get_thrift_definition(self, scope, receive, thrift):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return self.views.thrift_definition(
+            thrift,
+            bundle=parse_flag(query.get("bundle", [None])[-1]),
+            if_none_match=_header(scope, b"if-none-match"),
+            if_modified_since=_header(scope, b"if-modified-since"),
+            accept_encoding=_header(scope, b"accept-encoding"),
+        )
+
+    async def _get_service_info(self, scope, receive, thrift, service):
+        return self.views.service_info(
+            thrift, service, _header(scope, b"if-none-match")
+        )
+
+    async def _get_method_template(self, scope, receive, thrift, service, method):
+        return self.views.method_template(thrift, service, method)
+
+    async def _call_method(self, scope, receive, thrift, service, method):
+        request_json, error = await self._read_json(receive)
+        if error:
+            return error
+        call, error = self.views.prepare_call(thrift, service, method, request_json)
+        if error:
+            return error
+        return self.views.finish_call(
+            call, await self.thrift_manager.make_request_async(call.thrift_request)
+        )
+
+    async def _load_test_method(self, scope, receive, thrift, service, method, _):
+        # The load test makes its requests on threads of its own
+        request_json, error = await self._read_json(receive)
+        if error:
+            return error
+        thrift_request, settings, error = self.views.prepare_load_test(
+            thrift, service, method, request_json
+        )
+        if error:
+            return error
+        if wants_ndjson(_header(scope, b"accept")):
+            lines, status, headers = self.views.stream_load_test(
+                stream_load_test(self.thrift_manager, thrift_request, settings)
+            )
+            return _in_executor(lines), status, headers
+        report = await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(run_load_test, self.thrift_manager, thrift_request, settings),
+        )
+        return self.views.finish_load_test(report)
+
+
+def create_asgi_app():
+    return ThriftExplorerApp(build_views(load_config(), logger))
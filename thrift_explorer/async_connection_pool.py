@@ -0,0 +1,233 @@
+"""
+Pool of open upstream thrift connections for asyncio.
+
+The asyncio twin of connection_pool. Connections are thriftpy2's aio
+clients which talk over asyncio streams, so a call waiting on a slow
+upstream only costs a coroutine rather than a thread.
+
+Streams belong to the event loop they were opened on, a connection is
+only ever handed out again on that same loop.
+"""
+import asyncio
+import time
+import weakref
+from collections import defaultdict, deque
+
+import attr
+from thriftpy2.contrib.aio.client import TAsyncClient
+from thriftpy2.contrib.aio.socket import TAsyncSocket
+
+from thrift_explorer.connection_pool import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_MAX_SIZE,
+    DEFAULT_SOCKET_TIMEOUT,
+    SWEEP_INTERVAL,
+)
+
+
+@attr.s
+class AsyncPooledConnection(object):
+    """
+    An open aio client along with what is needed to check on and close it
+        client: thriftpy2 TAsyncClient
+        transport: the transport the client protocol writes to
+        socket: the TimedAsyncSocket under the transport
+        loop: the event loop the connection was opened on
+        last_used: time.monotonic() of when the connection was last returned
+        broken: set when a call left the connection in an unknown state
+    """
+
+    client = attr.ib()
+    transport = attr.ib()
+    socket = attr.ib()
+    loop = attr.ib()
+    last_used = attr.ib(default=attr.Factory(time.monotonic))
+    broken = attr.ib(default=False)
+
+    def close(self):
+        self.transport.close()
+
+
+class TimedAsyncSocket(TAsyncSocket):
+    """
+    TimedSocket for asyncio. A call counts as sent once the writer has
+    drained
+    """
+
+    sent_at = None
+    first_read_at = None
+
+    def start_call(self):
+        self.sent_at = None
+        self.first_read_at = None
+
+    def write(self, buff):
+        super().write(buff)
+        self.sent_at = time.perf_counter_ns()
+
+    async def flush(self):
+        await super().flush()
+        self.sent_at = time.perf_counter_ns()
+
+    async def read(self, sz):
+        buff = await super().read(sz)
+        if self.first_read_at is None:
+            self.first_read_at = time.perf_counter_ns()
+        return buff
+
+
+async def open_async_connection(
+    key, proto_factory, trans_factory, socket_timeout, connect_timeout
+):
+    client_socket = TimedAsyncSocket(
+        key.host,
+        key.port,
+        socket_timeout=socket_timeout,
+        connect_timeout=connect_timeout,
+    )
+    transport = trans_factory.get_transport(client_socket)
+    protocol = proto_factory.get_protocol(transport)
+    await transport.open()
+    # TAsyncSocket times reads with connect_timeout, now that we are
+    # connected give reads the socket timeout instead
+    client_socket.connect_timeout = client_socket.socket_timeout
+    return AsyncPooledConnection(
+        client=TAsyncClient(key.service, protocol),
+        transport=transport,
+        socket=client_socket,
+        loop=asyncio.get_running_loop(),
+    )
+
+
+def _is_healthy(connection, loop):
+    # The loop notices a hang up while the connection sits idle. Anything
+    # it has buffered to read is something we did not ask for.
+    if connection.broken or connection.loop is not loop:
+        return False
+    reader = getattr(connection.socket, "reader", None)
+    writer = getattr(connection.socket, "writer", None)
+    if reader is None or writer is None or writer.is_closing():
+        return False
+    return not reader.at_eof() and not getattr(reader, "_buffer", b"")
+
+
+class AsyncConnectionPool(object):
+    """
+    Pool of idle aio connections keyed by PoolKey. Takes the same
+    arguments as ConnectionPool
+
+    Unlike ConnectionPool it is not thread safe, it is meant to be used
+    from coroutines on one event loop
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_MAX_SIZE,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        socket_timeout=DEFAULT_SOCKET_TIMEOUT,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self._idle = defaultdict(deque)
+        self._retired = weakref.WeakSet()
+        self._swept_at = time.monotonic()
+
+    async def checkout(self, key, proto_factory, trans_factory):
+        """
+        Returns a tuple of (AsyncPooledConnection, bool). The bool is True
+        when the connection came out of the pool rather than being opened.
+
+        Raises whatever the transport raises if a new connection cannot be opened
+        """
+        loop = asyncio.get_running_loop()
+        idle = self._idle[key]
+        now = time.monotonic()
+        while idle:
+            candidate = idle.pop()
+            if now - candidate.last_used <= self.idle_timeout and _is_healthy(
+                candidate, loop
+            ):
+                self.hits += 1
+                self.in_use += 1
+                return candidate, True
+            if candidate.loop is loop:
+                candidate.close()
+        self.misses += 1
+        connection = await open_async_connection(
+            key,
+            proto_factory,
+            trans_factory,
+            self.socket_timeout,
+            self.connect_timeout,
+        )
+        self.in_use += 1
+        return connection, False
+
+    def checkin(self, key, connection):
+        self.in_use -= 1
+        if connection.broken:
+            connection.close()
+            return
+        connection.last_used = time.monotonic()
+        idle = self._idle[key]
+        while idle and connection.last_used - idle[0].last_used > self.idle_timeout:
+            idle.popleft().close()
+        if len(idle) < self.max_size and key.service not in self._retired:
+            idle.append(connection)
+        else:
+            connection.close()
+        if connection.last_used - self._swept_at >= min(
+            self.idle_timeout, SWEEP_INTERVAL
+        ):
+            self._sweep(connection.last_used, connection.loop)
+
+    def retire_services(self, services):
+        """
+        Stops pooling connections for services, see
+        ConnectionPool.retire_services. This may be called from any thread,
+        their idle connections are closed by the next checkin on their loop
+        """
+        self._retired.update(services)
+        self._swept_at = float("-inf")
+
+    def _sweep(self, now, loop):
+        # Connections can only be closed on the loop they were opened on,
+        # ones from another loop wait for a checkin on theirs (or are
+        # dropped once their loop has closed)
+        for key in list(self._idle):
+            retired = key.service in self._retired
+            kept = deque()
+            for connection in self._idle[key]:
+                if connection.loop is not loop:
+                    if not connection.loop.is_closed():
+                        kept.append(connection)
+                elif retired or now - connection.last_used > self.idle_timeout:
+                    connection.close()
+                else:
+                    kept.append(connection)
+            if kept:
+                self._idle[key] = kept
+            else:
+                del self._idle[key]
+        self._swept_at = now
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "idle": sum(len(idle) for idle in self._idle.values()),
+            "in_use": self.in_use,
+        }
+
+    def close(self):
+        for idle in self._idle.values():
+            for connection in idle:
+                connection.close()
+        self._idle.clear()
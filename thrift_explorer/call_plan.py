@@ -0,0 +1,315 @@
+"""
+Call plans are compiled once per endpoint when the thrifts are loaded.
+
+Translating a request body used to walk the parsed specs and go back to the
+thriftpy2 module for every argument of every request (looking up the
+<endpoint>_args class, digging through thrift_spec tuples and so on). A call
+plan does that lookup once and keeps the result as a tree of small functions
+bound to the thriftpy2 classes they need, so handling a request is just a
+walk over those.
+
+Responses get the same treatment. The result type of every endpoint is
+known up front so rather than inspecting each value in the response tree
+we build translators for exactly the types that can come back.
+"""
+import attr
+
+from thrift_explorer.thrift_models import TEnum, TList, TMap, TSet, TStruct
+from thrift_explorer.validator_compiler import compile_request_validator
+
+
+def _split_type_info(type_info):
+    # thriftpy2 describes container elements as either a bare ttype code
+    # or a (ttype code, nested info) pair
+    if isinstance(type_info, tuple):
+        return type_info[1]
+    return None
+
+
+def _nested_type_info(thrift_spec_entry):
+    # thrift_spec entries are (ttype, name, required) for basic
+    # types and (ttype, name, nested info, required) for everything else
+    if len(thrift_spec_entry) == 3:
+        return None
+    return thrift_spec_entry[2]
+
+
+def _compile_struct(struct_spec, clazz, compiled):
+    field_formatters = ()
+
+    def format_struct(raw_arg):
+        class_args = {}
+        for name, formatter in field_formatters:
+            if name in raw_arg:
+                value = raw_arg[name]
+                class_args[name] = formatter(value) if formatter else value
+        return clazz(**class_args)
+
+    # In before the fields so a recursive struct formats itself with this
+    compiled[id(struct_spec)] = format_struct
+    field_formatters = tuple(
+        (
+            field.name,
+            compile_formatter(
+                field.type_info,
+                _nested_type_info(clazz.thrift_spec[field.field_id]),
+                compiled,
+            ),
+        )
+        for field in struct_spec.fields
+    )
+    return format_struct
+
+
+def _compile_collection(collection_class, value_type, type_info, compiled):
+    value_formatter = compile_formatter(
+        value_type, _split_type_info(type_info), compiled
+    )
+    if value_formatter is None:
+        return collection_class
+    if collection_class is set:
+        return lambda raw_arg: {value_formatter(value) for value in raw_arg}
+    return lambda raw_arg: [value_formatter(value) for value in raw_arg]
+
+
+def _compile_map(map_spec, type_info, compiled):
+    key_info, value_info = type_info
+    key_formatter = compile_formatter(
+        map_spec.key_type, _split_type_info(key_info), compiled
+    )
+    value_formatter = compile_formatter(
+        map_spec.value_type, _split_type_info(value_info), compiled
+    )
+    if key_formatter is None and value_formatter is None:
+        return dict
+    key_formatter = key_formatter or (lambda key: key)
+    value_formatter = value_formatter or (lambda value: value)
+    return lambda raw_arg: {
+        key_formatter(key): value_formatter(value) for key, value in raw_arg.items()
+    }
+
+
+def compile_formatter(spec_type, type_info, compiled=None):
+    """
+    Build a function that turns a validated raw value for spec_type
+    into what the thriftpy2 client expects
+
+    spec_type: ThriftType as parsed by thrift_parser
+    type_info: the matching nested type info from the thriftpy2 thrift_spec
+        (the struct class, element description, etc)
+
+    compiled: dict of id of the structs compiled so far to their
+        formatter, shared by everything compiled together
+
+    Returns None when the raw value can be handed to thriftpy2 as is.
+    """
+    if compiled is None:
+        compiled = {}
+    if isinstance(spec_type, TStruct):
+        if id(spec_type) in compiled:
+            return compiled[id(spec_type)]
+        return _compile_struct(spec_type, type_info, compiled)
+    elif isinstance(spec_type, TList):
+        return _compile_collection(list, spec_type.value_type, type_info, compiled)
+    elif isinstance(spec_type, TSet):
+        return _compile_collection(set, spec_type.value_type, type_info, compiled)
+    elif isinstance(spec_type, TMap):
+        return _compile_map(spec_type, type_info, compiled)
+    elif isinstance(spec_type, TEnum):
+        return lambda raw_arg: spec_type.format_arg_for_thrift(raw_arg, type_info)
+    return None
+
+
+def compile_request_translator(endpoint, thriftpy2_service_class):
+    arg_formatters = ()
+    if endpoint.args:
+        args_class = getattr(thriftpy2_service_class, "{}_args".format(endpoint.name))
+        compiled = {}
+        arg_formatters = tuple(
+            (
+                arg_spec.name,
+                compile_formatter(
+                    arg_spec.type_info,
+                    _nested_type_info(args_class.thrift_spec[arg_spec.field_id]),
+                    compiled,
+                ),
+            )
+            for arg_spec in endpoint.args
+        )
+
+    def translate(request_body):
+        processed_args = {}
+        for name, formatter in arg_formatters:
+            # We assume validation happened earlier so if an arg
+            # is missing we assume it is not required
+            if name in request_body:
+                value = request_body[name]
+                processed_args[name] = formatter(value) if formatter else value
+        return processed_args
+
+    return translate
+
+
+def find_endpoint_exceptions(thriftpy2_service_class, endpoint_name):
+    possible_results = getattr(
+        thriftpy2_service_class, "{}_result".format(endpoint_name)
+    )
+    exceptions = []
+    for result in possible_results.thrift_spec.values():
+        clazz = _nested_type_info(result)
+        if isinstance(clazz, type) and issubclass(clazz, BaseException):
+            exceptions.append(clazz)
+    return tuple(exceptions)
+
+
+def _compile_struct_translator(struct_spec, compiled):
+    struct_name = struct_spec.name
+    field_translators = ()
+
+    def translate_struct(response):
+        struct = {"__thrift_struct_class__": struct_name}
+        for name, translator in field_translators:
+            value = getattr(response, name, None)
+            struct[name] = translator(value) if translator and value else value
+        return struct
+
+    # In before the fields so a recursive struct translates itself with this
+    compiled[id(struct_spec)] = translate_struct
+    field_translators = tuple(
+        (field.name, compile_response_translator(field.type_info, compiled))
+        for field in struct_spec.fields
+    )
+    return translate_struct
+
+
+def _compile_collection_translator(collection_class, value_type, compiled):
+    value_translator = compile_response_translator(value_type, compiled)
+    if value_translator is None:
+        return None
+    if collection_class is set:
+        return lambda response: {value_translator(value) for value in response}
+    return lambda response: [value_translator(value) for value in response]
+
+
+def _compile_map_translator(map_spec, compiled):
+    key_translator = compile_response_translator(map_spec.key_type, compiled)
+    value_translator = compile_response_translator(map_spec.value_type, compiled)
+    if key_translator is None and value_translator is None:
+        return None
+    key_translator = key_translator or (lambda key: key)
+    value_translator = value_translator or (lambda value: value)
+    return lambda response: {
+        key_translator(key): value_translator(value) for key, value in response.items()
+    }
+
+
+def compile_response_translator(spec_type, compiled=None):
+    """
+    Build a function that turns a thriftpy2 value of spec_type into
+    the same thing translate_thrift_response would produce
+
+    compiled: dict of id of the structs compiled so far to their
+        translator, shared by everything compiled together
+
+    Returns None when the value can be returned as is.
+    """
+    if compiled is None:
+        compiled = {}
+    if isinstance(spec_type, TStruct):
+        if id(spec_type) in compiled:
+            return compiled[id(spec_type)]
+        return _compile_struct_translator(spec_type, compiled)
+    elif isinstance(spec_type, TList):
+        return _compile_collection_translator(list, spec_type.value_type, compiled)
+    elif isinstance(spec_type, TSet):
+        return _compile_collection_translator(set, spec_type.value_type, compiled)
+    elif isinstance(spec_type, TMap):
+        return _compile_map_translator(spec_type, compiled)
+    return None
+
+
+def _compile_result_translator(result_spec, compiled):
+    translator = compile_response_translator(result_spec.type_info, compiled)
+    if translator is None:
+        return lambda response: response
+    # Empty results come back untouched just like translate_thrift_response
+    return lambda response: translator(response) if response else response
+
+
+def compile_result_translators(endpoint, thriftpy2_service_class):
+    """
+    Returns a tuple of (success translator, {exception class: translator})
+    for the results of endpoint
+    """
+    translate_success = lambda response: response
+    exception_translators = {}
+    results_class = getattr(thriftpy2_service_class, "{}_result".format(endpoint.name))
+    compiled = {}
+    for result_spec in endpoint.results:
+        translator = _compile_result_translator(result_spec, compiled)
+        if result_spec.name == "success":
+            translate_success = translator
+        else:
+            exception_class = _nested_type_info(
+                results_class.thrift_spec[result_spec.field_id]
+            )
+            exception_translators[exception_class] = translator
+    return translate_success, exception_translators
+
+
+@attr.s(frozen=True)
+class CallPlan(object):
+    """
+    Everything needed to call an endpoint that can be worked out ahead of time
+        service: the thriftpy2 service class
+        endpoint: ServiceEndpoint as parsed by thrift_parser
+        validate_request_body: function taking a request body and returning
+            a list of FieldErrors (empty if the body is valid)
+        translate_request: function taking a validated request body and
+            returning the kwargs for the thriftpy2 client call
+        exceptions: tuple of the exception classes the endpoint declares
+        translate_success: function turning the thriftpy2 return value into
+            plain python (same output as translate_thrift_response)
+        exception_translators: dict of declared exception class to the
+            function that translates it
+    """
+
+    service = attr.ib()
+    endpoint = attr.ib()
+    validate_request_body = attr.ib()
+    translate_request = attr.ib()
+    exceptions = attr.ib()
+    translate_success = attr.ib()
+    exception_translators = attr.ib()
+
+
+def compile_call_plan(thriftpy2_service_class, endpoint):
+    translate_success, exception_translators = compile_result_translators(
+        endpoint, thriftpy2_service_class
+    )
+    return CallPlan(
+        service=thriftpy2_service_class,
+        endpoint=endpoint,
+        validate_request_body=compile_request_validator(endpoint),
+        translate_request=compile_request_translator(endpoint, thriftpy2_service_class),
+        exceptions=find_endpoint_exceptions(thriftpy2_service_class, endpoint.name),
+        translate_success=translate_success,
+        exception_translators=exception_translators,
+    )
+
+
+def compile_call_plans(thrifts, service_specs):
+    """
+    Compile a CallPlan for every endpoint in service_specs
+
+    Returns a dict keyed by (thrift file, service name, endpoint name)
+    """
+    plans = {}
+    for thrift_file, services in service_specs.items():
+        for service_name, service in services.items():
+            thriftpy2_service_class = getattr(thrifts[thrift_file], service_name)
+            for endpoint_name, endpoint in service.endpoints.items():
+                plans[(thrift_file, service_name, endpoint_name)] = compile_call_plan(
+                    thriftpy2_service_class, endpoint
+                )
+    return plans
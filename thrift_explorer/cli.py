@@ -0,0 +1,252 @@
+"""
+Command line tools for thrift explorer
+
+    thrift-explorer build-cache --thrift-directory /thrifts --cache-directory /cache
+    thrift-explorer load-test todo TodoService numTasks --port 6000 --duration 10 \
+        --target-rps 500 --open-loop
+    thrift-explorer postman-scenario ThriftExplorer.postman_collection.json > mix.json
+    thrift-explorer run-scenario mix.json --output report.json
+"""
+import argparse
+import json
+import os
+import sys
+
+import attr
+
+from thrift_explorer.communication_models import (
+    CommunicationModelEncoder,
+    ThriftRequest,
+)
+from thrift_explorer.load_processes import (
+    LoadWorkerError,
+    load_test_in_processes,
+    scenario_in_processes,
+)
+from thrift_explorer.load_test import parse_load_test_settings, run_load_test
+from thrift_explorer.scenario import (
+    ScenarioError,
+    check_scenario,
+    load_scenario,
+    run_scenario,
+    scenario_from_postman,
+)
+from thrift_explorer.spec_cache import SpecCache
+from thrift_explorer.thrift_loader import load_thrifts
+from thrift_explorer.thrift_manager import ThriftManager
+from thrift_explorer.views import add_extension_if_needed
+
+
+def build_cache(args):
+    loaded = load_thrifts(
+        args.thrift_directory,
+        workers=args.workers,
+        cache=SpecCache(args.cache_directory),
+    )
+    print(
+        "Cached {} thrift files in {} ({} were already cached)".format(
+            len(loaded.thrifts), args.cache_directory, loaded.cache_hits
+        )
+    )
+    return 0
+
+
+def _print_progress(report):
+    # Scenario reports keep the overall numbers in total
+    report = getattr(report, "total", report)
+    latency = report.latency_seconds or report.call_seconds
+    print(
+        "{:.1f}s {} requests {:.1f}/s {} errors p99 {}".format(
+            report.seconds,
+            report.requests,
+            report.throughput,
+            report.errors,
+            "{:.6f}s".format(latency.p99) if latency else "-",
+        ),
+        file=sys.stderr,
+    )
+
+
+def load_test(args):
+    # Only the thrift being tested needs loading
+    thrift_manager = ThriftManager(args.thrift_directory, lazy=True)
+    try:
+        thrift_request = ThriftRequest(
+            thrift_file=add_extension_if_needed(args.thrift),
+            service_name=args.service,
+            endpoint_name=args.method,
+            host=args.host,
+            port=args.port,
+            protocol=args.protocol,
+            transport=args.transport,
+            request_body=json.loads(args.body),
+        )
+        settings = parse_load_test_settings(
+            {
+                "concurrency": args.concurrency,
+                "total_requests": args.total_requests,
+                "duration": args.duration,
+                "target_rps": args.target_rps,
+                "open_loop": args.open_loop,
+            }
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    errors = thrift_manager.validate_request(thrift_request)
+    if errors:
+        for error in errors:
+            print(error.message, file=sys.stderr)
+        return 2
+    if args.processes > 1:
+        try:
+            report = load_test_in_processes(
+                args.thrift_directory,
+                thrift_request,
+                settings,
+                args.processes,
+                on_progress=_print_progress,
+            )
+        except LoadWorkerError as e:
+            print(e, file=sys.stderr)
+            return 1
+    else:
+        report = run_load_test(thrift_manager, thrift_request, settings)
+    print(json.dumps(attr.asdict(report), cls=CommunicationModelEncoder, indent=2))
+    return 0
+
+
+def run_scenario_file(args):
+    thrift_manager = ThriftManager(args.thrift_directory, lazy=True)
+    try:
+        scenario = load_scenario(args.scenario)
+        check_scenario(thrift_manager, scenario)
+    except ScenarioError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.processes > 1:
+        try:
+            report = scenario_in_processes(
+                args.thrift_directory,
+                scenario,
+                args.processes,
+                on_progress=_print_progress,
+            )
+        except LoadWorkerError as e:
+            print(e, file=sys.stderr)
+            return 1
+    else:
+        report = run_scenario(thrift_manager, scenario)
+    report_json = json.dumps(
+        attr.asdict(report), cls=CommunicationModelEncoder, indent=2
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report_json)
+    else:
+        print(report_json)
+    return 0
+
+
+def postman_scenario(args):
+    with open(args.collection, encoding="utf-8") as collection:
+        scenario = scenario_from_postman(
+            json.load(collection),
+            stage={"duration": args.duration, "target_rps": args.target_rps},
+        )
+    print(json.dumps(scenario, indent=2))
+    return 0
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="thrift-explorer")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    cache_parser = subparsers.add_parser(
+        "build-cache", help="Parse every thrift file and write it to the spec cache"
+    )
+    cache_parser.add_argument(
+        "--thrift-directory", default=os.environ.get("THRIFT_DIRECTORY")
+    )
+    cache_parser.add_argument(
+        "--cache-directory", default=os.environ.get("THRIFT_CACHE_DIRECTORY")
+    )
+    cache_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    cache_parser.set_defaults(handler=build_cache)
+
+    load_parser = subparsers.add_parser(
+        "load-test", help="Load a method of a service and report how it held up"
+    )
+    load_parser.add_argument("thrift")
+    load_parser.add_argument("service")
+    load_parser.add_argument("method")
+    load_parser.add_argument(
+        "--thrift-directory", default=os.environ.get("THRIFT_DIRECTORY")
+    )
+    load_parser.add_argument("--host", default="localhost")
+    load_parser.add_argument("--port", type=int, required=True)
+    load_parser.add_argument("--protocol", default="TBinaryProtocol")
+    load_parser.add_argument("--transport", default="TBufferedTransport")
+    load_parser.add_argument(
+        "--body", default="{}", help="JSON arguments for the method"
+    )
+    load_parser.add_argument("--concurrency", type=int, default=1)
+    load_parser.add_argument("--total-requests", type=int)
+    load_parser.add_argument("--duration", type=float, help="Seconds")
+    load_parser.add_argument("--target-rps", type=float)
+    load_parser.add_argument(
+        "--open-loop",
+        action="store_true",
+        help="Send requests on the --target-rps timetable even if earlier "
+        "ones have not come back",
+    )
+    load_parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Split the load over this many worker processes",
+    )
+    load_parser.set_defaults(handler=load_test)
+
+    scenario_parser = subparsers.add_parser(
+        "run-scenario", help="Run a scenario file of mixed calls (see scenario)"
+    )
+    scenario_parser.add_argument("scenario")
+    scenario_parser.add_argument(
+        "--thrift-directory", default=os.environ.get("THRIFT_DIRECTORY")
+    )
+    scenario_parser.add_argument(
+        "--output", help="Write the report here rather than to stdout"
+    )
+    scenario_parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Split the scenario over this many worker processes",
+    )
+    scenario_parser.set_defaults(handler=run_scenario_file)
+
+    postman_parser = subparsers.add_parser(
+        "postman-scenario",
+        help="Print a scenario making the calls in a Postman collection",
+    )
+    postman_parser.add_argument("collection")
+    postman_parser.add_argument("--duration", type=float, default=60)
+    postman_parser.add_argument("--target-rps", type=float, default=10)
+    postman_parser.set_defaults(handler=postman_scenario)
+    return parser
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "thrift_directory", "") is None:
+        parser.error("--thrift-directory or THRIFT_DIRECTORY is required")
+    if getattr(args, "cache_directory", "") is None:
+        parser.error("--cache-directory or THRIFT_CACHE_DIRECTORY is required")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
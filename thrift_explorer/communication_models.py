@@ -90,6 +90,33 @@ class ThriftRequest(object):
     request_body = attr.ib(default=attr.Factory(dict))
 
 
+@attr.s(frozen=True)
+class CallTimings(object):
+    """
+    Where the time of a call went, in nanoseconds (time.perf_counter_ns).
+    A phase the call never got to is None
+
+    validation_ns: checking the request against the thrift, done before
+        the call is made so it is filled in by whoever validated it
+    request_translation_ns: turning the JSON request body into thriftpy2
+        arguments
+    connect_ns: getting a connection, out of the pool or a new one
+    send_ns: serializing the call and writing it to the socket
+    server_wait_ns: from the call being sent to the first bytes of the
+        reply coming back, the upstream's own time plus the network
+    receive_ns: reading and deserializing the rest of the reply
+    response_translation_ns: turning the reply back into JSON
+    """
+
+    validation_ns = attr.ib(default=None)
+    request_translation_ns = attr.ib(default=None)
+    connect_ns = attr.ib(default=None)
+    send_ns = attr.ib(default=None)
+    server_wait_ns = attr.ib(default=None)
+    receive_ns = attr.ib(default=None)
+    response_translation_ns = attr.ib(default=None)
+
+
 @attr.s(frozen=True)
 class ThriftResponse(object):
     """
@@ -100,6 +127,9 @@ class ThriftResponse(object):
         data: dict with the response data
         time_to_make_request: datetime.timedelta Time to make the request
         time_to_connect: datetime.timedelta Time to make the initial connection
+        pool_hit: bool True if the call reused a pooled connection rather
+            than opening a new one
+        timings: CallTimings with where the time went
     """
 
     status = attr.ib()
@@ -107,6 +137,8 @@ class ThriftResponse(object):
     data = attr.ib()
     time_to_make_request = attr.ib()
     time_to_connect = attr.ib()
+    pool_hit = attr.ib(default=None)
+    timings = attr.ib(default=attr.Factory(CallTimings))
 
 
 class ErrorCode(Enum):
@@ -116,6 +148,7 @@ class ErrorCode(Enum):
     REQUIRED_FIELD_MISSING = auto()
     FIELD_VALIDATION_ERROR = auto()
     INVALID_REQUEST = auto()
+    RELOAD_FAILED = auto()
 
 
 @attr.s(frozen=True)
@@ -0,0 +1,263 @@
+"""
+Pool of open upstream thrift connections.
+
+Opening a socket (and building the transport/protocol stack on top of it)
+for every call means each request pays for a TCP handshake. The pool keeps
+connections that finished a call cleanly around so the next request to the
+same host/port/protocol/transport/service can reuse them.
+
+Every so often a checkin also closes whatever has sat idle too long under
+any key, so connections to a host that is never called again, or for a
+service a reload replaced, do not stay open for good.
+"""
+import select
+import threading
+import time
+import weakref
+from collections import defaultdict, deque
+
+import attr
+from thriftpy2.thrift import TClient
+from thriftpy2.transport import TSocket
+
+DEFAULT_MAX_SIZE = 8
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_SOCKET_TIMEOUT = 20000
+DEFAULT_CONNECT_TIMEOUT = 3000
+# Most seconds between checkins looking over every key for idle connections
+SWEEP_INTERVAL = 1.0
+
+
+@attr.s(frozen=True)
+class PoolKey(object):
+    """
+    Connections can only be shared between requests that agree on all of these
+        host: str
+        port: int
+        protocol: Protocol
+        transport: Transport
+        service: the thriftpy2 service class the client was built for
+    """
+
+    host = attr.ib()
+    port = attr.ib()
+    protocol = attr.ib()
+    transport = attr.ib()
+    service = attr.ib()
+
+
+@attr.s
+class PooledConnection(object):
+    """
+    An open client along with what is needed to check on and close it
+        client: thriftpy2 TClient
+        transport: the transport the client protocol writes to
+        socket: the TimedSocket under the transport
+        last_used: time.monotonic() of when the connection was last returned
+        broken: set when a call left the connection in an unknown state
+    """
+
+    client = attr.ib()
+    transport = attr.ib()
+    socket = attr.ib()
+    last_used = attr.ib(default=attr.Factory(time.monotonic))
+    broken = attr.ib(default=False)
+
+    def close(self):
+        self.transport.close()
+
+
+class TimedSocket(TSocket):
+    """
+    TSocket that notes the time.perf_counter_ns() a call finished being
+    written (sent_at) and the one the first bytes of its reply were read
+    (first_read_at). start_call clears them before each call
+    """
+
+    sent_at = None
+    first_read_at = None
+
+    def start_call(self):
+        self.sent_at = None
+        self.first_read_at = None
+
+    def write(self, buf):
+        super().write(buf)
+        self.sent_at = time.perf_counter_ns()
+
+    def read(self, sz):
+        buff = super().read(sz)
+        if self.first_read_at is None:
+            self.first_read_at = time.perf_counter_ns()
+        return buff
+
+
+def open_connection(key, proto_factory, trans_factory, socket_timeout, connect_timeout):
+    client_socket = TimedSocket(
+        key.host,
+        key.port,
+        socket_timeout=socket_timeout,
+        connect_timeout=connect_timeout,
+    )
+    transport = trans_factory.get_transport(client_socket)
+    protocol = proto_factory.get_protocol(transport)
+    transport.open()
+    return PooledConnection(
+        client=TClient(key.service, protocol), transport=transport, socket=client_socket
+    )
+
+
+def _is_healthy(connection):
+    # An idle connection should have nothing to read. If the socket
+    # is readable the server either hung up (recv returns b"") or sent
+    # something we did not ask for. Either way it cant be trusted.
+    sock = connection.socket.sock
+    if connection.broken or sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of idle connections keyed by PoolKey
+
+    max_size: int
+        Most idle connections kept per key. Connections returned past
+        this are closed
+    idle_timeout: float
+        Seconds a connection may sit idle before it is evicted
+    socket_timeout/connect_timeout: int
+        Timeouts in ms used when opening new connections
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_MAX_SIZE,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        socket_timeout=DEFAULT_SOCKET_TIMEOUT,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self._idle = defaultdict(deque)
+        self._retired = weakref.WeakSet()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def checkout(self, key, proto_factory, trans_factory):
+        """
+        Returns a tuple of (PooledConnection, bool). The bool is True
+        when the connection came out of the pool rather than being opened.
+
+        Raises whatever the transport raises if a new connection cannot be opened
+        """
+        stale = []
+        connection = None
+        with self._lock:
+            idle = self._idle[key]
+            now = time.monotonic()
+            while idle:
+                candidate = idle.pop()
+                if now - candidate.last_used <= self.idle_timeout and _is_healthy(
+                    candidate
+                ):
+                    connection = candidate
+                    break
+                stale.append(candidate)
+            if connection:
+                self.hits += 1
+                self.in_use += 1
+            else:
+                self.misses += 1
+        for candidate in stale:
+            candidate.close()
+        if connection:
+            return connection, True
+        connection = open_connection(
+            key,
+            proto_factory,
+            trans_factory,
+            self.socket_timeout,
+            self.connect_timeout,
+        )
+        with self._lock:
+            self.in_use += 1
+        return connection, False
+
+    def checkin(self, key, connection):
+        with self._lock:
+            self.in_use -= 1
+        if connection.broken:
+            connection.close()
+            return
+        connection.last_used = time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = self._idle[key]
+            while idle and connection.last_used - idle[0].last_used > self.idle_timeout:
+                evicted.append(idle.popleft())
+            if len(idle) < self.max_size and key.service not in self._retired:
+                idle.append(connection)
+            else:
+                evicted.append(connection)
+            if connection.last_used - self._swept_at >= min(
+                self.idle_timeout, SWEEP_INTERVAL
+            ):
+                evicted.extend(self._take_stale(connection.last_used))
+        for stale in evicted:
+            stale.close()
+
+    def retire_services(self, services):
+        """
+        Closes the idle connections for services (thriftpy2 service classes)
+        and stops pooling theirs from now on. ThriftManager calls this with
+        the services a reload replaced or removed
+        """
+        with self._lock:
+            self._retired.update(services)
+            stale = self._take_stale(time.monotonic())
+        for connection in stale:
+            connection.close()
+
+    def _take_stale(self, now):
+        # Call with the lock held. Takes every idle connection that has
+        # timed out or is for a retired service, and forgets empty keys
+        stale = []
+        for key in list(self._idle):
+            idle = self._idle[key]
+            if key.service in self._retired:
+                stale.extend(idle)
+                idle.clear()
+            while idle and now - idle[0].last_used > self.idle_timeout:
+                stale.append(idle.popleft())
+            if not idle:
+                del self._idle[key]
+        self._swept_at = now
+        return stale
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "in_use": self.in_use,
+            }
+
+    def close(self):
+        with self._lock:
+            idle_connections = [
+                connection for idle in self._idle.values() for connection in idle
+            ]
+            self._idle.clear()
+        for connection in idle_connections:
+            connection.close()
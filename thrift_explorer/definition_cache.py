@@ -0,0 +1,110 @@
+"""
+Thrift definitions kept in memory, ready to send.
+
+Reading the definition off disk for every GET /<thrift>/ adds up when a UI
+keeps asking for it. A DefinitionCache holds each file's bytes along with a
+gzipped copy and an ETag, and checks with a stat that the file has not
+changed before handing them out. A file is only read again when its mtime
+or size changes.
+
+A bundle is a thrift together with everything it includes, directly or
+not, as one JSON object. Clients get the whole tree in one request
+rather than following the includes one at a time.
+"""
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import attr
+
+
+@attr.s(frozen=True)
+class CachedDefinition(object):
+    """
+    A definition (or bundle) ready to send
+        body: bytes
+        gzipped: bytes, body gzipped ahead of time
+        etag, gzip_etag: str, strong ETags of body and gzipped
+        last_modified: float, mtime of the newest file that went into it
+        version: what it was built from, to tell when it is stale
+    """
+
+    body = attr.ib()
+    gzipped = attr.ib()
+    etag = attr.ib()
+    gzip_etag = attr.ib()
+    last_modified = attr.ib()
+    version = attr.ib()
+
+    @classmethod
+    def build(cls, body, last_modified, version):
+        digest = hashlib.sha1(body).hexdigest()
+        return cls(
+            body=body,
+            # mtime=0 so the gzipped bytes only depend on body
+            gzipped=gzip.compress(body, mtime=0),
+            etag='"{}"'.format(digest),
+            gzip_etag='"{}-gzip"'.format(digest),
+            last_modified=last_modified,
+            version=version,
+        )
+
+
+class DefinitionCache(object):
+    """
+    CachedDefinitions keyed by normalized path. Safe to use from many
+    threads, at worst two of them read the same changed file
+    """
+
+    def __init__(self):
+        self._definitions = {}
+        self._bundles = {}
+
+    def definition(self, thrift_path):
+        thrift_path = os.path.normpath(thrift_path)
+        stat = os.stat(thrift_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._definitions.get(thrift_path)
+        if cached is None or cached.version != version:
+            with open(thrift_path, "rb") as infile:
+                cached = CachedDefinition.build(infile.read(), stat.st_mtime, version)
+            self._definitions[thrift_path] = cached
+        return cached
+
+    def bundle(self, thrift_path, include_paths):
+        """
+        The bundle of thrift_path and include_paths, the paths of every
+        thrift it includes. The body is a JSON object with the thrift's
+        file name and its text and each include's keyed by path relative
+        to the thrift, as they are written in include statements
+        """
+        thrift_path = os.path.normpath(thrift_path)
+        paths = [thrift_path] + sorted(include_paths)
+        definitions = [self.definition(path) for path in paths]
+        version = tuple(
+            (path, definition.version) for path, definition in zip(paths, definitions)
+        )
+        cached = self._bundles.get(thrift_path)
+        if cached is None or cached.version != version:
+            directory = os.path.dirname(thrift_path)
+            body = json.dumps(
+                {
+                    "thrift": os.path.basename(thrift_path),
+                    "files": OrderedDict(
+                        (
+                            os.path.relpath(path, directory).replace(os.sep, "/"),
+                            definition.body.decode("utf-8"),
+                        )
+                        for path, definition in zip(paths, definitions)
+                    ),
+                }
+            ).encode("utf-8")
+            cached = CachedDefinition.build(
+                body,
+                max(definition.last_modified for definition in definitions),
+                version,
+            )
+            self._bundles[thrift_path] = cached
+        return cached
@@ -0,0 +1,73 @@
+"""
+Gunicorn settings that load the thrifts once and share them with every
+worker.
+
+    gunicorn -c python:thrift_explorer.gunicorn_preload -w 8 thrift_explorer.wsgi
+
+Without preloading each worker builds its own copy of the parsed thrifts,
+so memory and boot time grow with the number of workers. Here the app is
+built in the gunicorn master and the workers it forks share its memory
+copy on write.
+
+Sharing only lasts while nothing writes to the shared pages, and the
+garbage collector writes to every object it looks at. So collection is
+off while the master loads and gc.freeze() moves everything loaded into
+the permanent generation before each fork, where the workers' collections
+never look. Workers turn collection back on for what they make themselves.
+
+Threads do not survive the fork, so the thrift directory watcher
+(THRIFT_RELOAD_INTERVAL) is started in each worker once it is forked.
+
+The counts behind /metrics are shared between workers through
+THRIFT_METRICS_DIRECTORY, it is emptied as the server starts. When it is
+not set a temporary directory is used and removed when the server exits.
+
+Anything a worker loads later is its own: lazily loaded thrifts
+(THRIFT_LAZY_LOAD) and thrifts picked up by a reload are not shared.
+Other settings can be given on the command line as usual. Measure the
+difference with benchmarks/preload_memory.py
+"""
+import gc
+import os
+import shutil
+import tempfile
+
+from thrift_explorer.metrics import clear_directory
+from thrift_explorer.server import (
+    METRICS_DIRECTORY_ENV,
+    start_background_threads,
+    start_threads_after_fork,
+)
+
+preload_app = True
+
+# Gunicorn reads this module before it imports the app. The master leaves
+# collection off for good, it does next to nothing once the app is built
+gc.disable()
+start_threads_after_fork()
+
+# Without a metrics directory each worker would answer /metrics with only its own counts.
+# Set here because the app is built before any of the hooks below run
+_temporary_metrics_directory = None
+if not os.environ.get(METRICS_DIRECTORY_ENV):
+    _temporary_metrics_directory = tempfile.mkdtemp(prefix="thrift-explorer-metrics-")
+    os.environ[METRICS_DIRECTORY_ENV] = _temporary_metrics_directory
+
+
+def on_starting(server):
+    clear_directory(os.environ[METRICS_DIRECTORY_ENV])
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # The app was preloaded in the master, this is the same one
+    start_background_threads(worker.app.wsgi())
+
+
+def on_exit(server):
+    if _temporary_metrics_directory:
+        shutil.rmtree(_temporary_metrics_directory, ignore_errors=True)
@@ -0,0 +1,119 @@
+"""
+Latency histogram in the style of HdrHistogram.
+
+Latencies are kept as whole microseconds in buckets that get wider as the
+values get bigger. Every power of two is split into the same number of
+sub buckets, so any value is known to within a fixed fraction of itself
+(under 1% with the default of 2 significant digits) no matter if it is a
+few microseconds or a few minutes. Memory depends on the range of the
+latencies seen rather than how many there were, which is what lets a long
+load test record every request.
+
+Only buckets something landed in are kept. Two histograms with the same
+precision merge exactly by adding up their buckets.
+"""
+import math
+
+import attr
+
+DEFAULT_SIGNIFICANT_DIGITS = 2
+_MICROSECONDS = 1000000
+
+
+@attr.s(frozen=True)
+class LatencySummary(object):
+    """
+    Percentiles of a set of latencies, all in seconds
+    """
+
+    p50 = attr.ib()
+    p90 = attr.ib()
+    p99 = attr.ib()
+    max = attr.ib()
+
+
+class LatencyHistogram(object):
+    """
+    Counts of latencies in log sized buckets, see the module docstring
+
+    significant_digits is how many leading decimal digits of a latency
+    are kept
+    """
+
+    def __init__(self, significant_digits=DEFAULT_SIGNIFICANT_DIGITS):
+        self.significant_digits = significant_digits
+        # Enough sub buckets to tell apart values that differ by one in
+        # the last significant digit
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10**significant_digits))
+        self._counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._total = 0
+
+    def _bucket_start(self, value):
+        shift = max(0, value.bit_length() - self._sub_bucket_bits)
+        return (value >> shift) << shift
+
+    def _bucket_end(self, start):
+        shift = max(0, start.bit_length() - self._sub_bucket_bits)
+        return start + (1 << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(round(seconds * _MICROSECONDS)))
+        start = self._bucket_start(value)
+        self._counts[start] = self._counts.get(start, 0) + 1
+        self.count += 1
+        self._total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Adds everything recorded in other to this histogram
+        """
+        if other.significant_digits != self.significant_digits:
+            raise ValueError(
+                "Cannot merge a histogram with {} significant digits into one "
+                "with {}".format(other.significant_digits, self.significant_digits)
+            )
+        for start, count in other._counts.items():
+            self._counts[start] = self._counts.get(start, 0) + count
+        self.count += other.count
+        self._total += other._total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return self._total / self.count / _MICROSECONDS if self.count else None
+
+    def value_at_percentile(self, percent):
+        """
+        Seconds that percent of the recorded latencies are at or under,
+        None if nothing was recorded. Reported as the top of the bucket the
+        percentile falls in, but never more than the largest latency seen
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for start in sorted(self._counts):
+            seen += self._counts[start]
+            if seen >= rank:
+                return min(self._bucket_end(start), self.max) / _MICROSECONDS
+        return self.max / _MICROSECONDS
+
+    def summary(self):
+        """
+        Returns a LatencySummary, None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        return LatencySummary(
+            p50=self.value_at_percentile(50),
+            p90=self.value_at_percentile(90),
+            p99=self.value_at_percentile(99),
+            max=self.max / _MICROSECONDS,
+        )
@@ -0,0 +1,276 @@
+"""
+Spread a load test or scenario over several processes.
+
+One process making requests tops out on the GIL well before most thrift
+services do. Here the run is split into shards, one per worker process.
+Each worker loads the thrifts itself, keeps its own connections, and
+takes its share of the concurrency, of the total_requests and of the rate.
+Workers that split a rate take turns along the timetable, so together
+they send on the same timetable one process would.
+
+Every `interval` seconds each worker sends the coordinator a snapshot of
+what it recorded since its last one (see ResponseRecorder.take_snapshot).
+The coordinator merges the snapshots into one recorder. The histograms
+add up bucket by bucket, so the merged percentiles are exactly what one
+process recording everything would report, not an average of percentiles.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+
+import attr
+
+from thrift_explorer.load_test import ResponseRecorder, run_load_test
+from thrift_explorer.scenario import ScenarioRecorder, Stage, run_scenario
+from thrift_explorer.thrift_manager import ThriftManager
+
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
+
+class LoadWorkerError(Exception):
+    """
+    A worker process failed part way through a run
+    """
+
+
+def _split(amount, parts):
+    """
+    amount split into parts whole numbers that differ by at most one
+    """
+    return [
+        amount // parts + (1 if part < amount % parts else 0) for part in range(parts)
+    ]
+
+
+@attr.s(frozen=True)
+class _LoadTestJob(object):
+    thrift_request = attr.ib()
+    settings = attr.ib()
+    phase = attr.ib(default=0.0)
+
+    def shard(self, processes):
+        settings = self.settings
+        # Every worker needs at least one connection of the concurrency
+        processes = min(processes, settings.concurrency)
+        if settings.total_requests is not None:
+            processes = min(processes, settings.total_requests)
+        totals = (
+            _split(settings.total_requests, processes)
+            if settings.total_requests is not None
+            else [None] * processes
+        )
+        return [
+            _LoadTestJob(
+                thrift_request=self.thrift_request,
+                settings=attr.evolve(
+                    settings,
+                    concurrency=concurrency,
+                    total_requests=total,
+                    target_rps=(
+                        settings.target_rps / processes if settings.target_rps else None
+                    ),
+                ),
+                phase=part / settings.target_rps if settings.target_rps else 0.0,
+            )
+            for part, (concurrency, total) in enumerate(
+                zip(_split(settings.concurrency, processes), totals)
+            )
+        ]
+
+    def new_recorder(self):
+        return ResponseRecorder()
+
+    def run(self, thrift_manager, recorder):
+        return run_load_test(
+            thrift_manager,
+            self.thrift_request,
+            self.settings,
+            recorder=recorder,
+            phase=self.phase,
+        ).seconds
+
+
+@attr.s(frozen=True)
+class _ScenarioJob(object):
+    scenario = attr.ib()
+    phase = attr.ib(default=0.0)
+
+    def shard(self, processes):
+        processes = min(processes, self.scenario.concurrency)
+        peak_rps = max(
+            max(stage.start_rps, stage.target_rps) for stage in self.scenario.stages
+        )
+        return [
+            _ScenarioJob(
+                scenario=attr.evolve(
+                    self.scenario,
+                    stages=[
+                        Stage(
+                            duration=stage.duration,
+                            target_rps=stage.target_rps / processes,
+                            start_rps=stage.start_rps / processes,
+                        )
+                        for stage in self.scenario.stages
+                    ],
+                    concurrency=concurrency,
+                    # Each worker picks its own calls and variables
+                    seed=(
+                        None
+                        if self.scenario.seed is None
+                        else "{}-{}".format(self.scenario.seed, part)
+                    ),
+                ),
+                phase=part / peak_rps if peak_rps else 0.0,
+            )
+            for part, concurrency in enumerate(
+                _split(self.scenario.concurrency, processes)
+            )
+        ]
+
+    def new_recorder(self):
+        return ScenarioRecorder([call.name for call in self.scenario.calls])
+
+    def run(self, thrift_manager, recorder):
+        return run_scenario(
+            thrift_manager, self.scenario, recorder=recorder, phase=self.phase
+        ).seconds
+
+
+def _work(worker, thrift_directory, job, messages, start, interval):
+    """
+    Runs in each worker process. Sends (worker, kind, value) to messages,
+    kind is one of
+        ready: loaded and waiting for start
+        snapshot: value is a snapshot of the worker's recorder
+        done: value is the seconds the run took
+        failed: value is why the run failed
+    """
+    try:
+        thrift_manager = ThriftManager(thrift_directory, lazy=True)
+        recorder = job.new_recorder()
+    except Exception as e:
+        messages.put((worker, "failed", repr(e)))
+        return
+    messages.put((worker, "ready", None))
+    start.wait()
+    finished = threading.Event()
+
+    def _stream():
+        while not finished.wait(interval):
+            messages.put((worker, "snapshot", recorder.take_snapshot()))
+
+    streamer = threading.Thread(target=_stream, daemon=True)
+    streamer.start()
+    try:
+        seconds = job.run(thrift_manager, recorder)
+    except Exception as e:
+        outcome = ("failed", repr(e))
+    else:
+        outcome = ("done", seconds)
+    finally:
+        finished.set()
+        streamer.join()
+    messages.put((worker, "snapshot", recorder.take_snapshot()))
+    messages.put((worker,) + outcome)
+
+
+def _run_in_processes(thrift_directory, job, processes, on_progress, interval):
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    start = context.Event()
+    shards = job.shard(processes)
+    workers = [
+        context.Process(
+            target=_work,
+            args=(worker, thrift_directory, shard, messages, start, interval),
+            name="thrift-load-worker-{}".format(worker),
+            daemon=True,
+        )
+        for worker, shard in enumerate(shards)
+    ]
+    recorder = job.new_recorder()
+    waiting_on = set(range(len(workers)))
+    not_ready = set(waiting_on)
+    seconds = []
+    for process in workers:
+        process.start()
+    try:
+        started = None
+        while waiting_on:
+            try:
+                worker, kind, value = messages.get(timeout=interval)
+            except queue.Empty:
+                for worker in waiting_on:
+                    if not workers[worker].is_alive():
+                        raise LoadWorkerError(
+                            "Worker {} exited with {}".format(
+                                worker, workers[worker].exitcode
+                            )
+                        )
+                continue
+            if kind == "failed":
+                raise LoadWorkerError("Worker {} failed: {}".format(worker, value))
+            if kind == "ready":
+                not_ready.discard(worker)
+                if not not_ready:
+                    started = time.monotonic()
+                    start.set()
+            elif kind == "snapshot":
+                recorder.merge(value)
+                if on_progress:
+                    on_progress(recorder.report(time.monotonic() - started))
+            elif kind == "done":
+                waiting_on.discard(worker)
+                seconds.append(value)
+    finally:
+        for process in workers:
+            if process.is_alive() and waiting_on:
+                process.terminate()
+            process.join()
+    return recorder.report(max(seconds))
+
+
+def load_test_in_processes(
+    thrift_directory,
+    thrift_request,
+    settings,
+    processes,
+    on_progress=None,
+    interval=DEFAULT_PROGRESS_INTERVAL,
+):
+    """
+    load_test.run_load_test split over processes worker processes, each
+    loading the thrifts in thrift_directory. on_progress is called with a
+    LoadTestReport of everything so far as snapshots come in.
+
+    Returns the LoadTestReport for the whole run. Raises LoadWorkerError
+    if a worker fails
+    """
+    return _run_in_processes(
+        thrift_directory,
+        _LoadTestJob(thrift_request=thrift_request, settings=settings),
+        processes,
+        on_progress,
+        interval,
+    )
+
+
+def scenario_in_processes(
+    thrift_directory,
+    scenario,
+    processes,
+    on_progress=None,
+    interval=DEFAULT_PROGRESS_INTERVAL,
+):
+    """
+    scenario.run_scenario split over processes worker processes, see
+    load_test_in_processes. Reports are ScenarioReports
+    """
+    return _run_in_processes(
+        thrift_directory,
+        _ScenarioJob(scenario=scenario),
+        processes,
+        on_progress,
+        interval,
+    )
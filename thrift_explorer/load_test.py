@@ -0,0 +1,393 @@
+"""
+Hammer one method of a service with the same request and see how it holds up.
+
+A load test runs a fixed number of requests or runs for a fixed time, with
+`concurrency` requests in flight at once. With a target_rps the requests
+are put on a timetable so no more than that many start each second.
+
+By default the test is closed loop, each worker sends its next request
+once the last one comes back. If the upstream stalls the workers stop
+sending, so the requests that would have been stuck behind the stall are
+never sent and never measured. An open loop test sends each request when
+the timetable says to whether or not earlier ones have come back, and
+measures latency from when the request was due rather than when it was
+actually sent. Waiting for a free worker counts against the upstream, the
+same as it would for a real client.
+
+Latencies go into LatencyHistograms so a long test does not keep every
+response around.
+
+Requests go through ThriftManager.make_request with a connection pool of
+their own, sized so every worker keeps its connection between requests
+"""
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+
+from thrift_explorer.connection_pool import ConnectionPool
+from thrift_explorer.histogram import LatencyHistogram
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_TOTAL_REQUESTS = 1000000
+DEFAULT_MAX_DURATION = 600.0
+
+
+@attr.s(frozen=True)
+class LoadTestSettings(object):
+    """
+    How hard and for how long to load a method
+        concurrency: int how many requests are in flight at once
+        total_requests: int stop after this many requests
+        duration: float stop starting requests after this many seconds
+        target_rps: float most requests to start a second, None for as many
+            as concurrency allows
+        open_loop: bool send requests on the target_rps timetable whether
+            or not earlier requests have come back
+
+    One of total_requests or duration is needed. With both the test stops
+    at whichever comes first. open_loop needs a target_rps
+    """
+
+    concurrency = attr.ib(default=1)
+    total_requests = attr.ib(default=None)
+    duration = attr.ib(default=None)
+    target_rps = attr.ib(default=None)
+    open_loop = attr.ib(default=False)
+
+
+@attr.s(frozen=True)
+class LoadTestLimits(object):
+    """
+    The most a load test sent to the server may ask for. Each worker is a
+    thread of the server's and the test holds on to the request until it
+    is done, so these keep one request from taking the server over. None
+    for no limit
+        max_concurrency: int
+        max_total_requests: int
+        max_duration: float seconds
+    """
+
+    max_concurrency = attr.ib(default=DEFAULT_MAX_CONCURRENCY)
+    max_total_requests = attr.ib(default=DEFAULT_MAX_TOTAL_REQUESTS)
+    max_duration = attr.ib(default=DEFAULT_MAX_DURATION)
+
+
+def _positive(request_json, name, convert, maximum=None):
+    value = request_json.get(name)
+    if value is None:
+        return None
+    try:
+        value = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError("'{}' must be a number".format(name))
+    if value <= 0:
+        raise ValueError("'{}' must be more than 0".format(name))
+    if maximum is not None and value > maximum:
+        raise ValueError("'{}' can be at most {}".format(name, maximum))
+    return value
+
+
+def parse_load_test_settings(request_json, limits=None):
+    """
+    Pulls the LoadTestSettings out of a load test request body. Raises
+    ValueError describing what is wrong with them, including going over
+    limits (a LoadTestLimits) when given
+    """
+    open_loop = request_json.get("open_loop", False)
+    if not isinstance(open_loop, bool):
+        raise ValueError("'open_loop' must be true or false")
+    limits = limits or LoadTestLimits(None, None, None)
+    settings = LoadTestSettings(
+        concurrency=_positive(request_json, "concurrency", int, limits.max_concurrency)
+        or 1,
+        total_requests=_positive(
+            request_json, "total_requests", int, limits.max_total_requests
+        ),
+        duration=_positive(request_json, "duration", float, limits.max_duration),
+        target_rps=_positive(request_json, "target_rps", float),
+        open_loop=open_loop,
+    )
+    if settings.total_requests is None and settings.duration is None:
+        raise ValueError("One of 'total_requests' or 'duration' is required")
+    if settings.open_loop and settings.target_rps is None:
+        raise ValueError("'target_rps' is required for an open loop test")
+    return settings
+
+
+@attr.s(frozen=True)
+class LoadTestReport(object):
+    """
+    What happened during a load test
+        requests: int how many requests were made
+        seconds: float how long the test took
+        throughput: float requests completed a second
+        statuses: dict[str, int] how many responses had each status
+        errors: int how many responses were not a Success
+        connect_seconds: LatencySummary of the time to get a connection,
+            None if no connection was made
+        call_seconds: LatencySummary of the time the calls took once
+            connected, None if no call was made
+        latency_seconds: LatencySummary of the time from when each request
+            was due on the timetable to when it came back. None without a
+            target_rps, as then there is no timetable
+    """
+
+    requests = attr.ib()
+    seconds = attr.ib()
+    throughput = attr.ib()
+    statuses = attr.ib()
+    errors = attr.ib()
+    connect_seconds = attr.ib()
+    call_seconds = attr.ib()
+    latency_seconds = attr.ib(default=None)
+
+
+@attr.s(frozen=True)
+class RecorderSnapshot(object):
+    """
+    What a ResponseRecorder recorded since its last snapshot
+        statuses: Counter of response statuses
+        connect, call, latency: LatencyHistograms
+    """
+
+    statuses = attr.ib()
+    connect = attr.ib()
+    call = attr.ib()
+    latency = attr.ib()
+
+
+class ResponseRecorder(object):
+    """
+    Collects the responses of a load test from every worker. Safe to
+    record to from many threads
+
+    Recorders in other processes can be added up exactly by sending their
+    snapshots (see take_snapshot) to one recorder to merge
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.connect = LatencyHistogram()
+        self.call = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def record(self, thrift_response, latency=None):
+        with self._lock:
+            self.statuses[thrift_response.status] += 1
+            # Failed connections have no timings at all
+            if thrift_response.time_to_connect is not None:
+                self.connect.record(thrift_response.time_to_connect.total_seconds())
+                self.call.record(thrift_response.time_to_make_request.total_seconds())
+            if latency is not None:
+                self.latency.record(latency)
+
+    def take_snapshot(self):
+        """
+        Returns a RecorderSnapshot of everything recorded since the last
+        snapshot, and starts afresh
+        """
+        with self._lock:
+            snapshot = RecorderSnapshot(
+                statuses=self.statuses,
+                connect=self.connect,
+                call=self.call,
+                latency=self.latency,
+            )
+            self.statuses = Counter()
+            self.connect = LatencyHistogram()
+            self.call = LatencyHistogram()
+            self.latency = LatencyHistogram()
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            self.statuses.update(snapshot.statuses)
+            self.connect.merge(snapshot.connect)
+            self.call.merge(snapshot.call)
+            self.latency.merge(snapshot.latency)
+
+    def report(self, seconds):
+        # Reports can be taken while workers are still recording
+        with self._lock:
+            requests = sum(self.statuses.values())
+            return LoadTestReport(
+                requests=requests,
+                seconds=seconds,
+                throughput=requests / seconds if seconds > 0 else 0.0,
+                statuses=dict(self.statuses),
+                errors=requests - self.statuses["Success"],
+                connect_seconds=self.connect.summary(),
+                call_seconds=self.call.summary(),
+                latency_seconds=self.latency.summary(),
+            )
+
+
+def build_report(thrift_responses, seconds):
+    recorder = ResponseRecorder()
+    for thrift_response in thrift_responses:
+        recorder.record(thrift_response)
+    return recorder.report(seconds)
+
+
+class _Schedule(object):
+    """
+    Hands out the requests of a load test on their timetable
+    """
+
+    def __init__(self, settings, started):
+        self._settings = settings
+        self._started = started
+        self._deadline = started + settings.duration if settings.duration else None
+        self._issued = 0
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        """
+        Blocks until the next request is due and returns when it was due
+        (time.monotonic()). Returns None once the test is over
+        """
+        with self._lock:
+            if (
+                self._settings.total_requests is not None
+                and self._issued >= self._settings.total_requests
+            ):
+                return None
+            if self._settings.target_rps:
+                due = self._started + self._issued / self._settings.target_rps
+            else:
+                due = time.monotonic()
+            if self._deadline is not None and due >= self._deadline:
+                return None
+            self._issued += 1
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return due
+
+
+def _run_closed_loop(schedule, make_request, thrift_request, concurrency):
+    failures = []
+
+    def _work():
+        while not failures:
+            due = schedule.next_request()
+            if due is None:
+                return
+            try:
+                make_request(due, thrift_request)
+            except BaseException as e:
+                failures.append(e)
+                raise
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="thrift-load-test"
+    ) as executor:
+        for _ in range(concurrency):
+            executor.submit(_work)
+    if failures:
+        raise failures[0]
+
+
+def run_open_loop(timetable, make_request, concurrency):
+    """
+    timetable yields (due, thrift_request) pairs in order of due, a
+    time.monotonic(). Once each comes due make_request(due, thrift_request)
+    is called on one of up to concurrency threads, whether or not earlier
+    calls have returned. Requests due while every thread is busy queue up
+    for one. Stops and raises if make_request raises
+    """
+    failures = []
+
+    def _make_request(due, thrift_request):
+        try:
+            make_request(due, thrift_request)
+        except BaseException as e:
+            failures.append(e)
+            raise
+
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="thrift-load-test"
+    ) as executor:
+        for due, thrift_request in timetable:
+            if failures:
+                break
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(_make_request, due, thrift_request)
+    if failures:
+        raise failures[0]
+
+
+def run_load_test(thrift_manager, thrift_request, settings, recorder=None, phase=0.0):
+    """
+    Makes thrift_request (already validated) over and over as described
+    by settings, a LoadTestSettings. Returns a LoadTestReport
+
+    Responses are recorded to recorder if given. phase shifts the
+    timetable later by that many seconds, so processes splitting a
+    target_rps between them can take turns (see load_processes)
+    """
+    connection_pool = ConnectionPool(max_size=settings.concurrency)
+    recorder = recorder or ResponseRecorder()
+
+    def _make_request(due, thrift_request):
+        thrift_response = thrift_manager.make_request(
+            thrift_request, connection_pool=connection_pool
+        )
+        recorder.record(
+            thrift_response, time.monotonic() - due if settings.target_rps else None
+        )
+
+    try:
+        started = time.monotonic()
+        schedule = _Schedule(settings, started + phase)
+        if settings.open_loop:
+            run_open_loop(
+                ((due, thrift_request) for due in iter(schedule.next_request, None)),
+                _make_request,
+                settings.concurrency,
+            )
+        else:
+            _run_closed_loop(
+                schedule, _make_request, thrift_request, settings.concurrency
+            )
+        seconds = time.monotonic() - started
+    finally:
+        connection_pool.close()
+    return recorder.report(seconds)
+
+
+def stream_load_test(thrift_manager, thrift_request, settings, interval=1.0):
+    """
+    run_load_test on a thread of its own. Yields ("progress", LoadTestReport)
+    with everything so far every interval seconds while the test runs, then
+    ("summary", LoadTestReport) for the whole test. Closing the generator
+    early does not stop the test, it runs to the end in the background
+    """
+    recorder = ResponseRecorder()
+    outcome = {}
+
+    def _run():
+        try:
+            outcome["report"] = run_load_test(
+                thrift_manager, thrift_request, settings, recorder=recorder
+            )
+        except Exception as e:
+            outcome["error"] = e
+
+    started = time.monotonic()
+    runner = threading.Thread(target=_run, name="load-test", daemon=True)
+    runner.start()
+    while True:
+        runner.join(interval)
+        if not runner.is_alive():
+            break
+        yield "progress", recorder.report(time.monotonic() - started)
+    if "error" in outcome:
+        raise outcome["error"]
+    yield "summary", outcome["report"]
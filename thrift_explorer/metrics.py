@@ -0,0 +1,426 @@
+"""
+Prometheus metrics for the calls made through the server.
+
+Each process counts into a Metrics of its own. Under gunicorn a scrape of
+/metrics lands on one worker, so with a directory set every process also
+writes what it has counted to a file of its own there, every
+flush_interval seconds and whenever it renders, and render adds up the
+files of every process. Counters and histograms of processes that have
+exited are kept so totals never go backwards. Gauges only count the
+processes still running. Empty the directory before starting the server
+(gunicorn_preload does this for you) so a new server does not carry on
+from the last one's totals.
+
+Labels are only ever thrift, service and method names the server knows
+about plus statuses and error codes, so a client sending made up names
+cannot make the number of series grow without bound.
+"""
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+import attr
+
+from thrift_explorer.communication_models import (
+    CallTimings,
+    CommunicationModelEncoder,
+)
+
+CONTENT_TYPE = {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (
+    0.00001,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    20.0,
+)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (type, help, buckets for histograms)
+_METRICS = OrderedDict(
+    [
+        (
+            "thrift_explorer_calls_total",
+            (
+                "counter",
+                "Calls made to thrift services. status is Success, "
+                "ServerError, ConnectionError or the declared exception thrown",
+                None,
+            ),
+        ),
+        (
+            "thrift_explorer_call_duration_seconds",
+            ("histogram", "Time taken by the call itself", LATENCY_BUCKETS),
+        ),
+        (
+            "thrift_explorer_connect_duration_seconds",
+            ("histogram", "Time taken to get a connection", LATENCY_BUCKETS),
+        ),
+        (
+            "thrift_explorer_call_phase_duration_seconds",
+            (
+                "histogram",
+                "Time taken by each phase of a call, see CallTimings. Shows "
+                "whether the time went on the upstream (server_wait) or here",
+                LATENCY_BUCKETS,
+            ),
+        ),
+        (
+            "thrift_explorer_request_size_bytes",
+            ("histogram", "Size of the JSON request body of a call", SIZE_BUCKETS),
+        ),
+        (
+            "thrift_explorer_response_size_bytes",
+            ("histogram", "Size of the JSON response of a call", SIZE_BUCKETS),
+        ),
+        (
+            "thrift_explorer_validation_failures_total",
+            ("counter", "Requests refused before calling the service", None),
+        ),
+        (
+            "thrift_explorer_pool_hits_total",
+            ("counter", "Calls that reused a pooled connection", None),
+        ),
+        (
+            "thrift_explorer_pool_misses_total",
+            ("counter", "Calls that had to open a connection", None),
+        ),
+        (
+            "thrift_explorer_pool_idle_connections",
+            ("gauge", "Connections waiting in the pool", None),
+        ),
+        (
+            "thrift_explorer_pool_in_use_connections",
+            ("gauge", "Connections checked out of the pool", None),
+        ),
+    ]
+)
+
+
+def pool_sampler(pool_name, pool):
+    """
+    A sampler (see Metrics.add_sampler) for a ConnectionPool or
+    AsyncConnectionPool
+    """
+    labels = (("pool", pool_name),)
+
+    def _sample():
+        try:
+            stats = pool.stats()
+        except RuntimeError:
+            # An AsyncConnectionPool changed on its loop while we read it
+            return []
+        return [
+            ("thrift_explorer_pool_hits_total", labels, stats["hits"]),
+            ("thrift_explorer_pool_misses_total", labels, stats["misses"]),
+            ("thrift_explorer_pool_idle_connections", labels, stats["idle"]),
+            ("thrift_explorer_pool_in_use_connections", labels, stats["in_use"]),
+        ]
+
+    return _sample
+
+
+def _call_labels(thrift_request):
+    return (
+        ("thrift", thrift_request.thrift_file),
+        ("service", thrift_request.service_name),
+        ("method", thrift_request.endpoint_name),
+    )
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join('{}="{}"'.format(name, _escape(value)) for name, value in labels)
+    )
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics(object):
+    """
+    Counts calls for /metrics. Safe to record to from many threads
+
+    directory: str or None
+        where processes share what they counted, see above
+    """
+
+    def __init__(self, directory=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._samplers = []
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        # Tells this process's file from one left by an earlier process
+        # that had the same pid
+        self._file_name = "{}-{}.json".format(self._pid, uuid.uuid4().hex)
+        self._counters = defaultdict(float)
+        # (name, labels) to the list observe keeps for a histogram
+        self._histograms = {}
+        self._flushing = False
+
+    def _check_fork(self):
+        # What the parent counted is in the parent's file, start afresh.
+        # Call holding the lock
+        if self._pid != os.getpid():
+            self._reset()
+
+    def add_sampler(self, sampler):
+        """
+        sampler() returns (name, labels, value) for metrics read from
+        elsewhere when the metrics are flushed or rendered, like pool stats
+        """
+        self._samplers.append(sampler)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            self._check_fork()
+            self._counters[(name, labels)] += amount
+        self._start_flushing()
+
+    def observe(self, name, labels, value):
+        buckets = _METRICS[name][2]
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                # A count per bucket, one for +Inf, then the sum and count
+                histogram = self._histograms[(name, labels)] = [0] * (len(buckets) + 3)
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[position] += 1
+                    break
+            else:
+                histogram[len(buckets)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        self._start_flushing()
+
+    def record_call(self, thrift_response, response_size):
+        """
+        Counts a ThriftResponse, response_size being how big it came out
+        as JSON
+        """
+        thrift_request = thrift_response.request
+        labels = _call_labels(thrift_request)
+        self.increment(
+            "thrift_explorer_calls_total",
+            labels + (("status", thrift_response.status),),
+        )
+        if thrift_response.time_to_make_request is not None:
+            self.observe(
+                "thrift_explorer_call_duration_seconds",
+                labels,
+                thrift_response.time_to_make_request.total_seconds(),
+            )
+        if thrift_response.time_to_connect is not None:
+            self.observe(
+                "thrift_explorer_connect_duration_seconds",
+                labels,
+                thrift_response.time_to_connect.total_seconds(),
+            )
+        for field in attr.fields(CallTimings):
+            nanoseconds = getattr(thrift_response.timings, field.name)
+            if nanoseconds is not None:
+                self.observe(
+                    "thrift_explorer_call_phase_duration_seconds",
+                    labels + (("phase", field.name[: -len("_ns")]),),
+                    nanoseconds / 1e9,
+                )
+        self.observe(
+            "thrift_explorer_request_size_bytes",
+            labels,
+            len(json.dumps(thrift_request.request_body, cls=CommunicationModelEncoder)),
+        )
+        self.observe("thrift_explorer_response_size_bytes", labels, response_size)
+
+    def record_invalid(self, errors, thrift="", service="", method=""):
+        """
+        Counts each of errors, the validation errors that refused a
+        request. Leave out names the server does not know
+        """
+        for error in errors:
+            self.increment(
+                "thrift_explorer_validation_failures_total",
+                (
+                    ("thrift", thrift),
+                    ("service", service),
+                    ("method", method),
+                    ("code", error.code.name),
+                ),
+            )
+
+    def _snapshot(self):
+        with self._lock:
+            self._check_fork()
+            counters = list(self._counters.items())
+            histograms = [(key, list(value)) for key, value in self._histograms.items()]
+        gauges = []
+        for sampler in self._samplers:
+            for name, labels, value in sampler():
+                if _METRICS[name][0] == "counter":
+                    counters.append(((name, labels), value))
+                else:
+                    gauges.append(((name, labels), value))
+        return {
+            "pid": self._pid,
+            "counters": [[name, labels, value] for (name, labels), value in counters],
+            "histograms": [
+                [name, labels, value] for (name, labels), value in histograms
+            ],
+            "gauges": [[name, labels, value] for (name, labels), value in gauges],
+        }
+
+    def flush(self):
+        """
+        Writes this process's metrics to its file in directory
+        """
+        snapshot = self._snapshot()
+        path = os.path.join(self.directory, self._file_name)
+        with open(path + ".tmp", "w") as outfile:
+            json.dump(snapshot, outfile)
+        # Readers only ever see a whole file
+        os.replace(path + ".tmp", path)
+
+    def _flush_regularly(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _start_flushing(self):
+        if self.directory is None or self._flushing:
+            return
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+        threading.Thread(
+            target=self._flush_regularly, name="metrics-flush", daemon=True
+        ).start()
+
+    def _snapshots(self):
+        if self.directory is None:
+            return [self._snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as infile:
+                    snapshots.append(json.load(infile))
+            except (OSError, ValueError):
+                # Cleared out from under us
+                continue
+        return snapshots
+
+    def render(self):
+        """
+        Everything counted so far, by every process sharing directory, in
+        the Prometheus text format
+        """
+        counters = defaultdict(float)
+        gauges = defaultdict(float)
+        histograms = {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot["counters"]:
+                counters[(name, tuple(map(tuple, labels)))] += value
+            if _is_running(snapshot["pid"]):
+                for name, labels, value in snapshot["gauges"]:
+                    gauges[(name, tuple(map(tuple, labels)))] += value
+            for name, labels, value in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                if key in histograms:
+                    histograms[key] = [
+                        mine + theirs for mine, theirs in zip(histograms[key], value)
+                    ]
+                else:
+                    histograms[key] = value
+        lines = []
+        for name, (kind, help_text, buckets) in _METRICS.items():
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            if kind == "histogram":
+                for (metric, labels), value in sorted(histograms.items()):
+                    if metric == name:
+                        lines.extend(
+                            self._histogram_lines(name, labels, buckets, value)
+                        )
+                continue
+            values = counters if kind == "counter" else gauges
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(
+                        "{}{} {}".format(
+                            name, _format_labels(labels), _format_number(value)
+                        )
+                    )
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name, labels, buckets, value):
+        cumulative = 0
+        for bound, count in zip(buckets + (float("inf"),), value[:-2]):
+            cumulative += count
+            yield "{}_bucket{} {}".format(
+                name,
+                _format_labels(labels + (("le", _format_number(bound)),)),
+                cumulative,
+            )
+        yield "{}_sum{} {}".format(name, _format_labels(labels), repr(value[-2]))
+        yield "{}_count{} {}".format(name, _format_labels(labels), value[-1])
+
+
+def clear_directory(directory):
+    """
+    Removes the files processes left in a metrics directory
+    """
+    for path in glob.glob(os.path.join(directory, "*.json*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,482 @@
+"""
+Mixed traffic across many methods, described in a file.
+
+A scenario is a JSON (or YAML, with PyYAML installed) file like
+
+    {
+        "concurrency": 16,
+        "variables": {"host": "localhost", "task_id": ["1", "2", "3"]},
+        "defaults": {"host": "${host}", "port": 6000},
+        "stages": [
+            {"duration": 30, "start_rps": 10, "target_rps": 200},
+            {"duration": 120, "target_rps": 200}
+        ],
+        "calls": [
+            {"thrift": "todo", "service": "TodoService", "method": "getTask",
+             "weight": 8, "request_body": {"taskId": "${task_id}"}},
+            {"thrift": "todo", "service": "TodoService", "method": "createTask",
+             "weight": 1, "request_body": {"description": "task ${sequence}",
+                                           "dueDate": "${timestamp_ms}"}}
+        ]
+    }
+
+Each call looks like the body of a normal request plus the thrift, service
+and method it is for, and a weight. Anything in "defaults" is used for a
+call that does not say otherwise. Each request picks a call at random in
+proportion to the weights.
+
+Stages run one after the other. Within a stage the rate goes in a straight
+line from start_rps (target_rps if not given) to target_rps, so a stage
+with a start_rps ramps up. Requests are sent open loop (see load_test).
+
+${name} in a string is replaced by a variable. A variable with a list of
+values gets one picked at random for each request. Built in are
+    sequence: how many requests came before this one in the run
+    uuid: a fresh uuid4
+    timestamp_ms: milliseconds since the epoch
+A string that is nothing but one variable takes the variable's value as
+is, so "${port}" can stand for a number
+"""
+import json
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
+
+import attr
+
+from thrift_explorer.communication_models import ThriftRequest, ThriftResponse
+from thrift_explorer.connection_pool import ConnectionPool
+from thrift_explorer.load_test import ResponseRecorder, run_open_loop
+from thrift_explorer.views import add_extension_if_needed
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+_VARIABLE = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}")
+_BUILT_IN_VARIABLES = ("sequence", "uuid", "timestamp_ms")
+
+
+class ScenarioError(Exception):
+    """
+    The scenario cannot be run as written
+    """
+
+
+@attr.s(frozen=True)
+class Stage(object):
+    """
+    One stretch of a scenario
+        duration: float seconds the stage lasts
+        target_rps: float requests a second by the end of the stage
+        start_rps: float requests a second at the start of the stage
+    """
+
+    duration = attr.ib()
+    target_rps = attr.ib()
+    start_rps = attr.ib()
+
+
+@attr.s(frozen=True)
+class ScenarioCall(object):
+    """
+    One of the calls a scenario makes
+        name: str what the call is reported as
+        thrift_file: str
+        service_name: str
+        endpoint_name: str
+        weight: float how often the call is made relative to the others
+        template: dict the request (host, port, protocol, transport,
+            request_body) with ${variables} still in it
+    """
+
+    name = attr.ib()
+    thrift_file = attr.ib()
+    service_name = attr.ib()
+    endpoint_name = attr.ib()
+    weight = attr.ib()
+    template = attr.ib()
+
+
+@attr.s(frozen=True)
+class Scenario(object):
+    """
+    calls: list[ScenarioCall]
+    stages: list[Stage]
+    concurrency: int how many requests can be in flight at once
+    variables: dict[str, value or list of values]
+    seed: picks the same calls and variables each run when set
+    """
+
+    calls = attr.ib()
+    stages = attr.ib()
+    concurrency = attr.ib()
+    variables = attr.ib()
+    seed = attr.ib(default=None)
+
+
+@attr.s(frozen=True)
+class ScenarioReport(object):
+    """
+    seconds: float how long the scenario took
+    total: LoadTestReport over every request
+    calls: dict[str, LoadTestReport] keyed by call name
+    """
+
+    seconds = attr.ib()
+    total = attr.ib()
+    calls = attr.ib()
+
+
+class ScenarioRecorder(object):
+    """
+    A ResponseRecorder for the whole scenario and one for each call.
+    Snapshots and merges like a ResponseRecorder does
+    """
+
+    def __init__(self, call_names):
+        self.total = ResponseRecorder()
+        self.calls = OrderedDict((name, ResponseRecorder()) for name in call_names)
+
+    def record(self, call_name, thrift_response, latency):
+        self.total.record(thrift_response, latency)
+        self.calls[call_name].record(thrift_response, latency)
+
+    def take_snapshot(self):
+        return (
+            self.total.take_snapshot(),
+            {name: recorder.take_snapshot() for name, recorder in self.calls.items()},
+        )
+
+    def merge(self, snapshot):
+        total, calls = snapshot
+        self.total.merge(total)
+        for name, call_snapshot in calls.items():
+            self.calls[name].merge(call_snapshot)
+
+    def report(self, seconds):
+        return ScenarioReport(
+            seconds=seconds,
+            total=self.total.report(seconds),
+            calls=OrderedDict(
+                (name, recorder.report(seconds))
+                for name, recorder in self.calls.items()
+            ),
+        )
+
+
+def _variables_in(value):
+    if isinstance(value, str):
+        return set(_VARIABLE.findall(value))
+    if isinstance(value, dict):
+        return set().union(*[_variables_in(item) for item in value.values()])
+    if isinstance(value, list):
+        return set().union(*[_variables_in(item) for item in value])
+    return set()
+
+
+def render(value, variables):
+    """
+    value with every ${variable} replaced from variables
+    """
+    if isinstance(value, str):
+        whole = _VARIABLE.fullmatch(value)
+        if whole:
+            return variables[whole.group(1)]
+        return _VARIABLE.sub(lambda match: str(variables[match.group(1)]), value)
+    if isinstance(value, dict):
+        return {key: render(item, variables) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item, variables) for item in value]
+    return value
+
+
+def _number(json_object, name, where, default=None, minimum=0):
+    value = json_object.get(name, default)
+    if value is None:
+        raise ScenarioError("{} needs a '{}'".format(where, name))
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ScenarioError("'{}' in {} must be a number".format(name, where))
+    if value < minimum:
+        raise ScenarioError(
+            "'{}' in {} must be at least {}".format(name, where, minimum)
+        )
+    return value
+
+
+def _parse_stage(stage_json, position):
+    where = "stage {}".format(position)
+    if not isinstance(stage_json, dict):
+        raise ScenarioError("{} must be an object".format(where))
+    target_rps = _number(stage_json, "target_rps", where)
+    return Stage(
+        duration=_number(stage_json, "duration", where, minimum=0.001),
+        target_rps=target_rps,
+        start_rps=_number(stage_json, "start_rps", where, default=target_rps),
+    )
+
+
+def _parse_call(call_json, position, defaults):
+    where = "call {}".format(position)
+    if not isinstance(call_json, dict):
+        raise ScenarioError("{} must be an object".format(where))
+    for field in ("thrift", "service", "method"):
+        if not isinstance(call_json.get(field), str):
+            raise ScenarioError("{} needs a '{}'".format(where, field))
+    template = dict(defaults)
+    template.update(
+        (key, value)
+        for key, value in call_json.items()
+        if key in ("host", "port", "protocol", "transport", "request_body")
+    )
+    template.setdefault("request_body", {})
+    thrift_file = add_extension_if_needed(call_json["thrift"])
+    return ScenarioCall(
+        name=call_json.get("name")
+        or "{}/{}/{}".format(thrift_file, call_json["service"], call_json["method"]),
+        thrift_file=thrift_file,
+        service_name=call_json["service"],
+        endpoint_name=call_json["method"],
+        weight=_number(call_json, "weight", where, default=1),
+        template=template,
+    )
+
+
+def parse_scenario(scenario_json, default_protocol, default_transport):
+    """
+    Builds a Scenario out of the parsed scenario file. Raises ScenarioError
+    saying what is wrong with it
+    """
+    if not isinstance(scenario_json, dict):
+        raise ScenarioError("A scenario must be an object")
+    variables = scenario_json.get("variables", {})
+    defaults = scenario_json.get("defaults", {})
+    if not isinstance(variables, dict) or not isinstance(defaults, dict):
+        raise ScenarioError("'variables' and 'defaults' must be objects")
+    defaults = dict(
+        {"protocol": default_protocol, "transport": default_transport}, **defaults
+    )
+    calls = [
+        _parse_call(call_json, position, defaults)
+        for position, call_json in enumerate(scenario_json.get("calls") or [])
+    ]
+    stages = [
+        _parse_stage(stage_json, position)
+        for position, stage_json in enumerate(scenario_json.get("stages") or [])
+    ]
+    if not calls:
+        raise ScenarioError("A scenario needs at least one call")
+    if not stages:
+        raise ScenarioError("A scenario needs at least one stage")
+    if not sum(call.weight for call in calls):
+        raise ScenarioError("At least one call needs a weight above 0")
+    names = [call.name for call in calls]
+    for name in names:
+        if names.count(name) > 1:
+            raise ScenarioError("More than one call is named '{}'".format(name))
+    known = set(variables) | set(_BUILT_IN_VARIABLES)
+    for call in calls:
+        unknown = _variables_in(call.template) - known
+        if unknown:
+            raise ScenarioError(
+                "Call '{}' uses unknown variables {}".format(
+                    call.name, ", ".join(sorted(unknown))
+                )
+            )
+    return Scenario(
+        calls=calls,
+        stages=stages,
+        concurrency=int(_number(scenario_json, "concurrency", "scenario", 1, 1)),
+        variables=variables,
+        seed=scenario_json.get("seed"),
+    )
+
+
+def load_scenario(
+    path, default_protocol="TBinaryProtocol", default_transport="TBufferedTransport"
+):
+    """
+    Reads and parses the scenario file at path, YAML if it ends in .yaml
+    or .yml and JSON otherwise
+    """
+    with open(path, encoding="utf-8") as scenario_file:
+        text = scenario_file.read()
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise ScenarioError("PyYAML is needed to read YAML scenarios")
+        try:
+            scenario_json = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ScenarioError("Could not read {}: {}".format(path, e))
+    else:
+        try:
+            scenario_json = json.loads(text)
+        except ValueError as e:
+            raise ScenarioError("Could not read {}: {}".format(path, e))
+    return parse_scenario(scenario_json, default_protocol, default_transport)
+
+
+def scenario_from_postman(collection, stage=None):
+    """
+    Turns the calls in a Postman collection (like the one in the root of
+    this repo) into a scenario, one call with a weight of 1 for each POST
+    to a method. stage is the one stage the scenario runs
+    """
+    calls = []
+    for item in collection.get("item", []):
+        request = item.get("request", {})
+        path = [part for part in request.get("url", {}).get("path", []) if part]
+        if request.get("method") != "POST" or len(path) != 3:
+            continue
+        call = json.loads(request.get("body", {}).get("raw") or "{}")
+        call["name"] = item.get("name")
+        call["thrift"], call["service"], call["method"] = path
+        calls.append(call)
+    return {
+        "concurrency": 4,
+        "stages": [stage or {"duration": 60, "target_rps": 10}],
+        "calls": calls,
+    }
+
+
+def _due_times(stages, started):
+    """
+    When each request of the scenario is due (time.monotonic())
+    """
+    stage_started = started
+    for stage in stages:
+        # The rate changes at a steady slope, so by t seconds into the
+        # stage start_rps * t + slope * t ** 2 / 2 requests are due and
+        # the whole stage sends the average rate times its duration
+        slope = (stage.target_rps - stage.start_rps) / stage.duration
+        requests = (stage.start_rps + stage.target_rps) / 2 * stage.duration
+        sent = 0
+        while sent < requests:
+            if slope:
+                # Ramping down this only reaches 0 at the very end of the
+                # stage, rounding can take it just below
+                discriminant = max(0, stage.start_rps**2 + 2 * slope * sent)
+                offset = (-stage.start_rps + discriminant**0.5) / slope
+            else:
+                offset = sent / stage.start_rps
+            if offset >= stage.duration:
+                break
+            yield stage_started + offset
+            sent += 1
+        stage_started += stage.duration
+
+
+def _build_request(scenario, call, chooser, sequence):
+    variables = {
+        name: chooser.choice(value) if isinstance(value, list) else value
+        for name, value in scenario.variables.items()
+    }
+    variables.update(
+        sequence=sequence,
+        uuid=str(uuid.UUID(int=chooser.getrandbits(128), version=4)),
+        timestamp_ms=int(time.time() * 1000),
+    )
+    request_json = render(call.template, variables)
+    return ThriftRequest(
+        thrift_file=call.thrift_file,
+        service_name=call.service_name,
+        endpoint_name=call.endpoint_name,
+        host=request_json.get("host"),
+        port=request_json.get("port"),
+        protocol=request_json.get("protocol"),
+        transport=request_json.get("transport"),
+        request_body=request_json.get("request_body"),
+    )
+
+
+def _validation_errors(thrift_manager, thrift_request):
+    """
+    Why thrift_manager would refuse thrift_request, None if it would not
+    """
+    try:
+        errors = thrift_manager.validate_request(thrift_request)
+    except (TypeError, ValueError) as e:
+        errors = [e]
+    if not errors:
+        return None
+    return "; ".join(str(getattr(error, "message", error)) for error in errors)
+
+
+def check_scenario(thrift_manager, scenario):
+    """
+    Raises ScenarioError if a call of the scenario would be refused
+    """
+    chooser = random.Random(scenario.seed)
+    for call in scenario.calls:
+        try:
+            errors = _validation_errors(
+                thrift_manager, _build_request(scenario, call, chooser, 0)
+            )
+        except (TypeError, ValueError) as e:
+            errors = str(e)
+        if errors:
+            raise ScenarioError("Call '{}' is not valid: {}".format(call.name, errors))
+
+
+def run_scenario(thrift_manager, scenario, recorder=None, phase=0.0):
+    """
+    Runs scenario (see parse_scenario) and returns a ScenarioReport.
+    Raises ScenarioError without sending anything if a call would be
+    refused. Variables can still make later requests invalid, those are
+    recorded as InvalidRequest and not sent
+
+    Responses are recorded to recorder, a ScenarioRecorder, if given.
+    phase shifts the timetable later by that many seconds, see
+    load_test.run_load_test
+    """
+    check_scenario(thrift_manager, scenario)
+    chooser = random.Random(scenario.seed)
+    weights = [call.weight for call in scenario.calls]
+    connection_pool = ConnectionPool(max_size=scenario.concurrency)
+    recorder = recorder or ScenarioRecorder([call.name for call in scenario.calls])
+
+    def _timetable():
+        # Calls and variables are picked here on the one dispatching thread
+        # so a seeded run picks the same ones every time
+        for sequence, due in enumerate(_due_times(scenario.stages, started + phase)):
+            call = chooser.choices(scenario.calls, weights)[0]
+            try:
+                thrift_request = _build_request(scenario, call, chooser, sequence)
+            except (TypeError, ValueError) as e:
+                # A variable made the request invalid, it is never sent
+                thrift_request = str(e)
+            yield due, (call, thrift_request)
+
+    def _make_request(due, planned):
+        call, thrift_request = planned
+        if not isinstance(thrift_request, str):
+            # Validated here rather than on the dispatching thread so the
+            # timetable is not held up. Anything sent unvalidated could
+            # fail translating it and stop the whole run
+            errors = _validation_errors(thrift_manager, thrift_request)
+            if errors:
+                thrift_request = errors
+        if isinstance(thrift_request, str):
+            thrift_response = ThriftResponse(
+                status="InvalidRequest",
+                request=None,
+                data=thrift_request,
+                time_to_make_request=None,
+                time_to_connect=None,
+            )
+        else:
+            thrift_response = thrift_manager.make_request(
+                thrift_request, connection_pool=connection_pool
+            )
+        recorder.record(call.name, thrift_response, time.monotonic() - due)
+
+    try:
+        started = time.monotonic()
+        run_open_loop(_timetable(), _make_request, scenario.concurrency)
+        seconds = time.monotonic() - started
+    finally:
+        connection_pool.close()
+    return recorder.report(seconds)
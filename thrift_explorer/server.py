@@ -1,170 +1,267 @@
-import json
+import logging
 import os
+import threading
+import time
 
-import attr
 from flask import Flask, request
 
-from thrift_explorer.communication_models import (
-    CommunicationModelEncoder,
-    Error,
-    ErrorCode,
-    ThriftRequest,
+from thrift_explorer.async_connection_pool import AsyncConnectionPool
+from thrift_explorer.connection_pool import (
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_MAX_SIZE,
+    ConnectionPool,
+)
+from thrift_explorer.load_test import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_DURATION,
+    DEFAULT_MAX_TOTAL_REQUESTS,
+    LoadTestLimits,
+    run_load_test,
+    stream_load_test,
+)
+from thrift_explorer.metrics import Metrics, pool_sampler
+from thrift_explorer.thrift_manager import DEFAULT_BATCH_WORKERS, ThriftManager
+from thrift_explorer.thrift_state import ReloadError
+from thrift_explorer.views import (
+    ThriftExplorerViews,
+    log_reload,
+    parse_flag,
+    wants_ndjson,
 )
-from thrift_explorer.thrift_manager import ThriftManager
-
-JSON_CONTENT_TYPE = {"Content-Type": "application/json; charset=utf-8"}
-TEXT_CONTENT_TYPE = {"Content-Type": "text/plain; charset=utf-8"}
 
 THRIFT_DIRECTORY_ENV = "THRIFT_DIRECTORY"
 DEFAULT_PROTOCOL_ENV = "DEFAULT_THRIFT_PROTOCOL"
 DEFAULT_TRANSPORT_ENV = "DEFAULT_THRIFT_TRANSPORT"
+POOL_MAX_SIZE_ENV = "CONNECTION_POOL_MAX_SIZE"
+POOL_IDLE_TIMEOUT_ENV = "CONNECTION_POOL_IDLE_TIMEOUT"
+LOAD_WORKERS_ENV = "THRIFT_LOAD_WORKERS"
+CACHE_DIRECTORY_ENV = "THRIFT_CACHE_DIRECTORY"
+LAZY_LOAD_ENV = "THRIFT_LAZY_LOAD"
+RELOAD_INTERVAL_ENV = "THRIFT_RELOAD_INTERVAL"
+BATCH_WORKERS_ENV = "BATCH_REQUEST_WORKERS"
+METRICS_DIRECTORY_ENV = "THRIFT_METRICS_DIRECTORY"
+LOAD_TEST_MAX_CONCURRENCY_ENV = "LOAD_TEST_MAX_CONCURRENCY"
+LOAD_TEST_MAX_REQUESTS_ENV = "LOAD_TEST_MAX_REQUESTS"
+LOAD_TEST_MAX_DURATION_ENV = "LOAD_TEST_MAX_DURATION"
 
+# See start_threads_after_fork
+_threads_after_fork = False
+# Where create_app keeps the background threads it has not started yet
+_BACKGROUND_THREADS = "thrift_explorer.background_threads"
 
-def create_app():
-    app = Flask(__name__)
-    app.config[THRIFT_DIRECTORY_ENV] = os.environ[THRIFT_DIRECTORY_ENV]
-    app.config[DEFAULT_PROTOCOL_ENV] = os.environ.get(
-        DEFAULT_PROTOCOL_ENV, "TBinaryProtocol"
+
+def start_threads_after_fork():
+    """
+    Threads do not survive a fork. When the app is built in a process
+    that forks the workers (see gunicorn_preload) call this first, and
+    create_app leaves background threads like the directory watcher for
+    start_background_threads to start in each forked worker
+    """
+    global _threads_after_fork
+    _threads_after_fork = True
+
+
+def start_background_threads(app):
+    """
+    Starts the background threads create_app held back, see
+    start_threads_after_fork. Returns the threads started, they are only
+    ever started once per process
+    """
+    return [start() for start in app.extensions.pop(_BACKGROUND_THREADS, [])]
+
+
+def _watch_thrift_directory(logger, thrift_manager, interval):
+    """
+    Returns a function that starts a thread reloading the thrifts every
+    interval seconds and returns the thread
+    """
+
+    def _poll():
+        while True:
+            time.sleep(interval)
+            try:
+                report = thrift_manager.reload()
+            except ReloadError as e:
+                logger.warning(str(e))
+                continue
+            if report.reloaded or report.removed:
+                log_reload(logger, report)
+
+    def _start():
+        watcher = threading.Thread(target=_poll, name="thrift-reload", daemon=True)
+        watcher.start()
+        return watcher
+
+    return _start
+
+
+def load_config(environ=None):
+    """
+    Reads the settings from the environment (or environ when given) into
+    a dict keyed by the names of the environment variables
+    """
+    if environ is None:
+        environ = os.environ
+    return {
+        THRIFT_DIRECTORY_ENV: environ[THRIFT_DIRECTORY_ENV],
+        DEFAULT_PROTOCOL_ENV: environ.get(DEFAULT_PROTOCOL_ENV, "TBinaryProtocol"),
+        DEFAULT_TRANSPORT_ENV: environ.get(DEFAULT_TRANSPORT_ENV, "TBufferedTransport"),
+        POOL_MAX_SIZE_ENV: int(environ.get(POOL_MAX_SIZE_ENV, DEFAULT_MAX_SIZE)),
+        POOL_IDLE_TIMEOUT_ENV: float(
+            environ.get(POOL_IDLE_TIMEOUT_ENV, DEFAULT_IDLE_TIMEOUT)
+        ),
+        LOAD_WORKERS_ENV: int(environ.get(LOAD_WORKERS_ENV, 1)),
+        CACHE_DIRECTORY_ENV: environ.get(CACHE_DIRECTORY_ENV),
+        LAZY_LOAD_ENV: parse_flag(environ.get(LAZY_LOAD_ENV)),
+        RELOAD_INTERVAL_ENV: float(environ.get(RELOAD_INTERVAL_ENV, 0)),
+        BATCH_WORKERS_ENV: int(environ.get(BATCH_WORKERS_ENV, DEFAULT_BATCH_WORKERS)),
+        METRICS_DIRECTORY_ENV: environ.get(METRICS_DIRECTORY_ENV),
+        LOAD_TEST_MAX_CONCURRENCY_ENV: int(
+            environ.get(LOAD_TEST_MAX_CONCURRENCY_ENV, DEFAULT_MAX_CONCURRENCY)
+        ),
+        LOAD_TEST_MAX_REQUESTS_ENV: int(
+            environ.get(LOAD_TEST_MAX_REQUESTS_ENV, DEFAULT_MAX_TOTAL_REQUESTS)
+        ),
+        LOAD_TEST_MAX_DURATION_ENV: float(
+            environ.get(LOAD_TEST_MAX_DURATION_ENV, DEFAULT_MAX_DURATION)
+        ),
+    }
+
+
+def build_views(config, logger, background_threads=None):
+    """
+    Loads the thrifts described by config (see load_config) and returns
+    the ThriftExplorerViews serving them
+
+    background_threads: list to add functions starting the background
+        threads to, rather than starting them here
+    """
+    pool_settings = {
+        "max_size": config[POOL_MAX_SIZE_ENV],
+        "idle_timeout": config[POOL_IDLE_TIMEOUT_ENV],
+    }
+    thrift_manager = ThriftManager(
+        config[THRIFT_DIRECTORY_ENV],
+        connection_pool=ConnectionPool(**pool_settings),
+        async_connection_pool=AsyncConnectionPool(**pool_settings),
+        load_workers=config[LOAD_WORKERS_ENV],
+        cache_directory=config[CACHE_DIRECTORY_ENV],
+        lazy=config[LAZY_LOAD_ENV],
+        batch_workers=config[BATCH_WORKERS_ENV],
     )
-    app.config[DEFAULT_TRANSPORT_ENV] = os.environ.get(
-        DEFAULT_TRANSPORT_ENV, "TBufferedTransport"
+    for thrift_file, seconds in sorted(
+        thrift_manager.load_timings.items(), key=lambda timing: -timing[1]
+    ):
+        logger.info("Loaded %s in %.3fs", thrift_file, seconds)
+    logger.info(
+        "Sharing includes between thrifts saved %s parses",
+        thrift_manager.parses_avoided,
+    )
+    if config[RELOAD_INTERVAL_ENV] > 0:
+        start_watcher = _watch_thrift_directory(
+            logger, thrift_manager, config[RELOAD_INTERVAL_ENV]
+        )
+        if background_threads is None:
+            start_watcher()
+        else:
+            background_threads.append(start_watcher)
+    metrics = Metrics(config[METRICS_DIRECTORY_ENV])
+    metrics.add_sampler(pool_sampler("sync", thrift_manager.connection_pool))
+    metrics.add_sampler(pool_sampler("async", thrift_manager.async_connection_pool))
+    return ThriftExplorerViews(
+        thrift_manager,
+        default_protocol=config[DEFAULT_PROTOCOL_ENV],
+        default_transport=config[DEFAULT_TRANSPORT_ENV],
+        logger=logger,
+        metrics=metrics,
+        load_test_limits=LoadTestLimits(
+            max_concurrency=config[LOAD_TEST_MAX_CONCURRENCY_ENV],
+            max_total_requests=config[LOAD_TEST_MAX_REQUESTS_ENV],
+            max_duration=config[LOAD_TEST_MAX_DURATION_ENV],
+        ),
     )
 
-    thrift_manager = ThriftManager(app.config[THRIFT_DIRECTORY_ENV])
-
-    def _add_extension_if_needed(thrift):
-        if not thrift.endswith(".thrift"):
-            thrift = "{}.thrift".format(thrift)
-        return thrift
 
-    def _validate_args(thrift, service=None, method=None):
-        if not thrift_manager.get_thrift(thrift):
-            return "Thrift '{}' not found".format(thrift), 404
-        if service and not thrift_manager.get_service(thrift, service):
-            return "Service '{}' not found".format(service), 404
-        if method and not thrift_manager.get_method(thrift, service, method):
-            return "Method '{}' not found".format(method), 404
-        return None
+def create_app(config=None):
+    """
+    config: settings as returned by load_config, read from the
+        environment by default
+    """
+    app = Flask(__name__)
+    # Flask leaves its logger at WARNING outside debug mode, which would hide
+    # the load times and reloads. A level set elsewhere is left alone
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+    app.config.update(load_config() if config is None else config)
+    app.extensions[_BACKGROUND_THREADS] = []
+    views = build_views(app.config, app.logger, app.extensions[_BACKGROUND_THREADS])
+    if not _threads_after_fork:
+        start_background_threads(app)
+    thrift_manager = views.thrift_manager
 
     @app.route("/", methods=["GET"])
     def list_services():
-        result = []
-        for thrift_file, services in thrift_manager.list_thrift_services().items():
-            for service in services:
-                result.append(
-                    {
-                        "thrift": thrift_file,
-                        "service": service,
-                        "methods": sorted(
-                            thrift_manager.list_methods(thrift_file, service)
-                        ),
-                    }
-                )
-        return (
-            json.dumps(
-                {"thrifts": sorted(result, key=lambda service: service["thrift"])}
-            ),
-            200,
-            JSON_CONTENT_TYPE,
+        return views.list_services(request.headers.get("If-None-Match"))
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return views.metrics_text()
+
+    @app.route("/_admin/reload/", methods=["POST"])
+    def reload_thrifts():
+        return views.reload_thrifts()
+
+    @app.route("/_batch/", methods=["POST"])
+    def batch_requests():
+        batch, error = views.prepare_batch(request.get_json(force=True))
+        if error:
+            return error
+        if wants_ndjson(request.headers.get("Accept")):
+            return views.stream_batch(
+                batch, thrift_manager.iter_requests(batch.thrift_requests)
+            )
+        return views.finish_batch(
+            batch, thrift_manager.make_requests(batch.thrift_requests)
         )
 
     @app.route("/<thrift>/", methods=["GET"])
     def get_thrift_definition(thrift):
-        thrift = _add_extension_if_needed(thrift)
-        error = _validate_args(thrift)
-        if error:
-            return error
-        return thrift_manager.thrift_definition(thrift), 200, TEXT_CONTENT_TYPE
+        return views.thrift_definition(
+            thrift,
+            bundle=parse_flag(request.args.get("bundle")),
+            if_none_match=request.headers.get("If-None-Match"),
+            if_modified_since=request.headers.get("If-Modified-Since"),
+            accept_encoding=request.headers.get("Accept-Encoding"),
+        )
 
     @app.route("/<thrift>/<service>/", methods=["GET"])
     def get_service_info(thrift, service):
-        thrift = _add_extension_if_needed(thrift)
-        error = _validate_args(thrift, service)
-        if error:
-            return error
-        methods = thrift_manager.list_methods(thrift, service)
-        return (
-            json.dumps(
-                {"thrift": thrift, "service": service, "methods": sorted(methods)}
-            ),
-            200,
-            JSON_CONTENT_TYPE,
-        )
+        return views.service_info(thrift, service, request.headers.get("If-None-Match"))
 
     @app.route("/<thrift>/<service>/<method>/", methods=["GET", "POST"])
     def service_method(thrift, service, method):
-        thrift = _add_extension_if_needed(thrift)
-        error = _validate_args(thrift, service, method)
-        method = thrift_manager.get_method(thrift, service, method)
+        if request.method != "POST":
+            return views.method_template(thrift, service, method)
+        call, error = views.prepare_call(
+            thrift, service, method, request.get_json(force=True)
+        )
         if error:
             return error
-        if request.method == "POST":
-            request_json = request.get_json(force=True)
-            errors = []
-            try:
-                thrift_request = ThriftRequest(
-                    thrift_file=thrift,
-                    service_name=service,
-                    endpoint_name=method.name,
-                    host=request_json.get("host"),
-                    port=request_json.get("port"),
-                    protocol=request_json.get(
-                        "protocol", app.config[DEFAULT_PROTOCOL_ENV]
-                    ),
-                    transport=request_json.get(
-                        "transport", app.config[DEFAULT_TRANSPORT_ENV]
-                    ),
-                    request_body=request_json.get("request_body"),
-                )
-                errors = thrift_manager.validate_request(thrift_request)
-            except ValueError as e:
-                errors = [Error(code=ErrorCode.INVALID_REQUEST, message=str(e))]
-            except TypeError as e:
-                errors = [Error(code=ErrorCode.INVALID_REQUEST, message=str(e.args[0]))]
-
-            if errors:
-                return (
-                    json.dumps(
-                        {
-                            "errors": [
-                                attr.asdict(error, recurse=True) for error in errors
-                            ]
-                        },
-                        cls=CommunicationModelEncoder,
-                    ),
-                    400,
-                )
-            else:
-                return (
-                    json.dumps(
-                        attr.asdict(
-                            thrift_manager.make_request(thrift_request), recurse=True
-                        ),
-                        cls=CommunicationModelEncoder,
-                    ),
-                    200,
-                    JSON_CONTENT_TYPE,
-                )
-        else:
-            return (
-                json.dumps(
-                    attr.asdict(
-                        ThriftRequest(
-                            thrift_file=thrift,
-                            service_name=service,
-                            endpoint_name=method.name,
-                            host="<hostname>",
-                            port=9090,
-                            protocol=app.config[DEFAULT_PROTOCOL_ENV],
-                            transport=app.config[DEFAULT_TRANSPORT_ENV],
-                            request_body={},
-                        ),
-                        recurse=True,
-                    ),
-                    cls=CommunicationModelEncoder,
-                ),
-                200,
-                JSON_CONTENT_TYPE,
+        return views.finish_call(call, thrift_manager.make_request(call.thrift_request))
+
+    @app.route("/<thrift>/<service>/<method>/_load_test/", methods=["POST"])
+    def load_test_method(thrift, service, method):
+        thrift_request, settings, error = views.prepare_load_test(
+            thrift, service, method, request.get_json(force=True)
+        )
+        if error:
+            return error
+        if wants_ndjson(request.headers.get("Accept")):
+            return views.stream_load_test(
+                stream_load_test(thrift_manager, thrift_request, settings)
             )
+        return views.finish_load_test(
+            run_load_test(thrift_manager, thrift_request, settings)
+        )
 
     return app
@@ -0,0 +1,99 @@
+"""
+On disk cache of parsed thrift files.
+
+Each entry holds the snapshots (see thrift_snapshot) and service specs for
+one thrift file. Entries are keyed by the path and contents of the file and
+also record a hash of every file it includes, so an entry is only used when
+neither the file nor anything it pulls in has changed since it was written.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import attr
+import thriftpy2
+
+# Bump when the snapshot or spec models change shape
+CACHE_FORMAT_VERSION = 2
+
+
+@attr.s(frozen=True)
+class CacheEntry(object):
+    """
+    A cached thrift file
+        snapshots: dict of thrift file path to snapshot for the file
+            and everything it includes
+        specs: dict[str, ThriftService] for the file (None if it has no services)
+        include_hashes: dict of included thrift file path to the hash
+            of its contents when the entry was written
+    """
+
+    snapshots = attr.ib()
+    specs = attr.ib()
+    include_hashes = attr.ib()
+
+
+def _hash_file(thrift_path):
+    with open(thrift_path, "rb") as infile:
+        return hashlib.sha256(infile.read()).hexdigest()
+
+
+class SpecCache(object):
+    """
+    directory: str
+        Where cache entries are written. Created if it does not exist
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_path(self, thrift_path):
+        key = hashlib.sha256()
+        for part in (
+            str(CACHE_FORMAT_VERSION),
+            getattr(thriftpy2, "__version__", ""),
+            os.path.normpath(thrift_path),
+            _hash_file(thrift_path),
+        ):
+            key.update(part.encode("utf-8"))
+            key.update(b"\0")
+        return os.path.join(self.directory, "{}.pickle".format(key.hexdigest()))
+
+    def get(self, thrift_path):
+        """
+        Returns the CacheEntry for thrift_path or None if there is no
+        entry or something it includes has changed
+        """
+        try:
+            with open(self._entry_path(thrift_path), "rb") as infile:
+                entry = pickle.load(infile)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        for include_path, include_hash in entry.include_hashes.items():
+            try:
+                if _hash_file(include_path) != include_hash:
+                    return None
+            except OSError:
+                return None
+        return entry
+
+    def put(self, thrift_path, snapshots, specs):
+        own_path = os.path.normpath(thrift_path)
+        entry = CacheEntry(
+            snapshots=snapshots,
+            specs=specs,
+            include_hashes={
+                path: _hash_file(path) for path in snapshots if path != own_path
+            },
+        )
+        # Write then rename so other processes never read half an entry
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as outfile:
+                pickle.dump(entry, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._entry_path(thrift_path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
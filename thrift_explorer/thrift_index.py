@@ -0,0 +1,190 @@
+"""
+A cheap index of the services and methods in a directory of thrift files.
+
+Building the index only scans the text of each file for service blocks, it
+does not parse the types involved the way thriftpy2 does, so it is fast
+enough to do for every file at startup even when the full load of each
+file is put off until something asks for it.
+
+Only services and method names are found. Anything more needs the thrift
+loaded for real.
+"""
+import os
+import re
+
+_COMMENTS = re.compile(r"/\*.*?\*/|//[^\n]*|#[^\n]*", re.DOTALL)
+_STRINGS = re.compile(r"\"[^\"]*\"|'[^']*'")
+_INCLUDE = re.compile(r"\binclude\s+\"(\d+)\"")
+_SERVICE = re.compile(r"\bservice\s+(\w+)\s*(?:extends\s+([\w.]+)\s*)?{")
+_METHOD = re.compile(r"(\w+)\s*\(")
+_NOT_METHODS = frozenset(["throws"])
+
+
+def _strip(text):
+    """
+    Returns text without comments and with every string literal swapped
+    for a numbered placeholder (so parens or braces in them cannot confuse
+    the scan) along with the list of the strings (quotes removed)
+    """
+    strings = []
+
+    def _stash(match):
+        strings.append(match.group(0)[1:-1])
+        return '"{}"'.format(len(strings) - 1)
+
+    # Strings go first so a // inside one is not taken for a comment
+    return _COMMENTS.sub(" ", _STRINGS.sub(_stash, text)), strings
+
+
+def _service_body(text, start):
+    depth = 1
+    position = start
+    while depth and position < len(text):
+        if text[position] == "{":
+            depth += 1
+        elif text[position] == "}":
+            depth -= 1
+        position += 1
+    return text[start : position - 1]
+
+
+def _method_names(body):
+    # Method names are the only identifiers directly followed by an open
+    # paren at the top level of a service. Blank out everything inside
+    # parens (arguments and throws lists) and look for those
+    top_level = []
+    depth = 0
+    for character in body:
+        if character == ")":
+            depth -= 1
+        top_level.append(character if depth == 0 else " ")
+        if character == "(":
+            depth += 1
+    return [
+        match.group(1)
+        for match in _METHOD.finditer("".join(top_level))
+        if match.group(1) not in _NOT_METHODS
+    ]
+
+
+class _Scanner(object):
+    def __init__(self):
+        self.files = {}
+
+    def scan(self, thrift_path):
+        """
+        Returns (includes, services) for thrift_path where includes maps
+        include names to paths and services is a list of
+        (service, extends, methods) tuples
+        """
+        thrift_path = os.path.normpath(thrift_path)
+        if thrift_path in self.files:
+            return self.files[thrift_path]
+        with open(thrift_path) as infile:
+            text, strings = _strip(infile.read())
+        includes = {}
+        for match in _INCLUDE.finditer(text):
+            include_path = os.path.join(
+                os.path.dirname(thrift_path), strings[int(match.group(1))]
+            )
+            include_name = os.path.splitext(os.path.basename(include_path))[0]
+            includes[include_name] = include_path
+        services = [
+            (
+                match.group(1),
+                match.group(2),
+                _method_names(_service_body(text, match.end())),
+            )
+            for match in _SERVICE.finditer(text)
+        ]
+        self.files[thrift_path] = (includes, services)
+        return includes, services
+
+    def methods(self, thrift_path, service_name, seen=()):
+        includes, services = self.scan(thrift_path)
+        for name, extends, methods in services:
+            if name != service_name:
+                continue
+            methods = list(methods)
+            if extends and (thrift_path, service_name) not in seen:
+                seen = seen + ((thrift_path, service_name),)
+                if "." in extends:
+                    include_name, extends = extends.rsplit(".", 1)
+                    extends_path = includes.get(include_name)
+                else:
+                    extends_path = thrift_path
+                if extends_path and os.path.exists(extends_path):
+                    methods.extend(self.methods(extends_path, extends, seen))
+            return methods
+        return []
+
+
+def index_thrifts(thrift_paths):
+    """
+    Index the services in each of thrift_paths
+
+    Returns dict[str, dict[str, list[str]]] keyed by thrift file name then
+    service name with the method names of the service, inherited ones
+    included. Like ThriftManager.service_specs thrifts without services
+    are left out
+    """
+    scanner = _Scanner()
+    index = {}
+    for thrift_path in thrift_paths:
+        _, services = scanner.scan(thrift_path)
+        if services:
+            index[os.path.basename(thrift_path)] = {
+                name: scanner.methods(thrift_path, name) for name, _, _ in services
+            }
+    return index
+
+
+class IncludeGraph(object):
+    """
+    Which thrift files include which, found by scanning them. Paths going
+    in can be anything, paths coming out are normalized
+    """
+
+    def __init__(self):
+        self._scanner = _Scanner()
+        self._closures = {}
+
+    def direct(self, thrift_path):
+        """
+        Paths of the thrifts thrift_path includes itself
+        """
+        try:
+            includes, _ = self._scanner.scan(thrift_path)
+        except OSError:
+            # A missing include is for the real load to complain about
+            return []
+        return [os.path.normpath(include) for include in includes.values()]
+
+    def closure(self, thrift_path):
+        """
+        frozenset of the paths of every thrift thrift_path includes,
+        directly or through another include
+        """
+        thrift_path = os.path.normpath(thrift_path)
+        if thrift_path not in self._closures:
+            seen = set()
+            pending = self.direct(thrift_path)
+            while pending:
+                include = pending.pop()
+                if include not in seen:
+                    seen.add(include)
+                    pending.extend(self.direct(include))
+            self._closures[thrift_path] = frozenset(seen)
+        return self._closures[thrift_path]
+
+
+def find_includes(thrift_paths):
+    """
+    Returns dict[str, frozenset[str]] of the normalized path of each of
+    thrift_paths to IncludeGraph.closure of it
+    """
+    graph = IncludeGraph()
+    return {
+        os.path.normpath(thrift_path): graph.closure(thrift_path)
+        for thrift_path in thrift_paths
+    }
@@ -0,0 +1,336 @@
+"""
+Finds and loads the thrift files ThriftManager serves.
+
+Loading can happen serially in this process or be spread over a pool of
+worker processes. Workers parse their thrift files with thriftpy2 and send
+back snapshots (see thrift_snapshot) which are rebuilt into modules here,
+since the modules themselves cannot cross a process boundary.
+
+When given a SpecCache, files that have not changed since they were cached
+are rebuilt from the cache and only the rest get parsed.
+
+Every file is parsed once per load, however many other files include it.
+Thrifts that include the same file share one module for it.
+"""
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import attr
+import thriftpy2
+from thriftpy2.parser import parser as thriftpy2_parser
+
+from thrift_explorer.thrift_index import IncludeGraph
+from thrift_explorer.thrift_parser import parse_service_specs
+from thrift_explorer.thrift_snapshot import (
+    UnsupportedSnapshot,
+    rebuild_module,
+    snapshot_module,
+)
+
+
+@attr.s
+class LoadResult(object):
+    """
+    Everything loading a thrift directory produces
+        thrifts: dict[str, module]
+            thriftpy2 modules keyed by thrift file name
+        thrift_paths: dict[str, str]
+            path to each thrift keyed by thrift file name
+        service_specs: dict[str, dict[str, ThriftService]]
+            see ThriftManager.service_specs
+        timings: dict[str, float]
+            seconds spent loading each thrift keyed by thrift file name
+        cache_hits: int
+            how many thrifts were loaded from the cache
+        parses: int
+            how many files were parsed, includes counted
+        parses_avoided: int
+            how many parses sharing includes between thrifts saved over
+            parsing each thrift and its includes separately
+    """
+
+    thrifts = attr.ib(default=attr.Factory(dict))
+    thrift_paths = attr.ib(default=attr.Factory(dict))
+    service_specs = attr.ib(default=attr.Factory(dict))
+    timings = attr.ib(default=attr.Factory(dict))
+    cache_hits = attr.ib(default=0)
+    parses = attr.ib(default=0)
+    parses_avoided = attr.ib(default=0)
+
+
+# Clearing thriftpy2's cache and parsing happen together under this lock so
+# one thread never clears the cache out from under another one's parse
+_PARSE_LOCK = threading.Lock()
+
+
+@attr.s
+class _ParsedThrift(object):
+    module = attr.ib()
+    snapshots = attr.ib()
+    specs = attr.ib()
+    seconds = attr.ib()
+
+
+def find_thrift_paths(thrift_directory):
+    search_path = os.path.join(thrift_directory, "**/*thrift")
+    return list(glob.iglob(search_path, recursive=True))
+
+
+def _include_cache_key(thrift_path, include_path):
+    # Mirrors the name (and so the parse cache key) thriftpy2 gives a module
+    # when thrift_path includes include_path
+    name = os.path.relpath(include_path, os.path.dirname(thrift_path))
+    name = name.replace(os.sep, ".")
+    if name.endswith(".thrift"):
+        name = name[: -len(".thrift")] + "_thrift"
+    return name
+
+
+class _SharedParser(object):
+    """
+    Parses thrift files so each one is parsed once however many of the
+    others include it. Before a file is parsed everything it includes is
+    parsed (or found already parsed) and put in thriftpy2's parse cache
+    under the name thriftpy2 will look for, so the include statements pick
+    up those modules rather than parsing the files again.
+
+    modules: dict of normalized path to module already loaded some other
+        way (say from an earlier load) to use for includes
+    """
+
+    def __init__(self, graph, modules=None):
+        self._graph = graph
+        self._given = dict(modules or {})
+        self.modules = dict(self._given)
+
+    def parse(self, thrift_path):
+        path = os.path.normpath(thrift_path)
+        if path in self.modules:
+            return self.modules[path]
+        # Marks the file as in progress. Includes that loop back are left
+        # for thriftpy2 to complain about
+        self.modules[path] = None
+        includes = [
+            include for include in self._graph.direct(path) if os.path.exists(include)
+        ]
+        for include in includes:
+            if include not in self.modules:
+                self.parse(include)
+        for include in includes:
+            if self.modules[include] is not None:
+                key = _include_cache_key(path, include)
+                thriftpy2_parser._thrift_cache[key] = self.modules[include]
+        self.modules[path] = thriftpy2.load(thrift_path)
+        return self.modules[path]
+
+    def parse_count(self):
+        """
+        How many files were actually parsed. Counted from the modules
+        themselves so anything thriftpy2 ended up parsing on its own (an
+        include we did not find, say) is counted too
+        """
+        seen = {id(module) for module in self._given.values()}
+        pending = [module for module in self.modules.values() if module is not None]
+        count = 0
+        while pending:
+            module = pending.pop()
+            if id(module) in seen:
+                continue
+            seen.add(id(module))
+            count += 1
+            pending.extend(getattr(module, "__thrift_meta__", {}).get("includes", []))
+        return count
+
+
+def _parse_thrift(parser, thrift_path, keep_module=True, take_snapshot=False):
+    start = time.perf_counter()
+    thrift_filename = os.path.basename(thrift_path)
+    module = parser.parse(thrift_path)
+    specs = parse_service_specs({thrift_filename: module}).get(thrift_filename)
+    snapshots = None
+    if take_snapshot:
+        try:
+            snapshots = snapshot_module(module)
+        except UnsupportedSnapshot:
+            pass
+    return _ParsedThrift(
+        module=module if keep_module else None,
+        snapshots=snapshots,
+        specs=specs,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _forget_parsed_thrifts():
+    # thriftpy2 keeps every module it parses for the life of the process
+    # (included ones keyed just by their relative module name). Left alone
+    # that hands back stale modules once a file changes on disk and can mix
+    # up includes with the same name from different directories.
+    thriftpy2_parser._thrift_cache.clear()
+
+
+def _parse_chunk(thrift_paths, modules=None, keep_modules=True, take_snapshot=False):
+    _forget_parsed_thrifts()
+    parser = _SharedParser(IncludeGraph(), modules)
+    parsed = [
+        _parse_thrift(parser, thrift_path, keep_modules, take_snapshot)
+        for thrift_path in thrift_paths
+    ]
+    return parsed, parser.parse_count()
+
+
+def _parse_chunk_in_worker(thrift_paths):
+    return _parse_chunk(thrift_paths, keep_modules=False, take_snapshot=True)
+
+
+def _chunks(thrift_paths, count, graph):
+    # Thrifts connected by includes go in the same chunk so every file is
+    # parsed by just one worker. A file most things include means one big
+    # chunk, sharing the includes is worth more than spreading that out
+    groups = {}
+    for thrift_path in thrift_paths:
+        members = {os.path.normpath(thrift_path)} | graph.closure(thrift_path)
+        group = [thrift_path]
+        for other in list(groups):
+            if groups[other][0] & members:
+                other_members, other_group = groups.pop(other)
+                members |= other_members
+                group = other_group + group
+        groups[thrift_path] = (members, group)
+    chunks = [[] for _ in range(min(count, len(groups)))]
+    for _, group in sorted(groups.values(), key=lambda entry: -len(entry[1])):
+        min(chunks, key=len).extend(group)
+    return chunks
+
+
+def _parse_all(thrift_paths, workers, take_snapshot, modules=None):
+    """
+    Returns (dict of path to _ParsedThrift, files parsed, parses avoided)
+    where parses avoided is how many more files would have been parsed if
+    each of thrift_paths was parsed along with its includes on its own
+    """
+    graph = IncludeGraph()
+    separate_parses = sum(
+        1 + len(graph.closure(thrift_path)) for thrift_path in thrift_paths
+    )
+    with _PARSE_LOCK:
+        if workers > 1 and len(thrift_paths) > 1:
+            chunks = _chunks(thrift_paths, workers, graph)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_parse_chunk_in_worker, chunks))
+            parsed = {}
+            parses = 0
+            for chunk, (chunk_parsed, chunk_parses) in zip(chunks, results):
+                parsed.update(zip(chunk, chunk_parsed))
+                parses += chunk_parses
+        else:
+            parsed_list, parses = _parse_chunk(
+                thrift_paths, modules, take_snapshot=take_snapshot
+            )
+            parsed = dict(zip(thrift_paths, parsed_list))
+        _forget_parsed_thrifts()
+    return parsed, parses, max(separate_parses - parses, 0)
+
+
+def load_thrift(thrift_path, cache=None, modules=None):
+    """
+    Load a single thrift file. Returns a LoadResult holding just that file
+    (service_specs is empty if it has no services)
+
+    cache: SpecCache
+        Optional cache to load the thrift from if it is unchanged. If it
+        has to be parsed it is written to the cache
+    modules: see load_thrift_paths
+    """
+    return load_thrift_paths([thrift_path], cache=cache, modules=modules)
+
+
+def load_thrifts(thrift_directory, workers=1, cache=None):
+    """
+    Load every thrift file under thrift_directory and returns a LoadResult
+
+    workers: int
+        Number of processes to parse thrift files with. 1 (the default)
+        parses everything in this process
+    cache: SpecCache
+        Optional cache to load unchanged thrifts from. Thrifts that had
+        to be parsed are written to it
+    """
+    return load_thrift_paths(find_thrift_paths(thrift_directory), workers, cache)
+
+
+def load_thrift_paths(thrift_paths, workers=1, cache=None, modules=None):
+    """
+    Load just the thrift files in thrift_paths. See load_thrifts
+
+    modules: dict of normalized path to module
+        Optional modules that were already loaded (by an earlier load say).
+        Thrifts that include one of those files share the module rather
+        than parsing the file again
+    """
+    cached = {}
+    lookup_seconds = {}
+    if cache is not None:
+        for thrift_path in thrift_paths:
+            start = time.perf_counter()
+            entry = cache.get(thrift_path)
+            lookup_seconds[thrift_path] = time.perf_counter() - start
+            if entry:
+                cached[thrift_path] = entry
+
+    result = LoadResult(cache_hits=len(cached))
+    # Everything loaded so far by normalized path. Cached thrifts go first
+    # so the ones that need parsing can share their includes
+    loaded_modules = dict(modules or {})
+    loaded = {}
+    for thrift_path, entry in cached.items():
+        start = time.perf_counter()
+        module = rebuild_module(entry.snapshots, thrift_path, loaded_modules)
+        loaded[thrift_path] = (
+            module,
+            entry.specs,
+            lookup_seconds[thrift_path] + time.perf_counter() - start,
+        )
+
+    to_parse = [
+        thrift_path for thrift_path in thrift_paths if thrift_path not in cached
+    ]
+    parsed, result.parses, result.parses_avoided = _parse_all(
+        to_parse, workers, take_snapshot=cache is not None, modules=loaded_modules
+    )
+    for thrift_path in to_parse:
+        parsed_thrift = parsed[thrift_path]
+        start = time.perf_counter()
+        module = parsed_thrift.module
+        if module is None and parsed_thrift.snapshots is not None:
+            module = rebuild_module(
+                parsed_thrift.snapshots, thrift_path, loaded_modules
+            )
+        elif module is None:
+            # The worker could not describe the module. Parse it again here
+            module = thriftpy2.load(thrift_path)
+        if cache is not None and parsed_thrift.snapshots is not None:
+            cache.put(thrift_path, parsed_thrift.snapshots, parsed_thrift.specs)
+        loaded[thrift_path] = (
+            module,
+            parsed_thrift.specs,
+            lookup_seconds.get(thrift_path, 0)
+            + parsed_thrift.seconds
+            + time.perf_counter()
+            - start,
+        )
+
+    for thrift_path in thrift_paths:
+        thrift_filename = os.path.basename(thrift_path)
+        module, specs, seconds = loaded[thrift_path]
+        result.thrifts[thrift_filename] = module
+        result.thrift_paths[thrift_filename] = thrift_path
+        result.timings[thrift_filename] = seconds
+        if specs:
+            result.service_specs[thrift_filename] = specs
+        else:
+            result.service_specs.pop(thrift_filename, None)
+    return result
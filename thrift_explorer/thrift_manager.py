@@ -1,10 +1,22 @@
+import asyncio
 import datetime
-import glob
 import os
+import threading
+import time
+import warnings
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 
 import thriftpy2
-from thriftpy2 import rpc as thriftpy2_client
+from thriftpy2.contrib.aio.protocol import (
+    TAsyncBinaryProtocolFactory,
+    TAsyncCompactProtocolFactory,
+)
+from thriftpy2.contrib.aio.transport import (
+    TAsyncBufferedTransportFactory,
+    TAsyncFramedTransportFactory,
+)
 from thriftpy2.protocol import (
     TBinaryProtocolFactory,
     TCompactProtocolFactory,
@@ -12,44 +24,64 @@ from thriftpy2.protocol import (
 )
 from thriftpy2.thrift import TException
 
+from thrift_explorer.async_connection_pool import AsyncConnectionPool
+from thrift_explorer.call_plan import (
+    compile_request_translator,
+    find_endpoint_exceptions,
+)
 from thrift_explorer.communication_models import (
+    CallTimings,
     Error,
     ErrorCode,
-    FieldError,
     Protocol,
     ThriftResponse,
     Transport,
 )
+from thrift_explorer.connection_pool import ConnectionPool, PoolKey
+from thrift_explorer.definition_cache import DefinitionCache
+from thrift_explorer.spec_cache import SpecCache
 from thrift_explorer.thrift_parser import parse_service_specs
+from thrift_explorer.thrift_state import build_state, reload_state
+
+DEFAULT_BATCH_WORKERS = 8
+
+# The factories hold no per connection state so one of each is shared
+_PROTOCOL_FACTORIES = {
+    Protocol.BINARY: TBinaryProtocolFactory(),
+    Protocol.JSON: TJSONProtocolFactory(),
+    Protocol.COMPACT: TCompactProtocolFactory(),
+}
+
+_TRANSPORT_FACTORIES = {
+    Transport.BUFFERED: thriftpy2.transport.TBufferedTransportFactory(),
+    Transport.FRAMED: thriftpy2.transport.TFramedTransportFactory(),
+}
 
+# thriftpy2 has no asyncio JSON protocol, make_request_async hands JSON
+# requests to make_request on a thread
+_ASYNC_PROTOCOL_FACTORIES = {
+    Protocol.BINARY: TAsyncBinaryProtocolFactory(),
+    Protocol.COMPACT: TAsyncCompactProtocolFactory(),
+}
 
-def _load_thrifts(thrift_directory):
-    thrifts = {}
-    thrift_paths = {}
-    search_path = os.path.join(thrift_directory, "**/*thrift")
-    for thrift_path in glob.iglob(search_path, recursive=True):
-        thrift_filename = os.path.basename(thrift_path)
-        thrifts[thrift_filename] = thriftpy2.load(thrift_path)
-        thrift_paths[thrift_filename] = thrift_path
-    return thrifts, thrift_paths
+_ASYNC_TRANSPORT_FACTORIES = {
+    Transport.BUFFERED: TAsyncBufferedTransportFactory(),
+    Transport.FRAMED: TAsyncFramedTransportFactory(),
+}
 
 
 def _find_protocol_factory(protocol):
-    if protocol == Protocol.BINARY:
-        return TBinaryProtocolFactory()
-    elif protocol == Protocol.JSON:
-        return TJSONProtocolFactory()
-    elif protocol == Protocol.COMPACT:
-        return TCompactProtocolFactory()
-    raise ValueError("Invalid protocol {}".format(protocol))
+    try:
+        return _PROTOCOL_FACTORIES[protocol]
+    except KeyError:
+        raise ValueError("Invalid protocol {}".format(protocol))
 
 
 def _find_transport_factory(transport):
-    if transport == Transport.BUFFERED:
-        return thriftpy2.transport.TBufferedTransportFactory()
-    elif transport == Transport.FRAMED:
-        return thriftpy2.transport.TFramedTransportFactory()
-    raise ValueError("Invalid transport {}".format(transport))
+    try:
+        return _TRANSPORT_FACTORIES[transport]
+    except KeyError:
+        raise ValueError("Invalid transport {}".format(transport))
 
 
 def translate_request_body(endpoint, request_body, thriftpy2_service_class):
@@ -67,26 +99,16 @@ def translate_request_body(endpoint, request_body, thriftpy2_service_class):
 
     thriftpy2_service_class: the service class from thriftpy2 from module created 
      when thriftpy2 loaded the thrift file
+
+    Deprecated: this compiles the translation again on every call. Use
+    CallPlan.translate_request, which ThriftManager compiles once per endpoint
     """
-    processed_args = {}
-    for arg_spec in endpoint.args:
-        thrift_arg = getattr(
-            thriftpy2_service_class, "{}_args".format(endpoint.name)
-        ).thrift_spec[arg_spec.field_id]
-        try:
-            ttype_code, name, required = thrift_arg
-            type_info = None
-        except ValueError:
-            ttype_code, name, type_info, required = thrift_arg
-        try:
-            processed_args[arg_spec.name] = arg_spec.type_info.format_arg_for_thrift(
-                request_body[arg_spec.name], type_info
-            )
-        except KeyError:
-            # We assume validation happened earlier so if an arg
-            # is missing we assume it is not required
-            continue
-    return processed_args
+    warnings.warn(
+        "translate_request_body is deprecated, use CallPlan.translate_request",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return compile_request_translator(endpoint, thriftpy2_service_class)(request_body)
 
 
 def translate_thrift_response(response):
@@ -117,42 +139,128 @@ def translate_thrift_response(response):
 
 
 def find_request_exceptions(thriftpy2_service, thrift_request):
-    possible_results = getattr(
-        thriftpy2_service, "{}_result".format(thrift_request.endpoint_name)
-    )
-    exceptions = []
-    for result in possible_results.thrift_spec.values():
-        _, _, clazz, _ = result
-        if issubclass(clazz, BaseException):
-            exceptions.append(clazz)
-    return tuple(exceptions)
+    return find_endpoint_exceptions(thriftpy2_service, thrift_request.endpoint_name)
 
 
-def _make_client_call(
-    client, time_after_client, thrift_request, thriftpy2_service, endpoint_spec
-):
-    translated_request_body = translate_request_body(
-        endpoint_spec, thrift_request.request_body, thriftpy2_service
+def _nanoseconds_to_timedelta(nanoseconds):
+    return datetime.timedelta(microseconds=nanoseconds / 1000)
+
+
+def _call_timings(socket, connect_ns, started, translated, received, finished):
+    """
+    CallTimings of a call made over socket, a TimedSocket or
+    TimedAsyncSocket. All times are time.perf_counter_ns(): started is when
+    translating the request began, translated when the call went out,
+    received when the client returned or raised and finished when the
+    response had been translated
+    """
+    sent = socket.sent_at
+    first_read = socket.first_read_at
+    return CallTimings(
+        request_translation_ns=translated - started,
+        connect_ns=connect_ns,
+        # A call that failed while sending or waiting spent the rest of
+        # its time in the phase it failed in
+        send_ns=(received if sent is None else sent) - translated,
+        server_wait_ns=(
+            None
+            if sent is None
+            else (received if first_read is None else first_read) - sent
+        ),
+        receive_ns=None if first_read is None else received - first_read,
+        response_translation_ns=finished - received,
     )
-    time_before_request = datetime.datetime.now()
+
+
+def _call_failure(exception):
+    # Thrift's own exceptions carry a message, others just their str
+    return "Failed to make call: {}".format(getattr(exception, "message", exception))
+
+
+def _make_client_call(connection, connect_ns, thrift_request, plan, pool_hit):
+    started = time.perf_counter_ns()
+    translated_request_body = plan.translate_request(thrift_request.request_body)
+    connection.socket.start_call()
+    translated = time.perf_counter_ns()
     try:
-        response = getattr(client, thrift_request.endpoint_name)(
-            **translated_request_body
-        )
+        try:
+            response = getattr(connection.client, thrift_request.endpoint_name)(
+                **translated_request_body
+            )
+        finally:
+            received = time.perf_counter_ns()
+    except plan.exceptions as exception:
+        status = exception.__class__.__name__
+        response_body = plan.exception_translators.get(
+            exception.__class__, translate_thrift_response
+        )(exception)
+    except Exception as exception:
+        # Declared exceptions leave the connection usable. Anything else (a
+        # transport or protocol error, a reply that would not decode) may
+        # have left half a message on the wire so the connection goes
+        connection.broken = True
+        status = "ServerError"
+        response_body = _call_failure(exception)
+    else:
         status = "Success"
-    except find_request_exceptions(thriftpy2_service, thrift_request) as exception:
+        response_body = plan.translate_success(response)
+    finished = time.perf_counter_ns()
+    return ThriftResponse(
+        status=status,
+        request=thrift_request,
+        data=response_body,
+        time_to_make_request=_nanoseconds_to_timedelta(finished - translated),
+        time_to_connect=_nanoseconds_to_timedelta(connect_ns),
+        pool_hit=pool_hit,
+        timings=_call_timings(
+            connection.socket, connect_ns, started, translated, received, finished
+        ),
+    )
+
+
+async def _make_client_call_async(
+    connection, connect_ns, thrift_request, plan, pool_hit
+):
+    started = time.perf_counter_ns()
+    translated_request_body = plan.translate_request(thrift_request.request_body)
+    connection.socket.start_call()
+    translated = time.perf_counter_ns()
+    try:
+        try:
+            response = await getattr(connection.client, thrift_request.endpoint_name)(
+                **translated_request_body
+            )
+        finally:
+            received = time.perf_counter_ns()
+    except plan.exceptions as exception:
         status = exception.__class__.__name__
-        response = exception
-    except TException as exception:
+        response_body = plan.exception_translators.get(
+            exception.__class__, translate_thrift_response
+        )(exception)
+    except asyncio.TimeoutError:
+        # The aio socket times out reads with asyncio's error rather than
+        # a TTransportException, either way the reply may still turn up
+        connection.broken = True
+        status = "ServerError"
+        response_body = "Failed to make call: timed out"
+    except Exception as exception:
+        connection.broken = True
         status = "ServerError"
-        response = "Failed to make call: {}".format(getattr(exception, "message"))
-    response_body = translate_thrift_response(response)
+        response_body = _call_failure(exception)
+    else:
+        status = "Success"
+        response_body = plan.translate_success(response)
+    finished = time.perf_counter_ns()
     return ThriftResponse(
         status=status,
         request=thrift_request,
         data=response_body,
-        time_to_make_request=datetime.datetime.now() - time_before_request,
-        time_to_connect=time_after_client,
+        time_to_make_request=_nanoseconds_to_timedelta(finished - translated),
+        time_to_connect=_nanoseconds_to_timedelta(connect_ns),
+        pool_hit=pool_hit,
+        timings=_call_timings(
+            connection.socket, connect_ns, started, translated, received, finished
+        ),
     )
 
 
@@ -167,17 +275,123 @@ class ThriftManager(object):
     which has all the useful information you need
 
     I may need to have a good think about that last field.
+
+    self.connection_pool - ConnectionPool - upstream connections reused
+    between calls to make_request
+
+    self.async_connection_pool - AsyncConnectionPool - the same for
+    make_request_async
+
+    self.load_timings - dict[str, float] - seconds it took to load each
+    thrift keyed by thrift file name
+
+    self.parses_avoided - int - how many times a file was not parsed again
+    because another thrift had already parsed it as an include
+
+    load_workers is how many processes to parse the thrifts with. With
+    the default of 1 everything is loaded in this process
+
+    cache_directory is where to keep parsed thrifts between runs (see
+    SpecCache). Without one every thrift is parsed on startup
+
+    batch_workers is how many requests make_requests (or
+    make_requests_async) makes at once
+
+    With lazy set startup only indexes the services and methods in each
+    thrift (see thrift_index). A thrift is fully loaded the first time
+    something looks it up, which makes load_workers moot
     """
 
-    def __init__(self, thrift_directory):
+    def __init__(
+        self,
+        thrift_directory,
+        connection_pool=None,
+        load_workers=1,
+        cache_directory=None,
+        lazy=False,
+        batch_workers=DEFAULT_BATCH_WORKERS,
+        async_connection_pool=None,
+    ):
         self.thrift_directory = thrift_directory
-        self._thrifts, self.thrift_paths = _load_thrifts(self.thrift_directory)
-        self.service_specs = parse_service_specs(self._thrifts)
+        self.connection_pool = connection_pool or ConnectionPool()
+        self.async_connection_pool = async_connection_pool or AsyncConnectionPool()
+        self._batch_workers = batch_workers
+        # Threads are only started as batches need them
+        self._batch_executor = ThreadPoolExecutor(
+            max_workers=batch_workers, thread_name_prefix="thrift-batch"
+        )
+        self._load_workers = load_workers
+        self._reload_lock = threading.Lock()
+        self._definitions = DefinitionCache()
+        # Only ever replaced wholesale, see thrift_state
+        self._state = build_state(
+            thrift_directory,
+            workers=load_workers,
+            cache=SpecCache(cache_directory) if cache_directory else None,
+            lazy=lazy,
+        )
+
+    @property
+    def thrift_paths(self):
+        return self._state.thrift_paths
+
+    @property
+    def service_specs(self):
+        return self._state.service_specs
+
+    @property
+    def load_timings(self):
+        return self._state.load_timings
+
+    @property
+    def parses_avoided(self):
+        return self._state.parses_avoided
+
+    @property
+    def _thrifts(self):
+        return self._state.thrifts
+
+    @property
+    def spec_version(self):
+        """
+        Changes whenever what is known about the thrifts might have, so
+        anything worked out from them can be cached until it does. That is
+        on a reload that found changes, or a lazy load filling in a thrift
+        """
+        state = self._state
+        return state, len(state.thrifts)
+
+    def reload(self):
+        """
+        Pick up any thrifts added, changed or removed since the last load.
+        Returns a ReloadReport. Raises ReloadError (and keeps serving what
+        it had) if a changed thrift cannot be loaded
+        """
+        with self._reload_lock:
+            old_state = self._state
+            self._state, report = reload_state(
+                old_state, self.thrift_directory, workers=self._load_workers
+            )
+        # Pooled connections are keyed by service class, a changed thrift
+        # has new ones and nothing will ask for the old ones again
+        retired = {plan.service for plan in old_state.call_plans.values()} - {
+            plan.service for plan in self._state.call_plans.values()
+        }
+        if retired:
+            self.connection_pool.retire_services(retired)
+            self.async_connection_pool.retire_services(retired)
+        return report
+
+    def _call_plan(self, state, thrift_file, service_name, endpoint_name):
+        # Makes sure the thrift is loaded when loading lazily
+        state.service_specs[thrift_file]
+        return state.call_plans[(thrift_file, service_name, endpoint_name)]
 
     def list_thrift_services(self):
+        index = self._state.index
         results = defaultdict(list)
-        for key in self.service_specs.keys():
-            for service in self.service_specs[key]:
+        for key in list(index.keys()):
+            for service in index[key]:
                 results[key].append(service)
         return results
 
@@ -188,7 +402,7 @@ class ThriftManager(object):
         service = None
         thrift_spec = self.get_thrift(thrift_name)
         if thrift_spec:
-            service = self.service_specs[thrift_name].get(service_name)
+            service = thrift_spec.get(service_name)
         return service
 
     def get_method(self, thrift_name, service_name, method_name):
@@ -199,17 +413,27 @@ class ThriftManager(object):
         return method
 
     def list_methods(self, thrift, service):
-        loaded_thrift = self.service_specs[thrift]
-        loaded_service = loaded_thrift[service]
-        return [key for key in loaded_service.endpoints.keys()]
+        return list(self._state.index[thrift][service])
 
     def thrift_definition(self, thrift):
-        with open(self.thrift_paths[thrift]) as infile:
-            return infile.read()
+        return self.cached_definition(thrift).body.decode("utf-8")
+
+    def cached_definition(self, thrift, bundle=False):
+        """
+        The definition_cache.CachedDefinition of a thrift, or with bundle
+        of the thrift along with everything it includes
+        """
+        state = self._state
+        thrift_path = state.thrift_paths[thrift]
+        if bundle:
+            return self._definitions.bundle(
+                thrift_path, state.includes.get(os.path.normpath(thrift_path), ())
+            )
+        return self._definitions.definition(thrift_path)
 
-    def _thrift_is_loaded(self, thrift_request):
+    def _thrift_is_loaded(self, service_specs, thrift_request):
         try:
-            thrift_spec = self.service_specs[thrift_request.thrift_file]
+            thrift_spec = service_specs[thrift_request.thrift_file]
             return None
         except KeyError:
             return [
@@ -250,54 +474,30 @@ class ThriftManager(object):
             ]
 
     def _validate_request_body(
-        self, thrift_file, service_name, endpoint_name, request_body
+        self, state, thrift_file, service_name, endpoint_name, request_body
     ):
-        validation_errors = []
-        for arg_spec in (
-            self.service_specs[thrift_file][service_name]
-            .endpoints[endpoint_name]
-            .args  # this kind of crap makes me think I need to rethink my structures
-        ):
-            try:
-                error = arg_spec.type_info.validate_arg(request_body[arg_spec.name])
-                if error:
-                    validation_errors.append(
-                        FieldError(
-                            arg_spec=arg_spec,
-                            code=ErrorCode.FIELD_VALIDATION_ERROR,
-                            message=error,
-                        )
-                    )
-            except KeyError:
-                if arg_spec.required:
-                    validation_errors.append(
-                        FieldError(
-                            arg_spec=arg_spec,
-                            code=ErrorCode.REQUIRED_FIELD_MISSING,
-                            message="Required Field '{}' not found".format(
-                                arg_spec.name
-                            ),
-                        )
-                    )
-        return validation_errors
+        plan = self._call_plan(state, thrift_file, service_name, endpoint_name)
+        return plan.validate_request_body(request_body)
 
     def validate_request(self, thrift_request):
+        # Stick to one state even if a reload swaps in another part way through
+        state = self._state
+        service_specs = state.service_specs
         return (
-            self._thrift_is_loaded(thrift_request)
+            self._thrift_is_loaded(service_specs, thrift_request)
             or self._service_in_thrift(
-                self.service_specs[thrift_request.thrift_file],
+                service_specs[thrift_request.thrift_file],
                 thrift_request.service_name,
                 thrift_request.thrift_file,
             )
             or self._endpoint_in_service(
-                self.service_specs[thrift_request.thrift_file][
-                    thrift_request.service_name
-                ],
+                service_specs[thrift_request.thrift_file][thrift_request.service_name],
                 thrift_request.endpoint_name,
                 thrift_request.service_name,
                 thrift_request.thrift_file,
             )
             or self._validate_request_body(
+                state,
                 thrift_request.thrift_file,
                 thrift_request.service_name,
                 thrift_request.endpoint_name,
@@ -305,33 +505,33 @@ class ThriftManager(object):
             )
         )
 
-    def make_request(self, thrift_request):
-        thriftpy2_service = getattr(
-            self._thrifts[thrift_request.thrift_file], thrift_request.service_name
+    def make_request(self, thrift_request, connection_pool=None):
+        """
+        Make thrift_request, which should already be validated, and
+        return its ThriftResponse. connection_pool defaults to
+        self.connection_pool
+        """
+        connection_pool = connection_pool or self.connection_pool
+        plan = self._call_plan(
+            self._state,
+            thrift_request.thrift_file,
+            thrift_request.service_name,
+            thrift_request.endpoint_name,
         )
-        thrift_spec = self.service_specs[thrift_request.thrift_file]
-        endpoint_spec = thrift_spec[thrift_request.service_name].endpoints[
-            thrift_request.endpoint_name
-        ]
-        time_before_client = datetime.datetime.now()
+        pool_key = PoolKey(
+            host=thrift_request.host,
+            port=thrift_request.port,
+            protocol=thrift_request.protocol,
+            transport=thrift_request.transport,
+            service=plan.service,
+        )
+        time_before_client = time.perf_counter_ns()
         try:
-            with thriftpy2_client.client_context(
-                service=thriftpy2_service,
-                host=thrift_request.host,
-                port=thrift_request.port,
-                proto_factory=_find_protocol_factory(thrift_request.protocol),
-                trans_factory=_find_transport_factory(thrift_request.transport),
-                socket_timeout=20000,
-                connect_timeout=3000,
-            ) as client:
-                time_after_client = datetime.datetime.now() - time_before_client
-                return _make_client_call(
-                    client,
-                    time_after_client,
-                    thrift_request,
-                    thriftpy2_service,
-                    endpoint_spec,
-                )
+            connection, pool_hit = connection_pool.checkout(
+                pool_key,
+                _find_protocol_factory(thrift_request.protocol),
+                _find_transport_factory(thrift_request.transport),
+            )
         except TException as exception:
             status = "ConnectionError"
             response = "Failed to make client connection: {}".format(
@@ -343,4 +543,163 @@ class ThriftManager(object):
                 data=response,
                 time_to_make_request=None,
                 time_to_connect=None,
+                pool_hit=False,
+                timings=CallTimings(
+                    connect_ns=time.perf_counter_ns() - time_before_client
+                ),
+            )
+        connect_ns = time.perf_counter_ns() - time_before_client
+        try:
+            return _make_client_call(
+                connection,
+                connect_ns,
+                thrift_request,
+                plan,
+                pool_hit,
             )
+        except BaseException:
+            connection.broken = True
+            raise
+        finally:
+            connection_pool.checkin(pool_key, connection)
+
+    def make_requests(self, thrift_requests):
+        """
+        Make a batch of requests, up to batch_workers of them at a time.
+        Returns their ThriftResponses in the same order as thrift_requests
+
+        Like make_request the requests should already be validated
+        """
+        return list(self._batch_executor.map(self.make_request, thrift_requests))
+
+    def iter_requests(self, thrift_requests):
+        """
+        make_requests that yields (position in thrift_requests, ThriftResponse)
+        as each response comes back. Only batch_workers requests are queued
+        at a time so however long thrift_requests is the responses are not
+        all held at once
+        """
+        requests = enumerate(thrift_requests)
+        positions = {}
+        try:
+            while True:
+                for position, thrift_request in islice(
+                    requests, self._batch_workers - len(positions)
+                ):
+                    future = self._batch_executor.submit(
+                        self.make_request, thrift_request
+                    )
+                    positions[future] = position
+                if not positions:
+                    return
+                done, _ = wait(positions, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield positions.pop(future), future.result()
+        finally:
+            # The caller stopped early, do not make the rest
+            for future in positions:
+                future.cancel()
+
+    async def make_request_async(self, thrift_request):
+        """
+        make_request for asyncio. Binary and compact requests are made over
+        asyncio streams, JSON ones are made by make_request on one of the
+        batch threads
+        """
+        if thrift_request.protocol not in _ASYNC_PROTOCOL_FACTORIES:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._batch_executor, self.make_request, thrift_request
+            )
+        plan = self._call_plan(
+            self._state,
+            thrift_request.thrift_file,
+            thrift_request.service_name,
+            thrift_request.endpoint_name,
+        )
+        pool_key = PoolKey(
+            host=thrift_request.host,
+            port=thrift_request.port,
+            protocol=thrift_request.protocol,
+            transport=thrift_request.transport,
+            service=plan.service,
+        )
+        time_before_client = time.perf_counter_ns()
+        try:
+            connection, pool_hit = await self.async_connection_pool.checkout(
+                pool_key,
+                _ASYNC_PROTOCOL_FACTORIES[thrift_request.protocol],
+                _ASYNC_TRANSPORT_FACTORIES[thrift_request.transport],
+            )
+        except TException as exception:
+            return ThriftResponse(
+                status="ConnectionError",
+                request=thrift_request,
+                data="Failed to make client connection: {}".format(
+                    getattr(exception, "message")
+                ),
+                time_to_make_request=None,
+                time_to_connect=None,
+                pool_hit=False,
+                timings=CallTimings(
+                    connect_ns=time.perf_counter_ns() - time_before_client
+                ),
+            )
+        connect_ns = time.perf_counter_ns() - time_before_client
+        try:
+            return await _make_client_call_async(
+                connection,
+                connect_ns,
+                thrift_request,
+                plan,
+                pool_hit,
+            )
+        except BaseException:
+            # Includes being cancelled part way through a call
+            connection.broken = True
+            raise
+        finally:
+            self.async_connection_pool.checkin(pool_key, connection)
+
+    async def make_requests_async(self, thrift_requests):
+        """
+        make_requests for asyncio, up to batch_workers requests are in
+        flight at a time
+        """
+        semaphore = asyncio.Semaphore(self._batch_workers)
+
+        async def _make_request(thrift_request):
+            async with semaphore:
+                return await self.make_request_async(thrift_request)
+
+        return list(
+            await asyncio.gather(
+                *[_make_request(thrift_request) for thrift_request in thrift_requests]
+            )
+        )
+
+    async def iter_requests_async(self, thrift_requests):
+        """
+        iter_requests for asyncio, up to batch_workers requests are in
+        flight at a time
+        """
+        requests = enumerate(thrift_requests)
+        positions = {}
+        try:
+            while True:
+                for position, thrift_request in islice(
+                    requests, self._batch_workers - len(positions)
+                ):
+                    task = asyncio.ensure_future(
+                        self.make_request_async(thrift_request)
+                    )
+                    positions[task] = position
+                if not positions:
+                    return
+                done, _ = await asyncio.wait(
+                    positions, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield positions.pop(task), task.result()
+        finally:
+            for task in positions:
+                task.cancel()
@@ -1,4 +1,5 @@
 import sys
+import threading
 from abc import ABC, abstractmethod
 
 import attr
@@ -13,6 +14,10 @@ def _validate_basic_type(expected_type, raw_value):
 
 
 class ThriftType(ABC):
+    # Parsed specs are numerous and shared (see thrift_parser), so no
+    # instance dicts for any of them
+    __slots__ = ()
+
     def format_arg_for_thrift(self, raw_arg, thrift_module):
         return raw_arg
 
@@ -21,7 +26,7 @@ class ThriftType(ABC):
         raise NotImplementedError
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class ThriftService(object):
     """
     Container for a thrift service
@@ -38,7 +43,7 @@ class ThriftService(object):
     endpoints = attr.ib()
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class ServiceEndpoint(object):
     """
     Container representing a specific thrift service endpoint
@@ -57,7 +62,7 @@ class ServiceEndpoint(object):
     results = attr.ib()
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class ThriftSpec(object):
     """
     Container for the specification of an argument
@@ -80,14 +85,19 @@ class ThriftSpec(object):
     required = attr.ib()
 
 
-@attr.s(frozen=True)
+# Pairs of structs being compared further up the stack, see TStruct.__eq__
+_COMPARING = threading.local()
+
+
+@attr.s(frozen=True, slots=True, eq=False)
 class TStruct(ThriftType):
     """
     Spec for a particular Struct
     name: str
         Name of the struct
     fields: list[ThriftSpec]
-        Each property of the struct is its own spec
+        Each property of the struct is its own spec. A recursive
+        struct turns up again (the same object) somewhere in its fields
     ttype: str
         Ttype of the object (always 'struct')
     """
@@ -96,6 +106,29 @@ class TStruct(ThriftType):
     fields = attr.ib()
     ttype = attr.ib(default="struct")
 
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        if self is other:
+            return True
+        pairs = getattr(_COMPARING, "pairs", None)
+        if pairs is None:
+            pairs = _COMPARING.pairs = set()
+        pair = (id(self), id(other))
+        if pair in pairs:
+            # A recursive struct that we are already comparing further up.
+            # Its equal unless something else on the way down differs
+            return True
+        pairs.add(pair)
+        try:
+            return (self.name, self.fields, self.ttype) == (
+                other.name,
+                other.fields,
+                other.ttype,
+            )
+        finally:
+            pairs.discard(pair)
+
     def format_arg_for_thrift(self, raw_arg, clazz):
         class_args = {}
         for field in self.fields:
@@ -150,7 +183,7 @@ def _validate_collection(collection_class, raw_arg, value_type):
     return errors if errors else None
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TList(ThriftType):
     """
     Spec for a list or a set type
@@ -170,7 +203,7 @@ class TList(ThriftType):
         return _validate_collection(list, raw_arg, self.value_type)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TSet(ThriftType):
     """
     Spec for a list or a set type
@@ -190,7 +223,7 @@ class TSet(ThriftType):
         return _validate_collection(set, raw_arg, self.value_type)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TMap(ThriftType):
     """
     Spec for a map type
@@ -235,7 +268,7 @@ class TMap(ThriftType):
         return errors if errors else None
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TEnum(ThriftType):
     """
     Enums in thrift are a type that holds
@@ -278,7 +311,7 @@ class TEnum(ThriftType):
             return "Value is not in enum '{}'".format(self.name)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TBool(ThriftType):
     ttype = attr.ib(default="bool")
 
@@ -301,7 +334,7 @@ def _numeric_validation(
             return None
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TByte(ThriftType):
     MIN_VALUE = -128
     MAX_VALUE = 127
@@ -313,7 +346,7 @@ class TByte(ThriftType):
         )
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TI16(ThriftType):
     MIN_VALUE = -32768
     MAX_VALUE = 32767
@@ -325,7 +358,7 @@ class TI16(ThriftType):
         )
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TI32(ThriftType):
     MIN_VALUE = -2147483648
     MAX_VALUE = 2147483647
@@ -337,7 +370,7 @@ class TI32(ThriftType):
         )
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TI64(ThriftType):
     MIN_VALUE = -9223372036854775808
     MAX_VALUE = 9223372036854775807
@@ -349,7 +382,7 @@ class TI64(ThriftType):
         )
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TDouble(ThriftType):
     ttype = attr.ib(default="double")
     # this may bite me some day. sys.float_info implementation dependent.
@@ -365,7 +398,7 @@ class TDouble(ThriftType):
         return _validate_basic_type(float, raw_arg)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TBinary(ThriftType):
     ttype = attr.ib(default="binary")
 
@@ -373,7 +406,7 @@ class TBinary(ThriftType):
         return _validate_basic_type(bytes, raw_arg)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TString(ThriftType):
     ttype = attr.ib(default="string")
 
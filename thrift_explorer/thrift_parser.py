@@ -3,6 +3,7 @@ This module is to hold the funcitonality
 that converts a thirft service given to us by
 thriftpy to our thrift service specification
 """
+import weakref
 from collections import defaultdict
 
 from thriftpy2.thrift import TType
@@ -25,18 +26,25 @@ from thrift_explorer.thrift_models import (
     TStruct,
 )
 
+# Basic types hold nothing but their ttype so one of each does everywhere
 _BASIC_TYPE_MAP = {
-    "string": TString,
-    "i16": TI16,
-    "i32": TI32,
-    "i64": TI64,
-    "byte": TByte,
-    "bool": TBool,
-    "double": TDouble,
+    "string": TString(),
+    "i16": TI16(),
+    "i32": TI32(),
+    "i64": TI64(),
+    "byte": TByte(),
+    "bool": TBool(),
+    "double": TDouble(),
 }
 
+# thriftpy2 struct or enum class to the spec parsed from it. A struct used
+# all over a thrift (or by every thrift including it) is only parsed once
+# and everything referring to it shares the one spec. Entries go with the
+# class, so reloaded thrifts get parsed afresh
+_PARSED_CLASSES = weakref.WeakKeyDictionary()
 
-def _parse_type(type_info):
+
+def _parse_type(type_info, parsing):
     try:
         ttype_code, nested_type_info = type_info
     except TypeError:
@@ -45,31 +53,46 @@ def _parse_type(type_info):
 
     ttype = TType._VALUES_TO_NAMES[ttype_code].lower()
     if nested_type_info is None:
-        return _BASIC_TYPE_MAP[ttype]()
+        return _BASIC_TYPE_MAP[ttype]
     elif ttype == "list":
-        return TList(value_type=_parse_type(nested_type_info))
+        return TList(value_type=_parse_type(nested_type_info, parsing))
     elif ttype == "set":
-        return TSet(value_type=_parse_type(nested_type_info))
+        return TSet(value_type=_parse_type(nested_type_info, parsing))
     elif ttype == "map":
         key, value = nested_type_info
-        return TMap(key_type=_parse_type(key), value_type=_parse_type(value))
-    elif ttype == "struct":
-        return TStruct(
-            name=nested_type_info.__name__,
-            fields=[
-                _parse_arg(field_id, result)
-                for field_id, result in nested_type_info.thrift_spec.items()
-            ],
+        return TMap(
+            key_type=_parse_type(key, parsing), value_type=_parse_type(value, parsing)
+        )
+    parsed = parsing.get(nested_type_info)
+    if parsed is None:
+        parsed = _PARSED_CLASSES.get(nested_type_info)
+    if parsed is None:
+        parsed = _parse_class(ttype, nested_type_info, parsing)
+    return parsed
+
+
+def _parse_class(ttype, thrift_class, parsing):
+    if ttype == "struct":
+        # Structs can contain themselves, directly or through other structs
+        # (tree nodes, linked lists). The struct is registered before its
+        # fields are parsed so references back to it get this same spec and
+        # the parsed specs form a graph with the same cycles as the thrift
+        struct = parsing[thrift_class] = TStruct(name=thrift_class.__name__, fields=[])
+        struct.fields.extend(
+            _parse_arg(field_id, result, parsing)
+            for field_id, result in thrift_class.thrift_spec.items()
         )
+        return struct
     # Its a basic type but has defined nested type info. its probably an enum
-    return TEnum(
-        name=nested_type_info.__name__,
-        names_to_values=nested_type_info._NAMES_TO_VALUES,
-        values_to_names=nested_type_info._VALUES_TO_NAMES,
+    parsing[thrift_class] = TEnum(
+        name=thrift_class.__name__,
+        names_to_values=thrift_class._NAMES_TO_VALUES,
+        values_to_names=thrift_class._VALUES_TO_NAMES,
     )
+    return parsing[thrift_class]
 
 
-def _parse_arg(field_id, thrift_arg):  # Consider renaming?
+def _parse_arg(field_id, thrift_arg, parsing):  # Consider renaming?
     try:
         ttype_code, name, required = thrift_arg
         type_info = None
@@ -78,7 +101,7 @@ def _parse_arg(field_id, thrift_arg):  # Consider renaming?
     return ThriftSpec(
         field_id=field_id,
         name=name,
-        type_info=_parse_type((ttype_code, type_info)),
+        type_info=_parse_type((ttype_code, type_info), parsing),
         required=required,
     )
 
@@ -86,17 +109,23 @@ def _parse_arg(field_id, thrift_arg):  # Consider renaming?
 def _parse_thrift_endpoint(service, endpoint):
     endpoint_args = getattr(service, "{}_args".format(endpoint))
     endpoint_results = getattr(service, "{}_result".format(endpoint))
-    return ServiceEndpoint(
+    # Structs and enums parsed for this endpoint. Only shared once the
+    # whole endpoint parsed, a failure part way through must not leave
+    # half filled in structs behind for others to find
+    parsing = {}
+    parsed = ServiceEndpoint(
         name=endpoint,
         args=[
-            _parse_arg(field_id, arg)
+            _parse_arg(field_id, arg, parsing)
             for field_id, arg in endpoint_args.thrift_spec.items()
         ],
         results=[
-            _parse_arg(field_id, result)
+            _parse_arg(field_id, result, parsing)
             for field_id, result in endpoint_results.thrift_spec.items()
         ],
     )
+    _PARSED_CLASSES.update(parsing)
+    return parsed
 
 
 def _parse_thrift_service(thrift_file, service, endpoints):
@@ -0,0 +1,305 @@
+"""
+Plain data snapshots of the modules thriftpy2 builds from thrift files.
+
+thriftpy2 modules are full of classes generated on the fly so they cannot be
+pickled or handed between processes. Parsing a thrift file is the slow part
+of building one though, creating the classes again from a description of
+them is quick. A snapshot is that description: enums, structs, exceptions
+and services with their thrift_specs, where every reference to a generated
+class is replaced by a ClassRef naming the thrift file and class it came from.
+
+Only what thrift explorer needs to make calls is kept. Constants and
+typedef names are not part of a snapshot.
+"""
+import os
+import types
+from collections import defaultdict
+
+import attr
+from thriftpy2.thrift import TException, TPayload, TType, gen_init
+
+_STRUCT_KINDS = ("structs", "unions", "exceptions")
+
+
+class UnsupportedSnapshot(Exception):
+    """
+    Raised when a module holds something a snapshot cannot describe
+    (for example a default value of a type we dont know about)
+    """
+
+
+@attr.s(frozen=True)
+class ClassRef(object):
+    """
+    Stand in for a generated class inside a snapshot
+        thrift_file: str
+            normalized path of the thrift file the class was defined in
+        name: str
+            name of the class in that file
+    """
+
+    thrift_file = attr.ib()
+    name = attr.ib()
+
+
+@attr.s(frozen=True)
+class StructValue(object):
+    """
+    Stand in for a struct instance used as a default value
+        ref: ClassRef of the struct
+        fields: tuple of (field name, value) pairs
+    """
+
+    ref = attr.ib()
+    fields = attr.ib()
+
+
+def _thrift_file(thing):
+    return os.path.normpath(thing.__thrift_file__)
+
+
+def _class_ref(clazz):
+    return ClassRef(thrift_file=_thrift_file(clazz), name=clazz.__name__)
+
+
+def _encode_type_info(type_info):
+    if isinstance(type_info, type):
+        return _class_ref(type_info)
+    elif isinstance(type_info, tuple):
+        return tuple(_encode_type_info(part) for part in type_info)
+    return type_info
+
+
+def _encode_value(value):
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    elif isinstance(value, TPayload):
+        return StructValue(
+            ref=_class_ref(value.__class__),
+            fields=tuple(
+                (name, _encode_value(field_value))
+                for name, field_value in value.__dict__.items()
+            ),
+        )
+    elif isinstance(value, (list, tuple)):
+        return [_encode_value(item) for item in value]
+    elif isinstance(value, set):
+        return {_encode_value(item) for item in value}
+    elif isinstance(value, dict):
+        return {_encode_value(key): _encode_value(item) for key, item in value.items()}
+    raise UnsupportedSnapshot(
+        "Cannot snapshot value of type {}".format(type(value).__name__)
+    )
+
+
+def _encode_payload(clazz):
+    return (
+        tuple(
+            (field_id, _encode_type_info(spec))
+            for field_id, spec in clazz.thrift_spec.items()
+        ),
+        tuple((name, _encode_value(default)) for name, default in clazz.default_spec),
+    )
+
+
+def _snapshot_service(service):
+    extends = service.__bases__[0]
+    functions = []
+    for function in service.thrift_services:
+        # Inherited functions belong to the snapshot of the parent service
+        if "{}_args".format(function) not in service.__dict__:
+            continue
+        result_class = getattr(service, "{}_result".format(function))
+        functions.append(
+            (
+                function,
+                getattr(result_class, "oneway", False),
+                _encode_payload(getattr(service, "{}_args".format(function))),
+                _encode_payload(result_class),
+            )
+        )
+    return (
+        service.__name__,
+        None if extends is object else _class_ref(extends),
+        tuple(functions),
+    )
+
+
+def _snapshot_single_module(module):
+    meta = getattr(module, "__thrift_meta__", {})
+    return {
+        "thrift_file": _thrift_file(module),
+        "name": module.__name__,
+        "module_name": getattr(module, "__thrift_module_name__", module.__name__),
+        "includes": tuple(
+            (include.__name__, _thrift_file(include))
+            for include in meta.get("includes", [])
+        ),
+        "enums": tuple(
+            (enum.__name__, tuple(enum._NAMES_TO_VALUES.items()))
+            for enum in meta.get("enums", [])
+        ),
+        "structs": tuple(
+            (kind, struct.__name__, _encode_payload(struct))
+            for kind in _STRUCT_KINDS
+            for struct in meta.get(kind, [])
+        ),
+        "services": tuple(
+            _snapshot_service(service) for service in meta.get("services", [])
+        ),
+    }
+
+
+def snapshot_module(module):
+    """
+    Snapshot a module loaded by thriftpy2 along with everything it includes
+
+    Returns a dict of normalized thrift file path to snapshot. Raises
+    UnsupportedSnapshot if the module cannot be described.
+    """
+    snapshots = {}
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        thrift_file = _thrift_file(current)
+        if thrift_file in snapshots:
+            continue
+        snapshots[thrift_file] = _snapshot_single_module(current)
+        pending.extend(getattr(current, "__thrift_meta__", {}).get("includes", []))
+    return snapshots
+
+
+class _Rebuilder(object):
+    def __init__(self, snapshots, modules):
+        self.snapshots = snapshots
+        self.modules = modules
+
+    def _resolve(self, ref):
+        return getattr(self.module(ref.thrift_file), ref.name)
+
+    def _decode_type_info(self, type_info):
+        if isinstance(type_info, ClassRef):
+            return self._resolve(type_info)
+        elif isinstance(type_info, tuple):
+            return tuple(self._decode_type_info(part) for part in type_info)
+        return type_info
+
+    def _decode_value(self, value):
+        if isinstance(value, StructValue):
+            return self._resolve(value.ref)(
+                **{name: self._decode_value(item) for name, item in value.fields}
+            )
+        elif isinstance(value, list):
+            return [self._decode_value(item) for item in value]
+        elif isinstance(value, set):
+            return {self._decode_value(item) for item in value}
+        elif isinstance(value, dict):
+            return {
+                self._decode_value(key): self._decode_value(item)
+                for key, item in value.items()
+            }
+        return value
+
+    def _fill_payload(self, clazz, payload):
+        thrift_spec, default_spec = payload
+        # thriftpy2 keeps default_spec on the class too, which lets a
+        # rebuilt module be snapshotted again
+        clazz.default_spec = [
+            (name, self._decode_value(default)) for name, default in default_spec
+        ]
+        gen_init(
+            clazz,
+            {field_id: self._decode_type_info(spec) for field_id, spec in thrift_spec},
+            clazz.default_spec,
+        )
+
+    def _make_class(self, module, name, bases, **extra):
+        attrs = {
+            "__module__": module.__thrift_module_name__,
+            "__thrift_file__": module.__thrift_file__,
+        }
+        attrs.update(extra)
+        return type(name, bases, attrs)
+
+    def _build_service(self, module, service_snapshot):
+        name, extends_ref, functions = service_snapshot
+        extends = self._resolve(extends_ref) if extends_ref else object
+        service = self._make_class(module, name, (extends,))
+        thrift_services = []
+        for function, oneway, args_payload, result_payload in functions:
+            args_class = self._make_class(
+                module, "{}_args".format(function), (TPayload,), _ttype=TType.STRUCT
+            )
+            self._fill_payload(args_class, args_payload)
+            result_class = self._make_class(
+                module,
+                "{}_result".format(function),
+                (TPayload,),
+                _ttype=TType.STRUCT,
+                oneway=oneway,
+            )
+            self._fill_payload(result_class, result_payload)
+            setattr(service, "{}_args".format(function), args_class)
+            setattr(service, "{}_result".format(function), result_class)
+            thrift_services.append(function)
+        thrift_services.extend(getattr(extends, "thrift_services", []))
+        service.thrift_services = thrift_services
+        return service
+
+    def module(self, thrift_file):
+        if thrift_file in self.modules:
+            return self.modules[thrift_file]
+        snapshot = self.snapshots[thrift_file]
+        module = types.ModuleType(snapshot["name"])
+        module.__thrift_file__ = snapshot["thrift_file"]
+        module.__thrift_module_name__ = snapshot["module_name"]
+        module.__thrift_meta__ = defaultdict(list)
+        # Registered before anything else so includes that loop back resolve
+        self.modules[thrift_file] = module
+
+        for include_name, include_file in snapshot["includes"]:
+            included = self.module(include_file)
+            setattr(module, include_name, included)
+            module.__thrift_meta__["includes"].append(included)
+
+        for name, names_to_values in snapshot["enums"]:
+            enum = self._make_class(module, name, (object,), _ttype=TType.I32)
+            for key, value in names_to_values:
+                setattr(enum, key, value)
+            enum._NAMES_TO_VALUES = dict(names_to_values)
+            enum._VALUES_TO_NAMES = {value: key for key, value in names_to_values}
+            setattr(module, name, enum)
+            module.__thrift_meta__["enums"].append(enum)
+
+        # Create every struct before filling any of them in so structs can
+        # refer to ones defined later in the file (or to themselves)
+        structs = []
+        for kind, name, payload in snapshot["structs"]:
+            base = TException if kind == "exceptions" else TPayload
+            struct = self._make_class(module, name, (base,), _ttype=TType.STRUCT)
+            setattr(module, name, struct)
+            module.__thrift_meta__[kind].append(struct)
+            structs.append((struct, payload))
+        for struct, payload in structs:
+            self._fill_payload(struct, payload)
+
+        for service_snapshot in snapshot["services"]:
+            service = self._build_service(module, service_snapshot)
+            setattr(module, service.__name__, service)
+            module.__thrift_meta__["services"].append(service)
+        return module
+
+
+def rebuild_module(snapshots, thrift_file, modules=None):
+    """
+    Build a thriftpy2 style module for thrift_file out of snapshots
+
+    snapshots: dict of thrift file path to snapshot, it must contain
+        thrift_file and everything it includes
+    modules: optional dict of thrift file path to already rebuilt module.
+        Included modules found in it are reused rather than rebuilt and
+        newly rebuilt modules are added to it
+    """
+    if modules is None:
+        modules = {}
+    return _Rebuilder(snapshots, modules).module(os.path.normpath(thrift_file))
@@ -0,0 +1,289 @@
+"""
+What ThriftManager knows about its thrift directory, and reloading it.
+
+A ThriftState is a snapshot of the directory at one point in time. Rather
+than changing the state it has, ThriftManager builds a new one when the
+directory changes and swaps it in with a single assignment. Anything that
+grabbed the old state (say a request half way through) keeps a consistent
+view of the thrifts and nobody reading a state needs a lock.
+
+Reloading only re-parses the thrifts that changed and the thrifts that
+include them, everything else is carried over from the old state.
+"""
+import os
+import threading
+import time
+from collections.abc import Mapping
+
+import attr
+
+from thrift_explorer.call_plan import compile_call_plans
+from thrift_explorer.thrift_index import find_includes, index_thrifts
+from thrift_explorer.thrift_loader import (
+    find_thrift_paths,
+    load_thrift,
+    load_thrift_paths,
+)
+
+
+class ReloadError(Exception):
+    """
+    Raised when a changed thrift could not be loaded. The state that was
+    being reloaded is still good to use
+    """
+
+
+@attr.s(frozen=True)
+class ReloadReport(object):
+    """
+    What a reload found
+        added, changed, removed: list[str]
+            thrift file names that appeared, were modified or went away
+        reloaded: list[str]
+            thrift file names loaded again. The added and changed
+            thrifts plus any thrift that includes one of them
+        seconds: float
+            how long the reload took
+    """
+
+    added = attr.ib()
+    changed = attr.ib()
+    removed = attr.ib()
+    reloaded = attr.ib()
+    seconds = attr.ib()
+
+
+class _LazyServiceSpecs(Mapping):
+    """
+    Stands in for ThriftState.service_specs when thrifts are loaded lazily.
+    Which thrifts exist comes from the index, looking one up loads it
+    """
+
+    def __init__(self, index, load):
+        self._index = index
+        self._load = load
+
+    def __getitem__(self, thrift_file):
+        if thrift_file not in self._index:
+            raise KeyError(thrift_file)
+        return self._load(thrift_file)
+
+    def __contains__(self, thrift_file):
+        return thrift_file in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _file_stat(thrift_path):
+    stat = os.stat(thrift_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _thrift_file(thrift_path):
+    return os.path.basename(thrift_path)
+
+
+class ThriftState(object):
+    """
+    The thrifts in a directory at one point in time
+        thrift_paths: dict[str, str]
+            path to each thrift keyed by thrift file name
+        file_stats: dict[str, tuple]
+            (mtime, size) of each thrift keyed by normalized path. Used
+            to tell what changed when reloading
+        includes: dict[str, frozenset[str]]
+            see thrift_index.find_includes
+        index: dict[str, dict[str, list[str]]]
+            method names keyed by thrift file name then service name
+        thrifts, service_specs, call_plans, load_timings:
+            see ThriftManager
+        parses, parses_avoided: int
+            see LoadResult, added up over every load into the state
+
+    A lazy state starts out with just the index and loads each thrift into
+    itself the first time it is looked up in service_specs. That only ever
+    adds to the state, nothing already in it changes.
+    """
+
+    def __init__(self, thrift_paths, file_stats, includes, cache=None, lazy=False):
+        self.thrift_paths = thrift_paths
+        self.file_stats = file_stats
+        self.includes = includes
+        self.cache = cache
+        self.lazy = lazy
+        self.index = {}
+        self.thrifts = {}
+        self.call_plans = {}
+        self.load_timings = {}
+        self.parses = 0
+        self.parses_avoided = 0
+        self._loaded_specs = {}
+        self._load_locks = {}
+        if lazy:
+            self.service_specs = _LazyServiceSpecs(self.index, self._load_lazily)
+        else:
+            self.service_specs = {}
+
+    def _known_modules(self):
+        # What has been loaded so far, for later loads to share
+        return {
+            os.path.normpath(self.thrift_paths[thrift_file]): module
+            for thrift_file, module in list(self.thrifts.items())
+            if thrift_file in self.thrift_paths
+        }
+
+    def _add_loaded(self, loaded):
+        self.parses += loaded.parses
+        self.parses_avoided += loaded.parses_avoided
+        self.thrifts.update(loaded.thrifts)
+        self.load_timings.update(loaded.timings)
+        self.call_plans.update(compile_call_plans(loaded.thrifts, loaded.service_specs))
+        for thrift_file in loaded.thrifts:
+            specs = loaded.service_specs.get(thrift_file, {})
+            # Now that we know for sure trust the load over the index
+            if specs or thrift_file in self.index:
+                self.index[thrift_file] = {
+                    service_name: list(service.endpoints)
+                    for service_name, service in specs.items()
+                }
+            if self.lazy:
+                self._loaded_specs[thrift_file] = specs
+            elif specs:
+                self.service_specs[thrift_file] = specs
+
+    def _load_lazily(self, thrift_file):
+        try:
+            return self._loaded_specs[thrift_file]
+        except KeyError:
+            pass
+        with self._load_locks.setdefault(thrift_file, threading.Lock()):
+            # Someone else may have loaded it while we waited for the lock
+            if thrift_file not in self._loaded_specs:
+                self._add_loaded(
+                    load_thrift(
+                        self.thrift_paths[thrift_file],
+                        cache=self.cache,
+                        modules=self._known_modules(),
+                    )
+                )
+        return self._loaded_specs[thrift_file]
+
+    def _populate(self, thrift_paths, workers):
+        if self.lazy:
+            self.index.update(index_thrifts(thrift_paths))
+        elif thrift_paths:
+            self._add_loaded(
+                load_thrift_paths(
+                    thrift_paths, workers, self.cache, modules=self._known_modules()
+                )
+            )
+
+    def _carry_over(self, old_state, thrift_files):
+        for thrift_file in thrift_files:
+            for mine, theirs in (
+                (self.index, old_state.index),
+                (self.thrifts, old_state.thrifts),
+                (self.load_timings, old_state.load_timings),
+                (self._loaded_specs, old_state._loaded_specs),
+            ):
+                if thrift_file in theirs:
+                    mine[thrift_file] = theirs[thrift_file]
+            if not self.lazy and thrift_file in old_state.service_specs:
+                self.service_specs[thrift_file] = old_state.service_specs[thrift_file]
+        self.call_plans.update(
+            (key, plan)
+            for key, plan in old_state.call_plans.items()
+            if key[0] in thrift_files
+        )
+
+
+def build_state(thrift_directory, workers=1, cache=None, lazy=False):
+    """
+    Build the ThriftState for every thrift under thrift_directory
+
+    workers and cache are passed on to thrift_loader.load_thrifts. With
+    lazy set the thrifts are only indexed (see ThriftState)
+    """
+    thrift_paths = find_thrift_paths(thrift_directory)
+    state = ThriftState(
+        thrift_paths={
+            _thrift_file(thrift_path): thrift_path for thrift_path in thrift_paths
+        },
+        file_stats={
+            os.path.normpath(thrift_path): _file_stat(thrift_path)
+            for thrift_path in thrift_paths
+        },
+        includes=find_includes(thrift_paths),
+        cache=cache,
+        lazy=lazy,
+    )
+    state._populate(thrift_paths, workers)
+    return state
+
+
+def reload_state(state, thrift_directory, workers=1):
+    """
+    Look for changes to the thrifts under thrift_directory since state was
+    built. Returns (new state, ReloadReport). When nothing changed the new
+    state is just state
+
+    Raises ReloadError if a thrift that needed loading could not be loaded
+    """
+    start = time.perf_counter()
+    thrift_paths = {
+        os.path.normpath(thrift_path): thrift_path
+        for thrift_path in find_thrift_paths(thrift_directory)
+    }
+    file_stats = {path: _file_stat(path) for path in thrift_paths}
+    added = sorted(path for path in file_stats if path not in state.file_stats)
+    removed = sorted(path for path in state.file_stats if path not in file_stats)
+    changed = sorted(
+        path
+        for path in file_stats
+        if path in state.file_stats and state.file_stats[path] != file_stats[path]
+    )
+    if not (added or removed or changed):
+        return state, ReloadReport([], [], [], [], time.perf_counter() - start)
+
+    includes = find_includes(thrift_paths.values())
+    dirty = set(added + removed + changed)
+    to_reload = sorted(
+        path
+        for path in thrift_paths
+        if path in dirty
+        or dirty & (includes[path] | state.includes.get(path, frozenset()))
+    )
+    new_state = ThriftState(
+        thrift_paths={
+            _thrift_file(thrift_path): thrift_path
+            for thrift_path in thrift_paths.values()
+        },
+        file_stats=file_stats,
+        includes=includes,
+        cache=state.cache,
+        lazy=state.lazy,
+    )
+    reloaded = {_thrift_file(path) for path in to_reload}
+    new_state._carry_over(
+        state, {_thrift_file(path) for path in thrift_paths} - reloaded
+    )
+    try:
+        new_state._populate([thrift_paths[path] for path in to_reload], workers)
+    except Exception as exception:
+        raise ReloadError(
+            "Failed to reload thrifts in {}: {}".format(thrift_directory, exception)
+        ) from exception
+    return (
+        new_state,
+        ReloadReport(
+            added=[_thrift_file(path) for path in added],
+            changed=[_thrift_file(path) for path in changed],
+            removed=[_thrift_file(path) for path in removed],
+            reloaded=sorted(reloaded),
+            seconds=time.perf_counter() - start,
+        ),
+    )
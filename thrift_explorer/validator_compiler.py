@@ -0,0 +1,271 @@
+"""
+Compiles the validate_arg methods in thrift_models into specialized checks.
+
+The validate_arg methods build up error lists and messages as they recurse,
+which costs a lot for large request bodies even when they turn out to be
+valid (the common case). Here each ThriftType is turned into a closure that
+only answers "is this valid?" without allocating anything. Only when that
+answer is no do we fall back to validate_arg to build the error messages,
+so the messages are exactly what they have always been.
+"""
+from thrift_explorer.communication_models import ErrorCode, FieldError
+from thrift_explorer.thrift_models import (
+    TI16,
+    TI32,
+    TI64,
+    TBinary,
+    TBool,
+    TByte,
+    TDouble,
+    TEnum,
+    TList,
+    TMap,
+    TSet,
+    TString,
+    TStruct,
+)
+
+_BASIC_TYPES = {TBool: bool, TBinary: bytes, TString: str}
+_NUMERIC_TYPES = (TByte, TI16, TI32, TI64)
+
+# How deeply dicts, lists and sets may nest in an argument of a recursive
+# type (one that contains itself, like a tree node). Checking, translating
+# and sending those all recurse once per level, so without a limit a deep
+# enough body would run out of stack. thriftpy2 will not write anything
+# nested more than 64 deep, the args struct being one of them, so deeper
+# could never be sent anyway. Other types can only nest as deep as their
+# spec
+MAX_NESTING_DEPTH = 63
+
+
+def _compile_basic_check(expected_type):
+    def check(raw_arg):
+        return isinstance(raw_arg, expected_type)
+
+    return check
+
+
+def _compile_numeric_check(min_value, max_value):
+    def check(raw_arg):
+        return isinstance(raw_arg, int) and min_value <= raw_arg <= max_value
+
+    return check
+
+
+def _check_double(raw_arg):
+    return isinstance(raw_arg, (int, float))
+
+
+def _compile_enum_check(enum_spec):
+    names_to_values = enum_spec.names_to_values
+    values_to_names = enum_spec.values_to_names
+
+    def check(raw_arg):
+        # Mirrors TEnum.validate_arg, falsy values included
+        return bool(names_to_values.get(raw_arg) or values_to_names.get(raw_arg))
+
+    return check
+
+
+def _compile_collection_check(collection_class, value_type, compiled):
+    check_value = compile_check(value_type, compiled)
+
+    def check(raw_arg):
+        if not isinstance(raw_arg, collection_class):
+            return False
+        for value in raw_arg:
+            if not check_value(value):
+                return False
+        return True
+
+    return check
+
+
+def _compile_map_check(map_spec, compiled):
+    check_key = compile_check(map_spec.key_type, compiled)
+    check_value = compile_check(map_spec.value_type, compiled)
+
+    def check(raw_arg):
+        if not isinstance(raw_arg, dict):
+            return False
+        for key, value in raw_arg.items():
+            if not check_key(key) or not check_value(value):
+                return False
+        return True
+
+    return check
+
+
+def _compile_struct_check(struct_spec, compiled):
+    field_checks = ()
+
+    def check(raw_arg):
+        if not isinstance(raw_arg, dict):
+            return False
+        for name, required, check_field in field_checks:
+            if name in raw_arg:
+                if not check_field(raw_arg[name]):
+                    return False
+            elif required:
+                return False
+        return True
+
+    # In before the fields so a recursive struct gets this check back
+    # rather than compiling itself forever
+    compiled[id(struct_spec)] = check
+    field_checks = tuple(
+        (field.name, field.required, compile_check(field.type_info, compiled))
+        for field in struct_spec.fields
+    )
+    return check
+
+
+def compile_check(spec_type, compiled=None):
+    """
+    Returns a function taking a raw value that returns True exactly
+    when spec_type.validate_arg would find no errors with it
+
+    compiled: dict of id of the structs compiled so far to their check,
+        shared by everything compiled together
+    """
+    if compiled is None:
+        compiled = {}
+    spec_class = type(spec_type)
+    if spec_class in _BASIC_TYPES:
+        return _compile_basic_check(_BASIC_TYPES[spec_class])
+    elif isinstance(spec_type, _NUMERIC_TYPES):
+        return _compile_numeric_check(spec_type.MIN_VALUE, spec_type.MAX_VALUE)
+    elif isinstance(spec_type, TDouble):
+        return _check_double
+    elif isinstance(spec_type, TEnum):
+        return _compile_enum_check(spec_type)
+    elif isinstance(spec_type, TList):
+        return _compile_collection_check(list, spec_type.value_type, compiled)
+    elif isinstance(spec_type, TSet):
+        return _compile_collection_check(set, spec_type.value_type, compiled)
+    elif isinstance(spec_type, TMap):
+        return _compile_map_check(spec_type, compiled)
+    elif isinstance(spec_type, TStruct):
+        if id(spec_type) in compiled:
+            return compiled[id(spec_type)]
+        return _compile_struct_check(spec_type, compiled)
+    # Something we dont know how to specialize. Ask the type itself
+    return lambda raw_arg: not spec_type.validate_arg(raw_arg)
+
+
+def _is_recursive(spec_type, expanding, finished):
+    # expanding holds the ids of the structs we are inside, finished the
+    # ones already found not to be recursive so shared structs are only
+    # walked once. type() rather than isinstance as the abc instance checks
+    # cost more than the rest of the walk put together
+    spec_class = type(spec_type)
+    if spec_class is TList or spec_class is TSet:
+        return _is_recursive(spec_type.value_type, expanding, finished)
+    elif spec_class is TMap:
+        return any(
+            _is_recursive(part, expanding, finished)
+            for part in (spec_type.key_type, spec_type.value_type)
+        )
+    elif spec_class is not TStruct or id(spec_type) in finished:
+        return False
+    elif id(spec_type) in expanding:
+        return True
+    expanding.add(id(spec_type))
+    for field in spec_type.fields:
+        if _is_recursive(field.type_info, expanding, finished):
+            return True
+    expanding.discard(id(spec_type))
+    finished.add(id(spec_type))
+    return False
+
+
+def _nested_deeper_than(raw_arg, limit):
+    # Without recursing, so a value too deep to check cannot break this too
+    pending = [(raw_arg, 1)]
+    while pending:
+        value, depth = pending.pop()
+        if isinstance(value, dict):
+            values = value.values()
+        elif isinstance(value, (list, set)):
+            values = value
+        else:
+            continue
+        if depth > limit:
+            return True
+        pending.extend((item, depth + 1) for item in values)
+    return False
+
+
+def _too_deep_errors(recursive_args, request_body):
+    return [
+        FieldError(
+            arg_spec=arg_spec,
+            code=ErrorCode.FIELD_VALIDATION_ERROR,
+            message="Nested more than {} deep".format(MAX_NESTING_DEPTH),
+        )
+        for arg_spec in recursive_args
+        if arg_spec.name in request_body
+        and _nested_deeper_than(request_body[arg_spec.name], MAX_NESTING_DEPTH)
+    ]
+
+
+def _interpret_request_body(arg_specs, request_body):
+    validation_errors = []
+    for arg_spec in arg_specs:
+        try:
+            error = arg_spec.type_info.validate_arg(request_body[arg_spec.name])
+            if error:
+                validation_errors.append(
+                    FieldError(
+                        arg_spec=arg_spec,
+                        code=ErrorCode.FIELD_VALIDATION_ERROR,
+                        message=error,
+                    )
+                )
+        except KeyError:
+            if arg_spec.required:
+                validation_errors.append(
+                    FieldError(
+                        arg_spec=arg_spec,
+                        code=ErrorCode.REQUIRED_FIELD_MISSING,
+                        message="Required Field '{}' not found".format(arg_spec.name),
+                    )
+                )
+    return validation_errors
+
+
+def compile_request_validator(endpoint):
+    """
+    Build a function that validates a request body for the endpoint. It
+    returns a list of FieldErrors, empty when the body is valid
+    """
+    arg_specs = tuple(endpoint.args)
+    compiled = {}
+    arg_checks = tuple(
+        (arg_spec.name, arg_spec.required, compile_check(arg_spec.type_info, compiled))
+        for arg_spec in arg_specs
+    )
+    finished = set()
+    recursive_args = tuple(
+        arg_spec
+        for arg_spec in arg_specs
+        if _is_recursive(arg_spec.type_info, set(), finished)
+    )
+
+    def validate(request_body):
+        if recursive_args:
+            errors = _too_deep_errors(recursive_args, request_body)
+            if errors:
+                return errors
+        for name, required, check in arg_checks:
+            try:
+                if not check(request_body[name]):
+                    break
+            except KeyError:
+                if required:
+                    break
+        else:
+            return []
+        return _interpret_request_body(arg_specs, request_body)
+
+    return validate
@@ -0,0 +1,589 @@
+"""
+What the routes do, without the web framework.
+
+Every view returns a (body, status, headers) tuple which flask can return
+as is and the asgi app (see asgi_server) turns into a response itself.
+
+Calls out to a thrift service are split in two, prepare_* works out what
+to request and finish_* renders the responses, so the flask app can make
+the requests in between with threads and the asgi app with coroutines.
+
+Batches and load tests can instead be streamed as newline delimited JSON
+when the client accepts it (see wants_ndjson). The body is then an
+iterator of lines, one per result as it comes in and a summary line last,
+so nothing is built up in memory however long the run.
+
+The catalog (list_services and service_info) is polled constantly and only
+changes when the thrifts do, so those bodies are built once per
+ThriftManager.spec_version and sent with an ETag. A client sending it back
+in If-None-Match gets a 304 without a body. Thrift definitions are cached
+the same way (see definition_cache), gzipped for clients that take it.
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+from email.utils import formatdate, parsedate_to_datetime
+
+import attr
+
+from thrift_explorer.communication_models import (
+    CommunicationModelEncoder,
+    Error,
+    ErrorCode,
+    ThriftRequest,
+)
+from thrift_explorer.load_test import LoadTestLimits, parse_load_test_settings
+from thrift_explorer.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from thrift_explorer.metrics import Metrics
+from thrift_explorer.thrift_models import TStruct
+from thrift_explorer.thrift_state import ReloadError
+
+JSON_CONTENT_TYPE = {"Content-Type": "application/json; charset=utf-8"}
+TEXT_CONTENT_TYPE = {"Content-Type": "text/plain; charset=utf-8"}
+NDJSON_CONTENT_TYPE = {"Content-Type": "application/x-ndjson; charset=utf-8"}
+
+
+def add_extension_if_needed(thrift):
+    if not thrift.endswith(".thrift"):
+        thrift = "{}.thrift".format(thrift)
+    return thrift
+
+
+def _batch_item_problem(item):
+    """
+    Why a batch item cannot even be built into a request, or None
+    """
+    if not isinstance(item, dict):
+        return "Expected a request object"
+    for name in ("thrift", "service", "method"):
+        if not isinstance(item.get(name), str):
+            return "'{}' must be a string".format(name)
+    return None
+
+
+def _error_dict(value, expanding=()):
+    # attr.asdict(value, recurse=True) except that a struct inside itself
+    # (a recursive type in a FieldError's arg_spec) is only named the second
+    # time rather than expanded again forever
+    if isinstance(value, TStruct):
+        if any(value is struct for struct in expanding):
+            return {"name": value.name, "ttype": value.ttype}
+        expanding += (value,)
+    if attr.has(value.__class__):
+        return {
+            field.name: _error_dict(getattr(value, field.name), expanding)
+            for field in attr.fields(value.__class__)
+        }
+    elif isinstance(value, (list, tuple)):
+        return [_error_dict(item, expanding) for item in value]
+    elif isinstance(value, dict):
+        return {key: _error_dict(item, expanding) for key, item in value.items()}
+    return value
+
+
+def _errors_json(errors):
+    return {"errors": [_error_dict(error) for error in errors]}
+
+
+def _json_response(body, status=200):
+    return (
+        json.dumps(body, cls=CommunicationModelEncoder),
+        status,
+        JSON_CONTENT_TYPE,
+    )
+
+
+def _ndjson_line(body):
+    return json.dumps(body, cls=CommunicationModelEncoder) + "\n"
+
+
+def wants_ndjson(accept):
+    """
+    Whether the Accept header asks for results to be streamed
+    """
+    return "application/x-ndjson" in (accept or "")
+
+
+def parse_flag(value):
+    """
+    Whether a query string or environment variable flag is set
+    """
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match compares weakly, so W/"x" matches "x"
+    return etag in (
+        tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")
+    )
+
+
+def _not_modified(etag, if_none_match, last_modified=None, if_modified_since=None):
+    # If-Modified-Since only counts when there is no If-None-Match
+    if if_none_match:
+        return _etag_matches(if_none_match, etag)
+    if last_modified is None or not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates are to the second
+    return int(last_modified) <= since
+
+
+def _accepts_gzip(accept_encoding):
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.replace(" ", "")
+            try:
+                return not quality.startswith("q=") or float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+@attr.s(frozen=True)
+class _CachedBody(object):
+    body = attr.ib()
+    etag = attr.ib()
+
+    @classmethod
+    def of(cls, body):
+        return cls(
+            body=body,
+            etag='"{}"'.format(hashlib.sha1(body.encode("utf-8")).hexdigest()),
+        )
+
+    def response(self, if_none_match):
+        headers = dict(JSON_CONTENT_TYPE, ETag=self.etag)
+        headers["Cache-Control"] = "no-cache"
+        if _not_modified(self.etag, if_none_match):
+            return "", 304, headers
+        return self.body, 200, headers
+
+
+def errors_response(errors, status=400):
+    return _json_response(_errors_json(errors), status)
+
+
+def invalid_request_response(message):
+    return errors_response([Error(code=ErrorCode.INVALID_REQUEST, message=message)])
+
+
+def log_reload(logger, report):
+    logger.info(
+        "Reloaded %s in %.3fs (added %s, changed %s, removed %s)",
+        report.reloaded,
+        report.seconds,
+        report.added,
+        report.changed,
+        report.removed,
+    )
+
+
+class ThriftExplorerViews(object):
+    """
+    The views shared by the flask and asgi apps
+
+    default_protocol and default_transport fill in requests that do not
+    say which to use. Calls made through the views are counted in metrics,
+    a metrics.Metrics. Load tests asking for more than load_test_limits (a
+    load_test.LoadTestLimits) are refused
+    """
+
+    def __init__(
+        self,
+        thrift_manager,
+        default_protocol,
+        default_transport,
+        logger,
+        metrics=None,
+        load_test_limits=None,
+    ):
+        self.thrift_manager = thrift_manager
+        self.default_protocol = default_protocol
+        self.default_transport = default_transport
+        self.logger = logger
+        self.metrics = metrics or Metrics()
+        self.load_test_limits = load_test_limits or LoadTestLimits()
+        # (spec_version, _CachedBody keyed by what it is for), swapped out
+        # wholesale when the version changes
+        self._cached_bodies = (None, {})
+
+    def _cached_body(self, key, build):
+        """
+        The _CachedBody for key, build() makes the body if it is not
+        cached for the current spec_version
+        """
+        version = self.thrift_manager.spec_version
+        cached_version, bodies = self._cached_bodies
+        if cached_version != version:
+            bodies = {}
+            self._cached_bodies = (version, bodies)
+        if key not in bodies:
+            bodies[key] = _CachedBody.of(build())
+        return bodies[key]
+
+    def _validate_args(self, thrift, service=None, method=None):
+        if not self.thrift_manager.get_thrift(thrift):
+            return "Thrift '{}' not found".format(thrift), 404, TEXT_CONTENT_TYPE
+        if service and not self.thrift_manager.get_service(thrift, service):
+            return "Service '{}' not found".format(service), 404, TEXT_CONTENT_TYPE
+        if method and not self.thrift_manager.get_method(thrift, service, method):
+            return "Method '{}' not found".format(method), 404, TEXT_CONTENT_TYPE
+        return None
+
+    def _build_thrift_request(self, thrift, service, method, request_json):
+        """
+        Returns (ThriftRequest, errors, nanoseconds it took). The request
+        is None if request_json does not describe one at all
+        """
+        started = time.perf_counter_ns()
+        request_body = request_json.get("request_body", {})
+        if not isinstance(request_body, dict):
+            errors = [
+                Error(
+                    code=ErrorCode.INVALID_REQUEST,
+                    message="'request_body' must be an object",
+                )
+            ]
+            return None, errors, time.perf_counter_ns() - started
+        try:
+            thrift_request = ThriftRequest(
+                thrift_file=thrift,
+                service_name=service,
+                endpoint_name=method,
+                host=request_json.get("host"),
+                port=request_json.get("port"),
+                protocol=request_json.get("protocol", self.default_protocol),
+                transport=request_json.get("transport", self.default_transport),
+                request_body=request_body,
+            )
+        except ValueError as e:
+            errors = [Error(code=ErrorCode.INVALID_REQUEST, message=str(e))]
+            return None, errors, time.perf_counter_ns() - started
+        except TypeError as e:
+            errors = [Error(code=ErrorCode.INVALID_REQUEST, message=str(e.args[0]))]
+            return None, errors, time.perf_counter_ns() - started
+        errors = self.thrift_manager.validate_request(thrift_request)
+        return thrift_request, errors, time.perf_counter_ns() - started
+
+    def _services_json(self):
+        result = []
+        for thrift_file, services in self.thrift_manager.list_thrift_services().items():
+            for service in services:
+                result.append(
+                    {
+                        "thrift": thrift_file,
+                        "service": service,
+                        "methods": sorted(
+                            self.thrift_manager.list_methods(thrift_file, service)
+                        ),
+                    }
+                )
+        return json.dumps(
+            {"thrifts": sorted(result, key=lambda service: service["thrift"])}
+        )
+
+    def list_services(self, if_none_match=None):
+        return self._cached_body(None, self._services_json).response(if_none_match)
+
+    def metrics_text(self):
+        return self.metrics.render(), 200, METRICS_CONTENT_TYPE
+
+    def reload_thrifts(self):
+        try:
+            report = self.thrift_manager.reload()
+        except ReloadError as e:
+            return errors_response(
+                [Error(code=ErrorCode.RELOAD_FAILED, message=str(e))], 500
+            )
+        if report.reloaded or report.removed:
+            log_reload(self.logger, report)
+        return json.dumps(attr.asdict(report)), 200, JSON_CONTENT_TYPE
+
+    def thrift_definition(
+        self,
+        thrift,
+        bundle=False,
+        if_none_match=None,
+        if_modified_since=None,
+        accept_encoding=None,
+    ):
+        """
+        The thrift's definition, or with bundle its definition_cache bundle
+        """
+        thrift = add_extension_if_needed(thrift)
+        error = self._validate_args(thrift)
+        if error:
+            return error
+        definition = self.thrift_manager.cached_definition(thrift, bundle=bundle)
+        headers = dict(JSON_CONTENT_TYPE if bundle else TEXT_CONTENT_TYPE)
+        headers["Last-Modified"] = formatdate(definition.last_modified, usegmt=True)
+        headers["Cache-Control"] = "no-cache"
+        headers["Vary"] = "Accept-Encoding"
+        if _accepts_gzip(accept_encoding):
+            body, etag = definition.gzipped, definition.gzip_etag
+            headers["Content-Encoding"] = "gzip"
+        else:
+            body, etag = definition.body, definition.etag
+        headers["ETag"] = etag
+        if _not_modified(
+            etag, if_none_match, definition.last_modified, if_modified_since
+        ):
+            return b"", 304, headers
+        return body, 200, headers
+
+    def service_info(self, thrift, service, if_none_match=None):
+        thrift = add_extension_if_needed(thrift)
+        error = self._validate_args(thrift, service)
+        if error:
+            return error
+
+        def _service_json():
+            methods = self.thrift_manager.list_methods(thrift, service)
+            return json.dumps(
+                {"thrift": thrift, "service": service, "methods": sorted(methods)}
+            )
+
+        return self._cached_body((thrift, service), _service_json).response(
+            if_none_match
+        )
+
+    def method_template(self, thrift, service, method):
+        thrift = add_extension_if_needed(thrift)
+        error = self._validate_args(thrift, service, method)
+        if error:
+            return error
+        method = self.thrift_manager.get_method(thrift, service, method)
+        return _json_response(
+            attr.asdict(
+                ThriftRequest(
+                    thrift_file=thrift,
+                    service_name=service,
+                    endpoint_name=method.name,
+                    host="<hostname>",
+                    port=9090,
+                    protocol=self.default_protocol,
+                    transport=self.default_transport,
+                    request_body={},
+                ),
+                recurse=True,
+            )
+        )
+
+    def prepare_call(self, thrift, service, method, request_json):
+        """
+        Returns (call, None) where call is what to pass to finish_call once
+        call.thrift_request has been made, or (None, response) with what to
+        send back instead
+        """
+        thrift = add_extension_if_needed(thrift)
+        error = self._validate_args(thrift, service, method)
+        if error:
+            return None, error
+        method = self.thrift_manager.get_method(thrift, service, method)
+        thrift_request, errors, validation_ns = self._build_thrift_request(
+            thrift, service, method.name, request_json
+        )
+        if errors:
+            self.metrics.record_invalid(errors, thrift, service, method.name)
+            return None, errors_response(errors)
+        return _Call(thrift_request=thrift_request, validation_ns=validation_ns), None
+
+    def finish_call(self, call, thrift_response):
+        thrift_response = _with_validation(thrift_response, call.validation_ns)
+        response = _json_response(attr.asdict(thrift_response, recurse=True))
+        self.metrics.record_call(thrift_response, len(response[0]))
+        return response
+
+    def _record_invalid_item(self, item, errors):
+        # Only names the server knows become labels
+        names = ("", "", "")
+        if not _batch_item_problem(item):
+            known = (add_extension_if_needed(item["thrift"]), item["service"])
+            if self.thrift_manager.get_method(*known, item["method"]):
+                names = known + (item["method"],)
+        self.metrics.record_invalid(errors, *names)
+
+    def prepare_load_test(self, thrift, service, method, request_json):
+        """
+        prepare_call for a load test. Returns (ThriftRequest,
+        LoadTestSettings, None) when the test can be run, or
+        (None, None, response) with what to send back instead
+        """
+        call, error = self.prepare_call(thrift, service, method, request_json)
+        if error:
+            return None, None, error
+        try:
+            settings = parse_load_test_settings(request_json, self.load_test_limits)
+        except ValueError as e:
+            return None, None, invalid_request_response(str(e))
+        return call.thrift_request, settings, None
+
+    def finish_load_test(self, report):
+        return _json_response(attr.asdict(report, recurse=True))
+
+    def stream_load_test(self, reports):
+        """
+        finish_load_test as newline delimited JSON, reports yields
+        (kind, LoadTestReport) like load_test.stream_load_test and each
+        becomes a {kind: report} line
+        """
+        lines = (
+            _ndjson_line({kind: attr.asdict(report, recurse=True)})
+            for kind, report in reports
+        )
+        return lines, 200, NDJSON_CONTENT_TYPE
+
+    def prepare_batch(self, request_json):
+        """
+        Returns (batch, None) where batch is what to pass to finish_batch
+        once batch.thrift_requests have been made, or (None, response)
+        when request_json is not a batch at all
+        """
+        if not isinstance(request_json, list):
+            return None, invalid_request_response("Expected a list of requests")
+        # Invalid items get their errors in place, the rest are made together
+        batch = _Batch(results=[None] * len(request_json))
+        for position, item in enumerate(request_json):
+            message = _batch_item_problem(item)
+            if message:
+                errors = [Error(code=ErrorCode.INVALID_REQUEST, message=message)]
+            else:
+                thrift_request, errors, validation_ns = self._build_thrift_request(
+                    add_extension_if_needed(item["thrift"]),
+                    item["service"],
+                    item["method"],
+                    item,
+                )
+            if errors:
+                if isinstance(item, dict):
+                    self._record_invalid_item(item, errors)
+                batch.results[position] = _errors_json(errors)
+            else:
+                batch.positions.append(position)
+                batch.thrift_requests.append(thrift_request)
+                batch.validation_ns.append(validation_ns)
+        return batch, None
+
+    def finish_batch(self, batch, thrift_responses):
+        # Each result is rendered on its own so its size can be counted,
+        # the same as json.dumps would render the whole list
+        results = [
+            json.dumps(result, cls=CommunicationModelEncoder)
+            for result in batch.results
+        ]
+        for position, validation_ns, response in zip(
+            batch.positions, batch.validation_ns, thrift_responses
+        ):
+            response = _with_validation(response, validation_ns)
+            results[position] = json.dumps(
+                attr.asdict(response, recurse=True), cls=CommunicationModelEncoder
+            )
+            self.metrics.record_call(response, len(results[position]))
+        return '{{"results": [{}]}}'.format(", ".join(results)), 200, JSON_CONTENT_TYPE
+
+    def stream_batch(self, batch, thrift_responses):
+        """
+        finish_batch as newline delimited JSON, thrift_responses yields
+        (position in batch.thrift_requests, ThriftResponse) in any order
+        like ThriftManager.iter_requests does
+        """
+        stream = BatchStream(batch, self.metrics)
+
+        def _lines():
+            yield from stream.invalid_lines()
+            for index, thrift_response in thrift_responses:
+                yield stream.result_line(index, thrift_response)
+            yield stream.summary_line()
+
+        return _lines(), 200, NDJSON_CONTENT_TYPE
+
+
+def _with_validation(thrift_response, validation_ns):
+    # Requests are validated before ThriftManager makes them
+    return attr.evolve(
+        thrift_response,
+        timings=attr.evolve(thrift_response.timings, validation_ns=validation_ns),
+    )
+
+
+@attr.s(frozen=True)
+class _Call(object):
+    """
+    A call part way through being made
+        thrift_request: the valid request to make
+        validation_ns: how long validating it took
+    """
+
+    thrift_request = attr.ib()
+    validation_ns = attr.ib()
+
+
+@attr.s
+class _Batch(object):
+    """
+    A batch part way through being made
+        results: list with the errors for invalid items, None elsewhere
+        positions: where each of thrift_requests goes in results
+        thrift_requests: the valid requests still to be made
+        validation_ns: how long validating each of thrift_requests took
+    """
+
+    results = attr.ib()
+    positions = attr.ib(default=attr.Factory(list))
+    thrift_requests = attr.ib(default=attr.Factory(list))
+    validation_ns = attr.ib(default=attr.Factory(list))
+
+
+class BatchStream(object):
+    """
+    Renders the lines of a streamed batch. Each item gets a
+    {"position": ..., "result": ...} line, invalid ones first and the rest
+    as they finish, and a {"summary": ...} line comes last. Only counts
+    are kept between lines
+    """
+
+    def __init__(self, batch, metrics):
+        self._batch = batch
+        self._metrics = metrics
+        self._started = time.monotonic()
+        self._invalid = 0
+        self._statuses = Counter()
+
+    def invalid_lines(self):
+        for position, result in enumerate(self._batch.results):
+            if result is not None:
+                self._invalid += 1
+                yield _ndjson_line({"position": position, "result": result})
+
+    def result_line(self, index, thrift_response):
+        thrift_response = _with_validation(
+            thrift_response, self._batch.validation_ns[index]
+        )
+        self._statuses[thrift_response.status] += 1
+        result = json.dumps(
+            attr.asdict(thrift_response, recurse=True), cls=CommunicationModelEncoder
+        )
+        self._metrics.record_call(thrift_response, len(result))
+        return '{{"position": {}, "result": {}}}\n'.format(
+            self._batch.positions[index], result
+        )
+
+    def summary_line(self):
+        return _ndjson_line(
+            {
+                "summary": {
+                    "results": self._invalid + sum(self._statuses.values()),
+                    "invalid": self._invalid,
+                    "statuses": dict(self._statuses),
+                    "seconds": time.monotonic() - self._started,
+                }
+            }
+        )